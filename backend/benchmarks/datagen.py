@@ -0,0 +1,110 @@
+'''
+Synthetic dataset generator
+
+Fills an empty SQLite or Postgres database with categories and questions
+made of words from a fixed vocabulary, so search terms find realistic
+numbers of matches. The same seed always produces the same dataset.
+
+Run from the backend directory:
+    python benchmarks/datagen.py --questions 1000000 --categories 20 \\
+        --database-path postgres://localhost:5432/trivia_bench
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app  # noqa: E402
+from models import db, Question, Category  # noqa: E402
+
+# Rows written per executemany round trip
+BATCH_SIZE = 10000
+
+VOCABULARY = (
+    'actor album animal apollo artist atlas author ball band battle bird '
+    'blood body bone book border bridge canal capital castle cell century '
+    'champion chemical city climate coast color comet composer continent '
+    'country crown dance desert dynasty earth element emperor empire engine '
+    'film flag flower forest fossil fruit galaxy game gene glacier gold '
+    'government hero history island jungle king lake language league '
+    'machine mammal map medal metal moon mountain museum music nation novel '
+    'ocean opera orbit painter painting palace planet player poem poet '
+    'president prize queen record republic river rock science sea ship '
+    'singer soccer song space sport star statue storm sun symphony team '
+    'temple theory title tournament tower treaty tree valley volcano war '
+    'water world writer').split()
+
+
+# Building one question's text and answer from the vocabulary
+def make_question(rng, number):
+    words = rng.sample(VOCABULARY, 6)
+    return {
+        'question': 'Which {} is the {} of the {} {}? ({})'.format(
+            words[0], words[1], words[2], words[3], number),
+        'answer': '{} {}'.format(words[4], words[5]).title()
+    }
+
+
+# Creating categories and questions, in batches, unless the database already
+# holds questions; returns the number of questions in the database
+def generate_dataset(questions, categories, seed=0, batch_size=BATCH_SIZE):
+    existing = Question.query.count()
+    if existing:
+        return existing
+
+    rng = random.Random(seed)
+
+    # Creating any missing categories, then spreading questions over them
+    known = Category.query.count()
+    if known < categories:
+        db.session.execute(Category.__table__.insert(), [
+            {'type': 'Category {}'.format(number)}
+            for number in range(known + 1, categories + 1)])
+        db.session.commit()
+    category_ids = [row[0] for row in db.session.query(
+        Category.id).order_by(Category.id).limit(categories)]
+
+    for start in range(0, questions, batch_size):
+        rows = []
+        for number in range(start, min(start + batch_size, questions)):
+            row = make_question(rng, number)
+            row['category'] = category_ids[number % len(category_ids)]
+            row['difficulty'] = rng.randint(1, 5)
+            rows.append(row)
+        db.session.execute(Question.__table__.insert(), rows)
+        db.session.commit()
+
+    return questions
+
+
+# Returning the database URI to use, defaulting to a temporary SQLite file
+def default_database_path(database_path, name):
+    if database_path:
+        return database_path
+    return 'sqlite:///{}'.format(os.path.join(tempfile.mkdtemp(), name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-path', default=None,
+                        help='database URI (defaults to a temporary SQLite file)')
+    args = parser.parse_args()
+
+    database_path = default_database_path(args.database_path, 'trivia.db')
+    app = create_app({'database_path': database_path,
+                      'instrumentation': False,
+                      'migrate_on_start': True})
+    with app.app_context():
+        total = generate_dataset(args.questions, args.categories, args.seed)
+
+    print('{} questions in {}'.format(total, database_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+'''
+Leaderboard benchmark
+
+Measures how many score submissions, rank lookups and leaderboard reads the
+in-memory leaderboards handle per second with many players, how long a
+batch flush of every new best score to the scores table takes, and the rate
+of POST /quiz/score through the full Flask request handling. Exits with
+status 1 if submissions fall under --min-rate per second.
+
+Run from the backend directory:
+    python benchmarks/leaderboard_benchmark.py --players 100000 --updates 500000
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app  # noqa: E402
+from flaskr.leaderboard import leaderboards  # noqa: E402
+from models import db, Category  # noqa: E402
+
+
+def rate(count, elapsed):
+    return count / elapsed if elapsed else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--players', type=int, default=50000)
+    parser.add_argument('--updates', type=int, default=200000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--lookups', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='POST /quiz/score requests sent through Flask')
+    parser.add_argument('--min-rate', type=float, default=20000,
+                        help='fewest submissions per second accepted')
+    parser.add_argument('--database-path', default=None,
+                        help='database URI (defaults to a temporary SQLite file)')
+    args = parser.parse_args()
+
+    database_path = args.database_path or 'sqlite:///{}'.format(
+        os.path.join(tempfile.mkdtemp(), 'leaderboard_benchmark.db'))
+    app = create_app({'database_path': database_path, 'admission': False,
+                      'instrumentation': False,
+                      'leaderboard': {'flush_interval': 3600}})
+
+    players = ['player-{}'.format(number) for number in range(args.players)]
+    categories = list(range(args.categories + 1))
+    submissions = [(random.choice(categories), random.choice(players),
+                    random.randrange(1000)) for _ in range(args.updates)]
+
+    with app.app_context():
+        db.create_all()
+        if Category.query.count() == 0:
+            db.session.add_all([Category('Category {}'.format(number))
+                                for number in categories[1:]])
+            db.session.commit()
+        leaderboards.load()
+
+        # Submitting scores, as POST /quiz/score does after validation
+        start = time.perf_counter()
+        improved = 0
+        for category, player, score in submissions:
+            improved += leaderboards.submit(category, player, score)[2]
+        submit_elapsed = time.perf_counter() - start
+
+        # Looking up a player's rank and neighbours, and the top 10
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            leaderboards.standings(random.choice(categories), 10,
+                                   random.choice(players))
+        lookup_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            leaderboards.standings(random.choice(categories), 10)
+        top_elapsed = time.perf_counter() - start
+
+        # Writing every new best score in batches
+        start = time.perf_counter()
+        flushed = leaderboards.flush()
+        flush_elapsed = time.perf_counter() - start
+
+    # Submitting through the full request handling
+    client = app.test_client()
+    start = time.perf_counter()
+    for category, player, score in submissions[:args.requests]:
+        client.post('/quiz/score', json={
+            'player': player, 'score': score,
+            'quiz_category': {'type': 'click', 'id': 0} if category == 0
+            else {'type': 'Category {}'.format(category), 'id': category}})
+    request_elapsed = time.perf_counter() - start
+    leaderboards.shutdown()
+
+    submit_rate = rate(args.updates, submit_elapsed)
+    print('{} players, {} categories, {} submissions ({} new bests)'.format(
+        args.players, len(categories), args.updates, improved))
+    print('{:>28} {:>14}'.format('operation', 'per second'))
+    print('{:>28} {:>14.0f}'.format('submit score', submit_rate))
+    print('{:>28} {:>14.0f}'.format('rank and neighbours', rate(
+        args.lookups, lookup_elapsed)))
+    print('{:>28} {:>14.0f}'.format('top 10', rate(args.lookups,
+                                                   top_elapsed)))
+    print('{:>28} {:>14.0f}'.format('POST /quiz/score (Flask)', rate(
+        args.requests, request_elapsed)))
+    print('flushed {} best scores in {:.1f} ms'.format(
+        flushed, flush_elapsed * 1000))
+
+    if submit_rate < args.min_rate:
+        print('Submissions below {:.0f} per second'.format(args.min_rate))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
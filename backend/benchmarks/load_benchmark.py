@@ -0,0 +1,125 @@
+'''
+HTTP load benchmark
+
+Drives running servers with many concurrent clients and reports throughput
+and latency percentiles for each, to compare e.g. the Flask (WSGI) app with
+the async ASGI app under high concurrency.
+
+Start the servers from the backend directory (with admission control off,
+since every simulated client shares one address), e.g.:
+    gunicorn -w 4 -b 127.0.0.1:5000 'flaskr:create_app({"admission": False})'
+    uvicorn flaskr.asgi:app --workers 4 --port 8000
+
+then run:
+    python benchmarks/load_benchmark.py --concurrency 256 --duration 30 \\
+        flask=http://127.0.0.1:5000 asgi=http://127.0.0.1:8000
+'''
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Request mix sent by every client, in turn: (method, path, JSON body)
+REQUEST_MIX = [
+    ('GET', '/questions?page=1', None),
+    ('GET', '/categories/1/questions', None),
+    ('POST', '/quiz', {'previous_questions': [],
+                       'quiz_category': {'type': 'click', 'id': 0}}),
+    ('GET', '/categories', None),
+]
+
+
+# Returning the value below which the given share of sorted samples fall
+def percentile(samples, share):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+# Sending requests over one keep-alive connection until the deadline
+def run_client(base_url, deadline, latencies, errors, lock, request_mix):
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80,
+                                            timeout=30)
+    local_latencies = []
+    local_errors = 0
+    turn = 0
+
+    while time.perf_counter() < deadline:
+        method, path, body = request_mix[turn % len(request_mix)]
+        turn += 1
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                local_errors += 1
+            else:
+                local_latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(
+                url.hostname, url.port or 80, timeout=30)
+
+    connection.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def run_target(base_url, concurrency, duration, request_mix=REQUEST_MIX):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    deadline = start + duration
+    clients = [threading.Thread(target=run_client,
+                                args=(base_url, deadline, latencies, errors,
+                                      lock, request_mix))
+               for _ in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('targets', nargs='+', metavar='NAME=URL',
+                        help='servers to benchmark, e.g. flask=http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=128)
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    print('{:>10} {:>10} {:>8} {:>10} {:>9} {:>9} {:>9}'.format(
+        'target', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms'))
+    for target in args.targets:
+        name, base_url = target.split('=', 1)
+        result = run_target(base_url, args.concurrency, args.duration)
+        print('{:>10} {requests:>10} {errors:>8} {throughput:>10.1f} '
+              '{p50_ms:>9.2f} {p95_ms:>9.2f} {p99_ms:>9.2f}'.format(
+                  name, **result))
+
+
+if __name__ == '__main__':
+    main()
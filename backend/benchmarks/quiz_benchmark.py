@@ -0,0 +1,105 @@
+'''
+Quiz turn benchmark
+
+Compares per-turn latency of POST /quiz question selection as a quiz gets
+longer: the original approach (NOT IN query loading every remaining row)
+against the in-memory quiz question pool.
+
+Run from the backend directory:
+    python benchmarks/quiz_benchmark.py --questions 50000 --categories 6
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app  # noqa: E402
+from flaskr.quiz_pool import quiz_pool  # noqa: E402
+from models import db, Question  # noqa: E402
+
+QUIZ_LENGTHS = [0, 10, 100, 1000, 5000]
+
+
+# Filling an empty database with synthetic questions spread over categories
+def generate_questions(questions, categories):
+    db.create_all()
+    db.session.execute(Question.__table__.insert(), [
+        {'question': 'Synthetic question {}?'.format(i),
+         'answer': 'Answer {}'.format(i),
+         'category': str(i % categories + 1),
+         'difficulty': i % 5 + 1}
+        for i in range(questions)])
+    db.session.commit()
+
+
+# Original play_quiz selection, kept here as the baseline
+def legacy_choose(category, previous_questions):
+    available_questions = Question.query.filter_by(
+        category=category).filter(
+        Question.id.notin_(previous_questions)).all()
+    return available_questions[random.randrange(
+        0, len(available_questions))] if available_questions else None
+
+
+def pool_choose(category, previous_questions):
+    return quiz_pool.choose(category, previous_questions)
+
+
+# Timing one quiz turn for each quiz length, averaged over several turns
+def time_turns(choose, category, category_ids, turns):
+    results = []
+    for length in QUIZ_LENGTHS:
+        if length >= len(category_ids):
+            break
+
+        previous_questions = random.sample(category_ids, length)
+        start = time.perf_counter()
+        for _ in range(turns):
+            choose(category, previous_questions)
+        results.append((length, (time.perf_counter() - start) / turns))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--database-path', default=None,
+                        help='database URI (defaults to a temporary SQLite file)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    database_path = args.database_path or 'sqlite:///{}'.format(
+        os.path.join(tmpdir, 'quiz_benchmark.db'))
+
+    app = create_app({'database_path': database_path})
+    with app.app_context():
+        if Question.query.count() == 0:
+            generate_questions(args.questions, args.categories)
+
+        category = 1
+        category_ids = [row[0] for row in db.session.query(
+            Question.id).filter(Question.category == str(category))]
+
+        legacy = time_turns(legacy_choose, str(category), category_ids,
+                            args.turns)
+        # Building the pool up front so its one-off load is not timed
+        quiz_pool.load()
+        pool = time_turns(pool_choose, category, category_ids, args.turns)
+
+    print('{} questions in category {} ({} total)'.format(
+        len(category_ids), category, args.questions))
+    print('{:>12} {:>14} {:>14}'.format('quiz length', 'NOT IN (ms)',
+                                        'pool (ms)'))
+    for (length, legacy_time), (_, pool_time) in zip(legacy, pool):
+        print('{:>12} {:>14.3f} {:>14.3f}'.format(
+            length, legacy_time * 1000, pool_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''
+Quiz selection benchmark
+
+Compares per-turn latency of choosing a quiz question ID as a quiz gets
+longer: the original NOT IN query against each quiz selection strategy, and
+times recording answers (one O(log n) re-weighting each).
+
+Run from the backend directory:
+    python benchmarks/selection_benchmark.py --questions 50000 --categories 6
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app  # noqa: E402
+from flaskr.quiz_pool import quiz_pool  # noqa: E402
+from flaskr.quiz_selection import STRATEGIES, quiz_selector  # noqa: E402
+from models import db, Question  # noqa: E402
+from quiz_benchmark import QUIZ_LENGTHS, generate_questions  # noqa: E402
+
+
+# Original play_quiz selection, kept here as the baseline (IDs only, so the
+# comparison is of selection alone)
+def legacy_choose_id(category, previous_questions):
+    available_ids = [row[0] for row in db.session.query(Question.id).filter(
+        Question.category == str(category)).filter(
+        Question.id.notin_(previous_questions))]
+    return random.choice(available_ids) if available_ids else None
+
+
+# Timing one quiz turn for each quiz length, averaged over several turns
+def time_turns(choose_id, category, category_ids, turns):
+    results = []
+    for length in QUIZ_LENGTHS:
+        if length >= len(category_ids):
+            break
+
+        previous_questions = random.sample(category_ids, length)
+        start = time.perf_counter()
+        for _ in range(turns):
+            choose_id(category, previous_questions)
+        results.append((length, (time.perf_counter() - start) / turns))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--answers', type=int, default=10000,
+                        help='number of answers recorded in memory')
+    parser.add_argument('--database-path', default=None,
+                        help='database URI (defaults to a temporary SQLite file)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    database_path = args.database_path or 'sqlite:///{}'.format(
+        os.path.join(tmpdir, 'selection_benchmark.db'))
+
+    app = create_app({'database_path': database_path})
+    with app.app_context():
+        db.create_all()
+        if Question.query.count() == 0:
+            generate_questions(args.questions, args.categories)
+
+        category = 1
+        category_ids = [row[0] for row in db.session.query(
+            Question.id).filter(Question.category == str(category))]
+
+        # Building the pools up front so their one-off load is not timed
+        start = time.perf_counter()
+        quiz_selector.load()
+        load_time = time.perf_counter() - start
+        quiz_pool.load()
+
+        # Recording answers in memory only, the way POST /quiz/answer does
+        # after storing each one
+        start = time.perf_counter()
+        for _ in range(args.answers):
+            quiz_selector.record_answer(random.choice(category_ids),
+                                        random.random() < 0.7)
+        answer_time = (time.perf_counter() - start) / max(args.answers, 1)
+
+        results = [('NOT IN', time_turns(
+            legacy_choose_id, category, category_ids, max(args.turns // 10,
+                                                          1)))]
+        for strategy in STRATEGIES:
+            results.append((strategy, time_turns(
+                lambda category, previous, strategy=strategy:
+                quiz_selector.choose_id(strategy, category, previous),
+                category, category_ids, args.turns)))
+
+    print('{} questions in category {} ({} total)'.format(
+        len(category_ids), category, args.questions))
+    print('selector load: {:.1f} ms, record answer: {:.2f} us'.format(
+        load_time * 1000, answer_time * 1000000))
+    print(('{:>12}' + ' {:>16}' * len(results)).format(
+        'quiz length', *['{} (ms)'.format(name) for name, _ in results]))
+    for row in zip(*[timings for _, timings in results]):
+        print(('{:>12}' + ' {:>16.4f}' * len(row)).format(
+            row[0][0], *[timing * 1000 for _, timing in row]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Startup benchmark
+
+Measures how long a fresh worker process takes to import the app, build it
+with create_app() and serve its first request, with lazy database
+initialization (the default) and with migrations run on start.
+
+Run from the backend directory:
+    python benchmarks/startup_benchmark.py --runs 20
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from datagen import default_database_path  # noqa: E402
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Timed in a new interpreter each run, so imports are not already cached
+WORKER = '''
+import json, sys, time
+start = time.perf_counter()
+from flaskr import create_app
+imported = time.perf_counter()
+app = create_app(json.loads(sys.argv[1]))
+created = time.perf_counter()
+app.test_client().get('/categories')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': served - created}))
+'''
+
+
+def run_worker(config):
+    output = subprocess.check_output(
+        [sys.executable, '-c', WORKER, json.dumps(config)], cwd=BACKEND)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-path', default=None,
+                        help='database URI (defaults to a temporary SQLite file)')
+    args = parser.parse_args()
+
+    database_path = default_database_path(args.database_path, 'startup.db')
+    modes = [
+        ('lazy', {'database_path': database_path}),
+        ('migrate on start', {'database_path': database_path,
+                              'migrate_on_start': True}),
+    ]
+
+    # Bringing the schema up to date once, so every run finds it current
+    run_worker(modes[1][1])
+
+    print('{:>18} {:>12} {:>16} {:>18} {:>12}'.format(
+        'mode', 'import (ms)', 'create_app (ms)', 'first request (ms)',
+        'total (ms)'))
+    for name, config in modes:
+        runs = [run_worker(config) for _ in range(args.runs)]
+        medians = {step: statistics.median(run[step] for run in runs) * 1000
+                   for step in ('import', 'create_app', 'first_request')}
+        print('{:>18} {:>12.1f} {:>16.1f} {:>18.1f} {:>12.1f}'.format(
+            name, medians['import'], medians['create_app'],
+            medians['first_request'], sum(medians.values())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+'''
+Endpoint benchmark suite
+
+Fills a database with a synthetic dataset (see datagen.py), then times every
+route through the Flask test client (latency percentiles, throughput and
+peak Python memory per request) and through a multi-threaded HTTP load
+driver against a local server. Results are written as JSON, and can be
+compared against an earlier run to catch regressions.
+
+Run from the backend directory:
+    python benchmarks/suite.py --questions 100000 --output results.json
+    python benchmarks/suite.py --questions 100000 --compare results.json
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+from flaskr import create_app, QUESTIONS_PER_PAGE  # noqa: E402
+from models import db, Question, Category  # noqa: E402
+from datagen import VOCABULARY, default_database_path, \
+    generate_dataset  # noqa: E402
+from load_benchmark import percentile, run_target  # noqa: E402
+
+# Quiz lengths (number of previous questions) timed for play_quiz
+QUIZ_LENGTHS = [0, 10, 100, 1000]
+# Requests traced with tracemalloc per scenario to measure peak memory
+MEMORY_SAMPLES = 5
+
+
+# SCENARIOS
+# -----------------------------------------------------------------------------
+# Each scenario builds (method, path, JSON body) requests from the dataset;
+# writes create the questions that delete_question removes afterwards
+class Scenarios:
+
+    def __init__(self, rng, question_ids, category_ids):
+        self.rng = rng
+        self.question_ids = question_ids
+        self.category_ids = category_ids
+        self.created_ids = []
+
+    def get_questions(self):
+        pages = max(1, len(self.question_ids) // QUESTIONS_PER_PAGE)
+        return 'GET', '/questions?page={}'.format(
+            self.rng.randint(1, pages)), None
+
+    def get_category_questions(self):
+        return 'GET', '/categories/{}/questions'.format(
+            self.rng.choice(self.category_ids)), None
+
+    def search_questions(self):
+        return 'POST', '/questions/search', {
+            'searchTerm': self.rng.choice(VOCABULARY)}
+
+    def play_quiz(self, length):
+        category = self.rng.choice(self.category_ids)
+        previous = self.rng.sample(
+            self.question_ids, min(length, len(self.question_ids)))
+        return 'POST', '/quiz', {
+            'previous_questions': previous,
+            'quiz_category': {'type': 'Category', 'id': category}}
+
+    def create_question(self):
+        return 'POST', '/questions', {
+            'question': 'Benchmark question {}?'.format(
+                self.rng.random()),
+            'answer': 'Benchmark answer',
+            'difficulty': self.rng.randint(1, 5),
+            'category': self.rng.choice(self.category_ids)}
+
+    def delete_question(self):
+        return 'DELETE', '/questions/{}'.format(
+            self.created_ids.pop()), None
+
+    # Listing (name, request builder) pairs in the order they are run
+    def all(self):
+        scenarios = [
+            ('get_questions', self.get_questions),
+            ('get_category_questions', self.get_category_questions),
+            ('search_questions', self.search_questions),
+        ]
+        scenarios += [('play_quiz[{}]'.format(length),
+                       lambda length=length: self.play_quiz(length))
+                      for length in QUIZ_LENGTHS]
+        scenarios += [
+            ('create_question', self.create_question),
+            ('delete_question', self.delete_question),
+        ]
+        return scenarios
+
+
+def send(client, method, path, body):
+    return client.open(path, method=method, json=body)
+
+
+# Timing one scenario through the Flask test client
+def run_scenario(client, name, build, requests, scenarios):
+    latencies = []
+    errors = 0
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        method, path, body = build()
+        request_start = time.perf_counter()
+        response = send(client, method, path, body)
+        latencies.append(time.perf_counter() - request_start)
+
+        if response.status_code >= 500:
+            errors += 1
+        elif name == 'create_question' and response.status_code == 200:
+            scenarios.created_ids.append(response.get_json()['created'])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': requests / elapsed,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+# Measuring the peak Python memory allocated while serving a few requests
+def measure_memory(client, build):
+    tracemalloc.start()
+    try:
+        for _ in range(MEMORY_SAMPLES):
+            send(client, *build())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+
+# Serving the app on a local port from a background thread
+def start_server(app):
+    # Keeping the per-request access log out of the results
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+# Running the read and quiz scenarios under concurrent HTTP load
+def run_http(base_url, scenarios, concurrency, duration):
+    results = {}
+    for name, build in scenarios.all():
+        if name in ('create_question', 'delete_question'):
+            continue
+        request_mix = [build() for _ in range(100)]
+        results[name] = run_target(base_url, concurrency, duration,
+                                   request_mix)
+    return results
+
+
+# Printing p95 changes against a baseline run; returns the regressed
+# scenarios
+def compare(results, baseline, tolerance):
+    regressions = []
+    print('{:>40} {:>12} {:>12} {:>8}'.format(
+        'scenario', 'base p95', 'p95', 'change'))
+    for mode in ('test_client', 'http'):
+        for name, result in sorted(results.get(mode, {}).items()):
+            base = baseline.get(mode, {}).get(name)
+            if base is None or not base['p95_ms']:
+                continue
+            change = result['p95_ms'] / base['p95_ms'] - 1
+            label = '{}:{}'.format(mode, name)
+            print('{:>40} {:>12.2f} {:>12.2f} {:>7.0%}'.format(
+                label, base['p95_ms'], result['p95_ms'], change))
+            if change > tolerance:
+                regressions.append(label)
+    return regressions
+
+
+def print_results(title, results):
+    print(title)
+    print('{:>24} {:>9} {:>7} {:>10} {:>9} {:>9} {:>9} {:>10}'.format(
+        'scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms', 'peak KiB'))
+    for name, result in results.items():
+        print('{:>24} {requests:>9} {errors:>7} {throughput:>10.1f} '
+              '{p50_ms:>9.2f} {p95_ms:>9.2f} {p99_ms:>9.2f} {:>10}'.format(
+                  name, result.get('peak_memory_kb', '-'), **result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per scenario through the test client')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='HTTP load driver threads (0 skips the HTTP run)')
+    parser.add_argument('--duration', type=float, default=5,
+                        help='seconds of HTTP load per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-response-cache', action='store_true',
+                        help='time the database path of every read')
+    parser.add_argument('--database-path', default=None,
+                        help='database URI (defaults to a temporary SQLite file)')
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON results to')
+    parser.add_argument('--compare', default=None,
+                        help='earlier JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='p95 slowdown reported as a regression')
+    args = parser.parse_args()
+
+    database_path = default_database_path(args.database_path, 'bench.db')
+    app = create_app({
+        'database_path': database_path,
+        'instrumentation': False,
+        'migrate_on_start': True,
+        # Every request comes from one client, which rate limits would throttle
+        'admission': False,
+        'response_cache': False if args.no_response_cache else None})
+    with app.app_context():
+        generate_dataset(args.questions, args.categories, args.seed)
+        question_ids = [row[0] for row in db.session.query(Question.id)]
+        category_ids = [row[0] for row in db.session.query(Category.id)]
+        dialect = db.engine.dialect.name
+
+    rng = random.Random(args.seed)
+    scenarios = Scenarios(rng, question_ids, category_ids)
+    client = app.test_client()
+
+    # Timing every scenario through the test client
+    results = {'test_client': {}, 'http': {}}
+    for name, build in scenarios.all():
+        results['test_client'][name] = run_scenario(
+            client, name, build, args.requests, scenarios)
+        if name not in ('create_question', 'delete_question'):
+            results['test_client'][name]['peak_memory_kb'] = \
+                measure_memory(client, build)
+
+    # Timing read and quiz scenarios under concurrent load
+    if args.concurrency:
+        server, base_url = start_server(app)
+        try:
+            results['http'] = run_http(base_url, scenarios,
+                                       args.concurrency, args.duration)
+        finally:
+            server.shutdown()
+
+    results['meta'] = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'dialect': dialect,
+        'questions': len(question_ids),
+        'categories': len(category_ids),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'seed': args.seed,
+        'response_cache': not args.no_response_cache,
+        # ru_maxrss is reported in KiB on Linux
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+    print_results('Test client', results['test_client'])
+    if results['http']:
+        print_results('HTTP ({} threads)'.format(args.concurrency),
+                      results['http'])
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  args.tolerance)
+        if regressions:
+            print('Regressions: {}'.format(', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
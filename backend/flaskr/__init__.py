@@ -1,32 +1,118 @@
 import os
-from flask import Flask, request, abort, jsonify
+import base64
+import binascii
+import math
+import click
+from flask import Flask, request, abort, jsonify, Response, g, url_for, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+from sqlalchemy import func
 
-from models import setup_db, Question, Category
+from models import setup_db, upgrade_db, database_path, db, pool_status, \
+    replica_bind, Question, Category, Answer
+from .admission import BUSY_RETRY_AFTER, make_admission
+from .bulk import ImportFailed, export_questions, import_questions, \
+    parse_csv, parse_ndjson
+from .category_cache import category_cache, CATEGORY_CACHE_TTL
+from .compression import make_compression
+from .decks import DECK_STRATEGY, build_decks, quiz_decks
+from .duplicates import DEDUPE_MODES, REJECT, WARN, duplicate_index
+from .group_commit import GROUP_COMMIT, WriterBusy, question_writer
+from .instrumentation import CONTENT_TYPE_LATEST, make_instrumentation
+from .leaderboard import ALL_CATEGORIES, DEFAULT_TOP, MAX_PLAYER_LENGTH, \
+    MAX_SCORE, MAX_TOP, leaderboards
+from .mutations import MAX_BATCH_ITEMS, apply_batch, delete_questions, \
+    notify_changes, parse_id, parse_ids
+from .quiz_pool import quiz_pool
+from .quiz_selection import STRATEGIES, UNIFORM, quiz_selector
+from .quiz_sessions import make_session_store, quiz_sessions
+from .response_cache import make_cache_backend, response_cache
+from .search import get_search_backend
+from .serialization import format_rows, iter_rows, make_json_encoder, \
+    parse_fields, parse_stream, select_questions, serializer
+from .snapshot import EXPORT_BATCH_SIZE, export_snapshot, make_snapshot
+from .stats import UNSET, question_stats
+from .subrequests import subrequest_runner
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
 
 # HELPERS SETUP
 # -----------------------------------------------------------------------------
 # Setting up separate method to handle pagination
 
 
-def paginate_questions(request, selection):
+def paginate_questions(request, selection, fields):
     # Getting page number from CLI argument
     page = request.args.get('page', 1, type=int)
 
-    # Setting start / end points based on static QUESTIONS_PER_PAGE variable
+    # Pages start at 1, so anything lower can never hold questions
+    if page < 1:
+        return []
+
+    # Setting start point based on static QUESTIONS_PER_PAGE variable
     start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
 
-    # Applying pagination to incoming question set
-    questions = [question.format() for question in selection]
-    paginated_questions = questions[start:end]
+    # Applying pagination in the database with LIMIT / OFFSET so only the
+    # requested page is loaded and formatted
+    rows = selection.offset(start).limit(QUESTIONS_PER_PAGE).all()
+
+    # Returning appropriately paginated questions with the requested fields
+    return format_rows(rows, fields)
+
+
+# Setting up keyset (cursor) pagination, which stays fast on deep pages
+# because it seeks on the primary key instead of skipping OFFSET rows
+def encode_cursor(question_id):
+    # Wrapping the last seen ID in an opaque, URL safe token
+    token = 'q:{}'.format(question_id).encode('utf-8')
+    return base64.urlsafe_b64encode(token).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Accepting plain IDs as well as tokens produced by encode_cursor
+    if cursor.isdigit():
+        return int(cursor)
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        prefix, question_id = base64.urlsafe_b64decode(
+            padded.encode('ascii')).decode('utf-8').split(':')
+        if prefix != 'q':
+            raise ValueError(cursor)
+        return int(question_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+
+def paginate_questions_after(request, selection, fields):
+    # Getting cursor and page size from CLI arguments
+    after_id = decode_cursor(request.args.get('after_id', '0'))
+    limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
+
+    # Keeping page size within sane bounds
+    if limit < 1 or limit > MAX_QUESTIONS_PER_PAGE:
+        raise ValueError('Invalid limit: {}'.format(limit))
+
+    # Fetching one extra row to learn whether another page exists (the
+    # selection must already be ordered by Question.id)
+    rows = selection.filter(Question.id > after_id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Building the cursor for the next page from the last row's ID, which
+    # select_questions() always puts first
+    next_cursor = encode_cursor(rows[-1][0]) if has_more else None
+
+    return format_rows(rows, fields), next_cursor
+
 
-    # Returning appropriately paginated questions
-    return paginated_questions
+# Setting up separate method to count questions with a COUNT(*) query rather
+# than loading every row just to call len() on it
+def count_questions(*criteria):
+    return db.session.query(func.count(Question.id)).filter(
+        *criteria).scalar()
 
 
 # FULL FLASK APP SETUP
@@ -34,7 +120,160 @@ def paginate_questions(request, selection):
 def create_app(test_config=None):
     # Create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    test_config = test_config or {}
+
+    # Serving reads from a read-only snapshot file instead of the database,
+    # when given one (or TRIVIA_SNAPSHOT is set); a snapshot is never migrated
+    snapshot = make_snapshot(test_config.get('snapshot'))
+    if snapshot is not None:
+        test_config = dict(test_config, migrate_on_start=False)
+    setup_db(app, test_config.get('database_path', database_path),
+             test_config)
+    if snapshot is not None:
+        snapshot.init_app(app)
+
+    # Compressing responses the client accepts compressed (registered first
+    # so it runs after every other after_request hook)
+    compression = make_compression(test_config.get('compression'))
+    if compression is not None:
+        compression.init_app(app)
+
+    # Timing requests and their SQL statements for /metrics and the
+    # Server-Timing header, unless turned off with False
+    instrumentation = make_instrumentation(
+        test_config.get('instrumentation'))
+    if instrumentation is not None:
+        instrumentation.init_app(app)
+
+    # Rate limiting and bounding concurrent requests on write and expensive
+    # routes, unless turned off with False
+    admission = make_admission(test_config.get('admission'))
+    if admission is not None:
+        admission.init_app(app)
+
+    # Rebuilding the category cache, quiz question pool, question stats and
+    # duplicate index against this app's database
+    category_cache.invalidate()
+    quiz_pool.reset()
+    quiz_selector.reset()
+    question_stats.reset()
+    duplicate_index.reset()
+
+    # Sending POST /questions inserts through the group commit writer, when
+    # given a mode ('group_commit' or 'async', or a dict with 'mode' and
+    # writer options)
+    writes = test_config.get('question_writes')
+    if isinstance(writes, str):
+        writes = {'mode': writes}
+    question_writer.configure(app, **(writes or {}))
+
+    # Ranking quiz scores in memory, written to the scores table in batches
+    # (a dict of 'flush_interval', 'flush_batch_size' and 'refresh_interval'
+    # in seconds)
+    leaderboards.configure(app, **(test_config.get('leaderboard') or {}))
+
+    # Serving 'deck' quiz turns from precomputed deck files, when given a
+    # directory (or a dict with 'directory' and 'deck_count')
+    decks = test_config.get('quiz_decks')
+    if isinstance(decks, str):
+        decks = {'directory': decks}
+    quiz_decks.configure(**(decks or {}))
+
+    # Bounding POST /batch (a dict of 'max_subrequests', 'time_budget' in
+    # seconds and 'max_workers')
+    subrequest_runner.configure(**(test_config.get('batch_requests') or {}))
+
+    # Picking the default quiz selection strategy, which a quiz request may
+    # override with its own 'strategy'
+    app.config['QUIZ_STRATEGY'] = test_config.get('quiz_strategy', UNIFORM)
+    if app.config['QUIZ_STRATEGY'] not in STRATEGIES + (DECK_STRATEGY,):
+        raise ValueError('Unknown quiz strategy: {}'.format(
+            app.config['QUIZ_STRATEGY']))
+
+    # Setting up the quiz session store (in-process by default, or a shared
+    # Redis store)
+    quiz_sessions.configure(make_session_store(
+        test_config.get('quiz_sessions')))
+
+    # Picking the JSON encoder for list responses (orjson when installed,
+    # the standard library otherwise)
+    serializer.configure(make_json_encoder(test_config.get('json_encoder')))
+
+    # Setting up the response cache for read routes (an in-process LRU by
+    # default, a shared Redis backend, or disabled with False)
+    response_cache.configure(make_cache_backend(
+        test_config.get('response_cache')))
+
+    # Preparing the configured search backend (Postgres full text search or
+    # the in-memory inverted index)
+    app.config['SEARCH_BACKEND'] = test_config.get('search_backend')
+    with app.app_context():
+        get_search_backend(app.config['SEARCH_BACKEND']).setup()
+
+    # CLI COMMAND SETUP
+    # ---------------------------------------------------------------------------
+    # Creating command to create or upgrade the database schema with the
+    # migrations, e.g. 'flask init-db' before starting the workers
+    @app.cli.command('init-db')
+    @click.option('--revision', default='head',
+                  help='Migration revision to upgrade to')
+    def init_db_command(revision):
+        upgrade_db(revision)
+        click.echo('Database schema upgraded to {}'.format(revision))
+
+    # Creating command to precompute quiz decks ahead of an event, e.g.
+    # 'flask build-decks --directory decks'; only categories whose
+    # questions changed are rebuilt unless --full is given
+    @app.cli.command('build-decks')
+    @click.option('--directory', default=None,
+                  help='Deck directory (defaults to the quiz_decks setting)')
+    @click.option('--deck-count', default=None, type=int,
+                  help='Shuffled orders per deck')
+    @click.option('--full', is_flag=True, help='Rebuild every deck')
+    def build_decks_command(directory, deck_count, full):
+        directory = directory or quiz_decks.directory
+        if directory is None:
+            raise click.UsageError('No deck directory given')
+
+        rebuilt = build_decks(directory, deck_count or quiz_decks.deck_count,
+                              full=full)
+        click.echo('Rebuilt {} deck(s) in {}'.format(len(rebuilt), directory))
+
+    # Creating command to report clusters of near-duplicate questions across
+    # the whole table, e.g. 'flask report-duplicates --threshold 0.8'
+    @app.cli.command('report-duplicates')
+    @click.option('--threshold', default=None, type=float,
+                  help='Similarity from which questions are duplicates')
+    @click.option('--limit', default=20, help='Most clusters listed')
+    def report_duplicates_command(threshold, limit):
+        clusters = duplicate_index.clusters(threshold)
+        click.echo('Found {} cluster(s) of near-duplicate questions'.format(
+            len(clusters)))
+
+        listed = clusters[:limit]
+        questions = {question.id: question for question in
+                     Question.query.filter(Question.id.in_(
+                         [question_id for cluster in listed
+                          for question_id in cluster]))}
+        for cluster in listed:
+            click.echo('')
+            for question_id in cluster:
+                question = questions.get(question_id)
+                if question is not None:
+                    click.echo('{:>8}  {} ({})'.format(
+                        question_id, question.question, question.answer))
+
+    # Creating command to export the questions into a read-only snapshot
+    # file for read nodes, e.g. 'flask export-snapshot trivia.snapshot';
+    # nodes serving that path swap to the new file on their own
+    @app.cli.command('export-snapshot')
+    @click.argument('path')
+    @click.option('--batch-size', default=EXPORT_BATCH_SIZE,
+                  help='Rows copied per INSERT')
+    def export_snapshot_command(path, batch_size):
+        counts = export_snapshot(path, batch_size)
+        click.echo('Exported {} question(s) and {} categories to {}'.format(
+            counts['questions'], counts['categories'], path))
 
     # CORS / ACCESS SETUP
     # ---------------------------------------------------------------------------
@@ -57,76 +296,251 @@ def create_app(test_config=None):
         # Returning adjusted response
         return response
 
+    # Telling clients turned away with a 429 or 503 when to retry
+    @app.after_request
+    def add_retry_after(response):
+        retry_after = g.pop('retry_after', None)
+        if retry_after is not None:
+            response.headers['Retry-After'] = str(
+                max(1, int(math.ceil(retry_after))))
+        return response
+
     # 'GET' ENDPOINT SETUP
     # ---------------------------------------------------------------------------
     # Defining endpoint to handle GET requests for available categories
     @app.route('/categories', methods=['GET'])
     def get_categories():
-        # Querying categories ordered by type using SQLAlchemy
-        categories = Category.query.order_by(Category.type).all()
+        # Getting categories ordered by type from the category cache
+        categories, etag = category_cache.get()
 
         # Handling 404 error issues if valid
         if len(categories) == 0:
             abort(404)
 
-        # Returning proper response
-        return jsonify({'success': True, 'categories': {
-                       category.id: category.type for category in categories}})
+        # Adding question counts per category from the stats aggregate when
+        # asked to; counts change with every question, so these responses
+        # must be revalidated
+        if request.args.get('with_counts', 0, type=int):
+            counts = question_stats.get()['by_category']
+            response = jsonify({
+                'success': True,
+                'categories': categories,
+                'question_counts': {category_id: counts.get(category_id, 0)
+                                    for category_id in categories}
+            })
+            response.add_etag()
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        # Building proper response, cacheable by browsers and CDNs
+        response = jsonify({'success': True, 'categories': categories})
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = CATEGORY_CACHE_TTL
+
+        # Returning 304 Not Modified if the client's copy is still current
+        return response.make_conditional(request)
 
     # Defining endpoint to handle GET requests for questions and correlated
     # categoiry
     @app.route('/questions', methods=['GET'])
     def get_questions():
-        # Querying questions ordered by ID using SQLAlchemy
-        questions = Question.query.order_by(Question.id).all()
-        # Paginating questions with helper method
-        paginated_questions = paginate_questions(request, questions)
+        # Getting the fields to return, all of them by default
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError:
+            abort(400)
+
+        # Querying question columns ordered by ID using SQLAlchemy (the query
+        # is only executed once the pagination helpers apply LIMIT to it)
+        questions = select_questions(fields).order_by(Question.id)
+
+        # Using keyset pagination when a cursor or limit is requested and
+        # falling back to classic page numbers otherwise
+        next_cursor = None
+        cursor_mode = 'after_id' in request.args or 'limit' in request.args
+        if cursor_mode:
+            try:
+                paginated_questions, next_cursor = paginate_questions_after(
+                    request, questions, fields)
+            except ValueError:
+                abort(400)
+        else:
+            # Paginating questions with helper method, caching each page
+            page = request.args.get('page', 1, type=int)
+            paginated_questions = response_cache.get_or_build(
+                'get_questions', {'page': page, 'fields': fields},
+                ['questions:pages'],
+                lambda: paginate_questions(request, questions, fields))
 
-        # Querying categories ored by type using SQLAlchemy
-        categories = Category.query.order_by(Category.type).all()
+        # Getting categories ordered by type from the category cache
+        categories, _ = category_cache.get()
 
         # Handling 404 error issues if valid
         if len(paginated_questions) == 0:
             abort(404)
 
-        # Return valid information
-        return jsonify({
+        # Building valid information
+        response = {
             'success': True,
             'questions': paginated_questions,
-            'total_questions': len(questions),
-            'categories': {category.id: category.type for category in categories},
+            'total_questions': response_cache.get_or_build(
+                'count_questions', {}, ['questions:count'], count_questions),
+            'categories': categories,
             'current_category': None
+        }
+
+        # Only cursor based requests get a cursor back
+        if cursor_mode:
+            response['next_cursor'] = next_cursor
+
+        # Fingerprinting the page (questions and categories) so clients must
+        # revalidate but can skip the download when nothing changed
+        response = serializer.response(response)
+        response.add_etag()
+        response.cache_control.no_cache = True
+
+        # Return valid information, or 304 Not Modified
+        return response.make_conditional(request)
+
+    # Defining endpoint to handle GET requests for question counts per
+    # category and per difficulty, read from the in-memory aggregate
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        stats = question_stats.get()
+        categories, _ = category_cache.get()
+
+        # Listing every category, including those without questions, plus
+        # any uncategorised questions; keys are sent as strings, since
+        # jsonify cannot sort the 'none' key among integer keys
+        per_category = {str(category_id): stats['by_category'].get(
+            category_id, 0) for category_id in categories}
+        if UNSET in stats['by_category']:
+            per_category[UNSET] = stats['by_category'][UNSET]
+
+        return jsonify({
+            'success': True,
+            'total_questions': stats['total'],
+            'questions_per_category': per_category,
+            'questions_per_difficulty': {
+                str(difficulty): count
+                for difficulty, count in stats['by_difficulty'].items()}
         })
 
+    # Defining endpoint for load balancers and monitoring, reporting database
+    # reachability along with connection pool and cache statistics
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        engines = {'primary': db.get_engine(app)}
+        if replica_bind in (app.config.get('SQLALCHEMY_BINDS') or {}):
+            engines[replica_bind] = db.get_engine(app, bind=replica_bind)
+
+        # Checking every engine with a trivial query
+        healthy = True
+        databases = {}
+        for name, engine in engines.items():
+            status = {'status': 'ok'}
+            try:
+                with engine.connect() as connection:
+                    connection.execute('SELECT 1')
+            except Exception as e:
+                healthy = False
+                status = {'status': 'error', 'error': str(e)}
+            status.update(pool_status(engine))
+            databases[name] = status
+
+        cache = response_cache.backend.stats() \
+            if response_cache.backend is not None else None
+
+        return jsonify({
+            'success': healthy,
+            'databases': databases,
+            'cache': cache,
+            'snapshot': snapshot.status() if snapshot is not None else None
+        }), 200 if healthy else 503
+
+    # Defining endpoint exposing request and SQL metrics to Prometheus
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        # Handling 404 error issues if instrumentation is turned off
+        if instrumentation is None:
+            abort(404)
+
+        return Response(instrumentation.render(),
+                        content_type=CONTENT_TYPE_LATEST)
+
     # Creating endpoint to return only questions of a specific category
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def get_category_questions(category_id):
-        # Querying all questions based on the inputted category_id
-        questions = Question.query.filter(
-            Question.category == category_id).all()
+        # Getting the fields to return, all of them by default, and whether
+        # to stream the results
+        try:
+            fields = parse_fields(request.args.get('fields'))
+            stream_format = parse_stream(request.args.get('stream'))
+        except ValueError:
+            abort(400)
+
+        # Streaming every question of the category from a server side
+        # cursor, once the category is known to hold any
+        if stream_format is not None:
+            selection = select_questions(fields).filter(
+                Question.category == category_id)
+            if selection.limit(1).first() is None:
+                abort(404)
+
+            return serializer.stream(
+                iter_rows(selection.order_by(Question.id), fields),
+                stream_format,
+                {'success': True, 'current_category': category_id})
+
+        # Querying all questions based on the inputted category_id, cached
+        # until a question in this category changes
+        questions = response_cache.get_or_build(
+            'get_category_questions',
+            {'category_id': category_id, 'fields': fields},
+            ['category:{}'.format(category_id)],
+            lambda: format_rows(select_questions(fields).filter(
+                Question.category == category_id).all(), fields))
 
         # Handling error scenarios
         if len(questions) == 0:
             abort(404)
 
         # Returning proper information if info is present
-        return jsonify({
+        return serializer.response({
             'success': True,
-            'questions': [question.format() for question in questions],
+            'questions': questions,
             'total_questions': len(questions),
             'current_category': category_id
         })
 
+    # Creating endpoint to stream every question out as NDJSON, optionally
+    # limited to one category
+    @app.route('/questions/export', methods=['GET'])
+    def export_questions_ndjson():
+        category = request.args.get('category', None, type=int)
+
+        return Response(stream_with_context(export_questions(category)),
+                        mimetype='application/x-ndjson')
+
     # 'DELETE' ENDPOINT SETUP
     # ---------------------------------------------------------------------------
     # Defining endpoint for deleting a question based on question_id
     @app.route('/questions/<question_id>', methods=['DELETE'])
     def delete_question(question_id):
-        # Setting up try block for execution of deletion
+        # Rejecting IDs that are not a plain integer
         try:
-            # Quering the question with the question_id
-            question = Question.query.get(question_id)
+            parsed_id = parse_id(question_id)
+        except ValueError:
+            abort(422)
+
+        # Quering the question with the question_id
+        question = Question.query.get(parsed_id)
+        if question is None:
+            abort(404)
 
+        # Setting up try block for execution of deletion
+        try:
             # Deleting the question
             question.delete()
 
@@ -139,6 +553,38 @@ def create_app(test_config=None):
         except BaseException:
             abort(422)
 
+    # Defining endpoint for deleting many questions at once, e.g.
+    # DELETE /questions?ids=1,2,3, with a single DELETE ... WHERE id IN
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions_by_ids():
+        # Reading the IDs to delete from the query string
+        try:
+            ids = parse_ids(request.args.get('ids', ''))
+        except ValueError:
+            abort(400)
+
+        # Handling missing or oversized ID lists
+        if not ids or len(ids) > MAX_BATCH_ITEMS:
+            abort(422)
+
+        # Deleting every question in one statement and transaction
+        try:
+            deleted = delete_questions(ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            abort(422)
+        notify_changes([('delete', question) for question in deleted])
+
+        # Returning which IDs were deleted and which did not exist
+        deleted_ids = {question['id'] for question in deleted}
+        return jsonify({
+            'success': True,
+            'deleted': sorted(deleted_ids),
+            'not_found': [question_id for question_id in ids
+                          if question_id not in deleted_ids]
+        })
+
     # 'POST' ENDPOINT SETUP
     # ---------------------------------------------------------------------------
     # Creating endpoint to add new questions in POST method
@@ -157,6 +603,53 @@ def create_app(test_config=None):
         if not (question and answer and difficulty and category):
             abort(422)
 
+        # Looking for near-duplicates of the question when asked to reject
+        # or warn about them
+        dedupe = request.args.get('dedupe')
+        if dedupe is not None and dedupe not in DEDUPE_MODES:
+            abort(400)
+        duplicates = duplicate_index.find(question, answer) if dedupe else []
+        if duplicates and dedupe == REJECT:
+            return jsonify({
+                'success': False,
+                'error': 409,
+                'message': 'Near-duplicate question',
+                'duplicates': duplicates
+            }), 409
+        warnings = {'duplicates': duplicates} if dedupe == WARN else {}
+
+        # Handing the insert to the group commit writer when enabled
+        if question_writer.mode is not None:
+            try:
+                pending = question_writer.submit({
+                    'question': question,
+                    'answer': answer,
+                    'difficulty': difficulty,
+                    'category': category})
+            except WriterBusy:
+                g.retry_after = BUSY_RETRY_AFTER
+                abort(503)
+
+            # Waiting for the group's transaction in group commit mode
+            if question_writer.mode == GROUP_COMMIT and \
+                    pending.wait(question_writer.wait_timeout):
+                if pending.error is not None:
+                    abort(422)
+                return jsonify({
+                    'success': True,
+                    'created': pending.id,
+                    **warnings
+                })
+
+            # Otherwise accepting the question and pointing to its status
+            return jsonify({
+                'success': True,
+                'status': pending.status(),
+                'status_url': url_for('get_question_write',
+                                      ticket=pending.ticket),
+                **warnings
+            }), 202
+
         # Creating try block to insert new question into database
         try:
             # Instantiating new question as Question object
@@ -171,31 +664,201 @@ def create_app(test_config=None):
             # Returning success information
             return jsonify({
                 'success': True,
-                'created': new_question.id
+                'created': new_question.id,
+                **warnings
             })
         # Handling error scenarios
         except BaseException:
             abort(422)
 
+    # Creating endpoint to check on a question accepted with a 202
+    @app.route('/questions/writes/<ticket>', methods=['GET'])
+    def get_question_write(ticket):
+        pending = question_writer.status(ticket)
+
+        # Handling unknown or expired tickets
+        if pending is None:
+            abort(404)
+
+        # Returning the write's status, with the new ID once created
+        return jsonify({
+            'success': True,
+            'status': pending.status(),
+            'created': pending.id
+        })
+
+    # Creating endpoint to import many questions at once from an NDJSON or
+    # CSV request body, read as a stream and written in batches
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_create_questions():
+        # Picking a parser based on the request content type
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            rows = parse_ndjson(request.stream)
+        elif request.mimetype == 'text/csv':
+            rows = parse_csv(request.stream)
+        else:
+            abort(415)
+
+        # Skipping near-duplicate rows when asked to reject them
+        dedupe = request.args.get('dedupe')
+        if dedupe is not None and dedupe != REJECT:
+            abort(400)
+
+        # Validating rows against the known categories as they stream in
+        categories, _ = category_cache.get()
+        try:
+            created, errors = import_questions(
+                rows, categories,
+                duplicates=duplicate_index if dedupe == REJECT else None)
+        except ImportFailed as e:
+            # Reporting what was committed before the failing chunk, so the
+            # import can be resumed from its first line
+            app.logger.exception('Bulk import failed')
+            return jsonify({
+                'success': False,
+                'error': 500,
+                'message': 'Unable to import questions',
+                'created': e.created,
+                'errors': e.errors,
+                'failed_lines': {'first': e.first_line, 'last': e.last_line}
+            }), 500
+
+        # Returning import summary, along with any rows that were skipped
+        return jsonify({
+            'success': True,
+            'created': created,
+            'errors': errors
+        })
+
+    # Creating endpoint to create, update and delete many questions in one
+    # transaction, reporting a result for every item
+    @app.route('/questions/batch', methods=['POST'])
+    def batch_questions():
+        # Getting body data from POST request
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400)
+
+        # Pulling the lists of creates, updates and deletes from the body
+        creates = body.get('create', [])
+        updates = body.get('update', [])
+        try:
+            deletes = parse_ids(body.get('delete', []))
+        except ValueError:
+            abort(422)
+
+        # Checking the batch is well formed and within bounds
+        if not (isinstance(creates, list) and isinstance(updates, list)):
+            abort(422)
+        if len(creates) + len(updates) + len(deletes) > MAX_BATCH_ITEMS:
+            abort(422)
+
+        # Running the batch, rolled back as a whole on database errors
+        categories, _ = category_cache.get()
+        try:
+            results = apply_batch(creates, updates, deletes, categories)
+        except Exception:
+            abort(422)
+
+        # Returning per-item results along with totals
+        return jsonify({
+            'success': True,
+            'results': results,
+            'created': sum(result['success']
+                           for result in results['create']),
+            'updated': sum(result['success']
+                           for result in results['update']),
+            'deleted': sum(result['success']
+                           for result in results['delete'])
+        })
+
+    # Creating endpoint to run several requests to the other routes in one
+    # round trip, e.g. the categories and a page of questions, returning the
+    # status and body of each
+    @app.route('/batch', methods=['POST'])
+    def batch_requests():
+        # Getting body data from POST request
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400)
+
+        # Checking the sub-requests are well formed and within bounds
+        try:
+            subrequests = subrequest_runner.parse(body.get('requests'))
+        except ValueError:
+            abort(422)
+
+        # Running the sub-requests as this client
+        client = {'REMOTE_ADDR': request.remote_addr}
+        if 'X-Forwarded-For' in request.headers:
+            client['HTTP_X_FORWARDED_FOR'] = request.headers['X-Forwarded-For']
+        responses = subrequest_runner.run(app, subrequests, client)
+
+        return jsonify({
+            'success': True,
+            'responses': responses
+        })
+
     # Creating endpoint for searching for a question based on a search term
     @app.route('/questions/search', methods=['POST'])
     def search_questions():
         # Getting body data from POST request
         body = request.get_json()
 
-        # Pulling search term from body
+        # Pulling search term, page and optional filters from body
         search_term = body.get('searchTerm')
+        page = body.get('page', 1)
+        category = body.get('category')
+        difficulty = body.get('difficulty')
 
-        # Returning search results if search term present
+        # Returning ranked, paginated search results if search term present
         if search_term:
-            search_results = Question.query.filter(
-                Question.question.ilike(f'%{search_term}%')).all()
+            if not isinstance(search_term, str):
+                abort(422)
+            if not isinstance(page, int) or page < 1:
+                abort(422)
+            if not all(value is None or isinstance(value, int)
+                       for value in (category, difficulty)):
+                abort(422)
 
-            return jsonify({
+            # Getting the fields to return, all of them by default, and
+            # whether to stream every match instead of one page
+            try:
+                fields = parse_fields(request.args.get('fields'))
+                stream_format = parse_stream(request.args.get('stream'))
+            except ValueError:
+                abort(400)
+
+            if stream_format is not None:
+                return serializer.stream(
+                    get_search_backend(app.config['SEARCH_BACKEND'])
+                    .iter_search(search_term, category=category,
+                                 difficulty=difficulty, fields=fields),
+                    stream_format,
+                    {'success': True, 'current_category': category})
+
+            # Running the search, cached until a question in the searched
+            # category (or any question, for unfiltered searches) changes
+            def run_search():
+                questions, total = get_search_backend(
+                    app.config['SEARCH_BACKEND']).search(
+                    search_term, category=category, difficulty=difficulty,
+                    page=page, per_page=QUESTIONS_PER_PAGE, fields=fields)
+                return {'questions': questions, 'total': total}
+
+            namespace = 'search' if category is None \
+                else 'search:category:{}'.format(category)
+            search_results = response_cache.get_or_build(
+                'search_questions',
+                {'searchTerm': search_term, 'category': category,
+                 'difficulty': difficulty, 'page': page, 'fields': fields},
+                [namespace], run_search)
+
+            return serializer.response({
                 'success': True,
-                'questions': [question.format() for question in search_results],
-                'total_questions': len(search_results),
-                'current_category': None
+                'questions': search_results['questions'],
+                'total_questions': search_results['total'],
+                'current_category': category
             })
 
         # Throwing error if invalid search term provided
@@ -216,21 +879,24 @@ def create_app(test_config=None):
             # Pulling information from data body into respective variables
             category = body.get('quiz_category')
             previous_questions = body.get('previous_questions')
+            strategy = body.get('strategy', app.config['QUIZ_STRATEGY'])
 
             # Defining behavior for what to return based on where a user is at
-            # in their quiz
-            if category['type'] == 'click':
-                available_questions = Question.query.filter(
-                    Question.id.notin_((previous_questions))).all()
+            # in their quiz, picking an unseen question with the requested
+            # strategy from the in-memory pools and loading only that row
+            category_id = None if category['type'] == 'click' \
+                else category['id']
+            if strategy == DECK_STRATEGY:
+                # Serving the question straight from the quiz decks
+                new_question = quiz_decks.choose(
+                    category_id, previous_questions)
             else:
-                available_questions = Question.query.filter_by(
-                    category=category['id']).filter(
-                    Question.id.notin_(
-                        (previous_questions))).all()
+                question = quiz_selector.choose(
+                    strategy, category_id, previous_questions)
 
-            # Getting random question from list of available_questions
-            new_question = available_questions[random.randrange(
-                0, len(available_questions))].format() if len(available_questions) > 0 else None
+                # Formatting the chosen question, if any are left
+                new_question = question.format() \
+                    if question is not None else None
 
             # Returning successful information
             return jsonify({
@@ -241,6 +907,166 @@ def create_app(test_config=None):
         except BaseException:
             abort(422)
 
+    # Creating endpoint to record a player's answer, which feeds the
+    # weighted quiz strategy
+    @app.route('/quiz/answer', methods=['POST'])
+    def answer_quiz_question():
+        # Getting body data from POST request
+        body = request.get_json()
+
+        # Ensuring a question ID and a boolean 'correct' are present
+        try:
+            question_id = body['question_id']
+            correct = body['correct']
+        except (TypeError, KeyError):
+            abort(422)
+        if not isinstance(question_id, int) or isinstance(question_id, bool) \
+                or not isinstance(correct, bool):
+            abort(422)
+
+        # Handling answers to questions that do not exist
+        if db.session.query(Question.id).filter(
+                Question.id == question_id).scalar() is None:
+            abort(422)
+
+        # Storing the answer and re-weighting its question
+        Answer(question_id, correct).insert()
+        answered, correct_count = quiz_selector.record_answer(
+            question_id, correct)
+
+        # Returning the question's answer totals
+        return jsonify({
+            'success': True,
+            'question_id': question_id,
+            'answered': answered,
+            'correct': correct_count
+        })
+
+    # Creating endpoint to submit a player's quiz score, which is ranked
+    # against the other players of the quiz's category right away
+    @app.route('/quiz/score', methods=['POST'])
+    def submit_quiz_score():
+        # Getting body data from POST request
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(422)
+
+        # Ensuring a player name, a score and a quiz category are present,
+        # with the category given as for POST /quiz
+        player = body.get('player')
+        score = body.get('score')
+        category = body.get('quiz_category')
+        if not isinstance(player, str) or not player.strip() or \
+                len(player.strip()) > MAX_PLAYER_LENGTH:
+            abort(422)
+        if not isinstance(score, int) or isinstance(score, bool) or \
+                not 0 <= score <= MAX_SCORE:
+            abort(422)
+        if not isinstance(category, dict):
+            abort(422)
+
+        # Quizzes over every category share one leaderboard
+        category_id = ALL_CATEGORIES if category.get('type') == 'click' \
+            else category.get('id')
+        categories, _ = category_cache.get()
+        if category_id != ALL_CATEGORIES and category_id not in categories:
+            abort(422)
+
+        # Ranking the score, which only replaces a lower best score
+        best, rank, improved = leaderboards.submit(
+            category_id, player.strip(), score)
+
+        # Returning the player's best score and rank
+        return jsonify({
+            'success': True,
+            'player': player.strip(),
+            'score': best,
+            'rank': rank,
+            'improved': improved
+        })
+
+    # Creating endpoint to return a category's top players, and the players
+    # ranked around a given player
+    @app.route('/leaderboard', methods=['GET'])
+    def get_leaderboard():
+        # Getting the category (every category by default), the number of
+        # top players and the player to center a second list on
+        category_id = request.args.get('category', ALL_CATEGORIES, type=int)
+        top = request.args.get('top', DEFAULT_TOP, type=int)
+        player = request.args.get('around')
+        if not 1 <= top <= MAX_TOP:
+            abort(400)
+
+        total_players, leaders, nearby = leaderboards.standings(
+            category_id, top, player)
+
+        # Handling 404 error issues for players without a score
+        if player is not None and nearby is None:
+            abort(404)
+
+        response = {
+            'success': True,
+            'category': category_id,
+            'total_players': total_players,
+            'leaders': leaders
+        }
+        if player is not None:
+            response['around'] = nearby
+        return jsonify(response)
+
+    # Creating endpoint to start a quiz session, which shuffles the
+    # category's questions once so the client no longer has to send back
+    # every previous question on each turn
+    @app.route('/quiz/sessions', methods=['POST'])
+    def create_quiz_session():
+        # Getting body data from POST request
+        body = request.get_json()
+
+        # Pulling the category from the body, 'click' meaning all categories
+        try:
+            category = body['quiz_category']
+            category_id = None if category['type'] == 'click' \
+                else int(category['id'])
+        except (TypeError, KeyError, ValueError):
+            abort(422)
+
+        # Shuffling the category's question IDs into a new session
+        question_ids = quiz_pool.ids(category_id)
+        session_id = quiz_sessions.start(category_id, question_ids)
+
+        # Returning the session information
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'total_questions': len(question_ids),
+            'expires_in': quiz_sessions.store.ttl
+        })
+
+    # Creating endpoint to get the next question of a quiz session
+    @app.route('/quiz/sessions/<session_id>/next', methods=['GET'])
+    def next_quiz_question(session_id):
+        # Popping IDs until one still exists (questions may have been deleted
+        # since the session started)
+        while True:
+            found, question_id = quiz_sessions.next_id(session_id)
+
+            # Handling unknown or expired sessions
+            if not found:
+                abort(404)
+            if question_id is None:
+                question = None
+                break
+
+            question = Question.query.get(question_id)
+            if question is not None:
+                break
+
+        # Returning the question, or None once the quiz is over
+        return jsonify({
+            'success': True,
+            'question': question.format() if question is not None else None
+        })
+
     # ERROR SCENARIO HANDLING
     # ---------------------------------------------------------------------------
     # Creating error handler for 400 errors
@@ -261,6 +1087,33 @@ def create_app(test_config=None):
             'message': 'Resource not found'
         }), 404
 
+    # Creating error handler for 405 errors
+    @app.errorhandler(405)
+    def method_not_allowed(error):
+        return jsonify({
+            'success': False,
+            'error': 405,
+            'message': 'Method not allowed'
+        }), 405
+
+    # Creating error handler for 413 errors
+    @app.errorhandler(413)
+    def request_too_large(error):
+        return jsonify({
+            'success': False,
+            'error': 413,
+            'message': 'Request too large'
+        }), 413
+
+    # Creating error handler for 415 errors
+    @app.errorhandler(415)
+    def unsupported_media_type(error):
+        return jsonify({
+            'success': False,
+            'error': 415,
+            'message': 'Unsupported media type'
+        }), 415
+
     # Creating error handler for 422 errors
     @app.errorhandler(422)
     def unable_to_process(error):
@@ -270,4 +1123,22 @@ def create_app(test_config=None):
             'message': 'Unable to process request'
         }), 422
 
+    # Creating error handler for 429 errors
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        return jsonify({
+            'success': False,
+            'error': 429,
+            'message': 'Too many requests'
+        }), 429
+
+    # Creating error handler for 503 errors
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return jsonify({
+            'success': False,
+            'error': 503,
+            'message': 'Service unavailable'
+        }), 503
+
     return app
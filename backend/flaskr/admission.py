@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import abort, g, request
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is an optional dependency
+    redis = None
+
+# Token bucket per route and client as (requests per second, burst size),
+# keyed by endpoint name; routes not listed are not rate limited
+DEFAULT_RATE_LIMITS = {
+    'search_questions': (10, 20),
+    'play_quiz': (20, 40),
+    'answer_quiz_question': (20, 40),
+    'submit_quiz_score': (20, 40),
+    'create_question': (5, 20),
+    'delete_question': (5, 20),
+    'delete_questions_by_ids': (1, 5),
+    'bulk_create_questions': (1, 5),
+    'batch_questions': (1, 5),
+}
+# Requests per route handled at once by each process; further requests wait
+# up to QUEUE_TIMEOUT seconds for a slot, then get a 503
+DEFAULT_CONCURRENCY_LIMITS = {
+    'search_questions': 8,
+    'play_quiz': 16,
+    'bulk_create_questions': 2,
+    'batch_questions': 2,
+    'export_questions_ndjson': 2,
+}
+QUEUE_TIMEOUT = 0.1
+# Seconds clients are told to wait after a 503
+BUSY_RETRY_AFTER = 1
+# Largest accepted previous_questions list and search term
+MAX_PREVIOUS_QUESTIONS = 1000
+MAX_SEARCH_TERM_LENGTH = 200
+# Most buckets kept in memory; refilled buckets are dropped first, then the
+# least recently used ones
+MAX_BUCKETS = 10000
+# Environment variable giving the number of proxies in front of the app
+# whose X-Forwarded-For entries are trusted, for workers started with
+# create_app() and no settings
+TRUSTED_PROXIES_VARIABLE = 'TRIVIA_TRUSTED_PROXIES'
+# Prefix for every key written to Redis
+REDIS_KEY_PREFIX = 'trivia:limit:'
+
+
+# LIMIT STORES
+# -----------------------------------------------------------------------------
+# Stores keep one token bucket per key; take() spends a token and returns 0,
+# or the number of seconds until a token is available
+class MemoryLimitStore:
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, None))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if key not in self._buckets and \
+                    len(self._buckets) >= self.max_buckets:
+                self._purge(now)
+
+            # Each bucket keeps the time it takes to refill, so it is only
+            # dropped once idle for its own route's refill time
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, burst / rate)
+                retry_after = 0
+            else:
+                self._buckets[key] = (tokens, now, burst / rate)
+                retry_after = (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            return retry_after
+
+    # Dropping buckets idle long enough to have refilled, which behave the
+    # same as missing ones, then the least recently used buckets until
+    # there is room for a new one
+    def _purge(self, now):
+        full = [key for key, (_, updated, idle) in self._buckets.items()
+                if now - updated > idle]
+        for key in full:
+            del self._buckets[key]
+        while len(self._buckets) >= self.max_buckets:
+            self._buckets.popitem(last=False)
+
+
+# Sharing buckets between workers through Redis; the refill and spend run as
+# one Lua script so concurrent workers cannot both take the last token
+TAKE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+'''
+
+
+class RedisLimitStore:
+
+    def __init__(self, client, prefix=REDIS_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if redis is None:
+            raise RuntimeError('The redis package is required for a Redis '
+                               'rate limit store')
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[self.prefix + key],
+                                args=[rate, burst, time.time()]))
+
+
+# Building a store from the admission 'store' setting: None or 'memory' for
+# the in-process store, a redis:// URL or a store instance
+def make_limit_store(setting=None):
+    if setting is None or setting == 'memory':
+        return MemoryLimitStore()
+    if isinstance(setting, str) and setting.startswith('redis://'):
+        return RedisLimitStore.from_url(setting)
+    return setting
+
+
+# CLIENT KEYS
+# -----------------------------------------------------------------------------
+# Identifying the client of a request by its remote address, or, behind
+# proxies (a CDN, a load balancer), by the X-Forwarded-For entry added by
+# the outermost of trusted_proxies proxies; entries further left are set by
+# the client and cannot be trusted
+def make_client_key(trusted_proxies=0):
+    if not trusted_proxies:
+        return lambda: request.remote_addr
+
+    def client_key():
+        forwarded = [address.strip() for address in request.headers.get(
+            'X-Forwarded-For', '').split(',') if address.strip()]
+        if len(forwarded) < trusted_proxies:
+            return request.remote_addr
+        return forwarded[-trusted_proxies]
+    return client_key
+
+
+# ADMISSION CONTROL
+# -----------------------------------------------------------------------------
+# Turning requests away before they reach the database: oversized quiz and
+# search bodies get a 413, clients over their route's rate limit a 429, and
+# requests finding every slot of an expensive route busy a 503, the latter
+# two with a Retry-After header (set from g.retry_after by create_app)
+class AdmissionControl:
+
+    def __init__(self, rate_limits=None, concurrency_limits=None, store=None,
+                 max_previous_questions=MAX_PREVIOUS_QUESTIONS,
+                 max_search_term_length=MAX_SEARCH_TERM_LENGTH,
+                 queue_timeout=QUEUE_TIMEOUT, client_key=None,
+                 trusted_proxies=None):
+        # Overrides are merged into the defaults; None removes a limit
+        self.rate_limits = {
+            endpoint: limit for endpoint, limit in dict(
+                DEFAULT_RATE_LIMITS, **(rate_limits or {})).items()
+            if limit is not None}
+        self.semaphores = {
+            endpoint: threading.BoundedSemaphore(limit)
+            for endpoint, limit in dict(
+                DEFAULT_CONCURRENCY_LIMITS,
+                **(concurrency_limits or {})).items() if limit is not None}
+        self.store = make_limit_store(store)
+        self.max_previous_questions = max_previous_questions
+        self.max_search_term_length = max_search_term_length
+        self.queue_timeout = queue_timeout
+        if trusted_proxies is None:
+            trusted_proxies = int(os.environ.get(TRUSTED_PROXIES_VARIABLE, 0))
+        self.client_key = client_key or make_client_key(trusted_proxies)
+
+    def init_app(self, app):
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def admit(self):
+        endpoint = request.endpoint
+        if endpoint is None:
+            return
+
+        self.check_size(endpoint)
+
+        if endpoint in self.rate_limits:
+            rate, burst = self.rate_limits[endpoint]
+            retry_after = self.store.take(
+                '{}:{}'.format(endpoint, self.client_key()), rate, burst)
+            if retry_after > 0:
+                g.retry_after = retry_after
+                abort(429)
+
+        semaphore = self.semaphores.get(endpoint)
+        if semaphore is not None:
+            if not semaphore.acquire(timeout=self.queue_timeout):
+                g.retry_after = BUSY_RETRY_AFTER
+                abort(503)
+            g.admission_semaphore = semaphore
+
+    # Rejecting quiz and search bodies too large to be served cheaply
+    def check_size(self, endpoint):
+        if endpoint not in ('play_quiz', 'search_questions'):
+            return
+
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return
+
+        previous_questions = body.get('previous_questions')
+        if isinstance(previous_questions, list) and \
+                len(previous_questions) > self.max_previous_questions:
+            abort(413)
+
+        search_term = body.get('searchTerm')
+        if isinstance(search_term, str) and \
+                len(search_term) > self.max_search_term_length:
+            abort(413)
+
+    def release(self, error=None):
+        semaphore = g.pop('admission_semaphore', None)
+        if semaphore is not None:
+            semaphore.release()
+
+
+# Building admission control from create_app's 'admission' setting: None
+# for the defaults, False to turn it off, or a dict of AdmissionControl
+# options (e.g. {'rate_limits': {'search_questions': (2, 5)},
+# 'store': 'redis://localhost:6379/0', 'trusted_proxies': 1})
+def make_admission(setting=None):
+    if setting is False:
+        return None
+    if setting is None or setting is True:
+        return AdmissionControl()
+    return AdmissionControl(**setting)
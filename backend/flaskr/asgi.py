@@ -0,0 +1,445 @@
+import hashlib
+import json
+
+from databases import Database
+from sqlalchemy import func, literal_column, select
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from models import database_path, Question, Category
+from . import QUESTIONS_PER_PAGE, MAX_QUESTIONS_PER_PAGE, decode_cursor, \
+    encode_cursor
+from .category_cache import category_cache, CATEGORY_CACHE_TTL
+from .mutations import parse_id
+from .quiz_pool import quiz_pool
+from .quiz_sessions import make_session_store, quiz_sessions
+from .search import InvertedIndexBackend, PostgresSearchBackend, \
+    TEXT_SEARCH_CONFIG, search_backends
+
+questions = Question.__table__
+categories = Category.__table__
+
+QUESTION_COLUMNS = [questions.c.id, questions.c.question, questions.c.answer,
+                    questions.c.category, questions.c.difficulty]
+
+ERROR_MESSAGES = {
+    400: 'Bad request',
+    404: 'Resource not found',
+    415: 'Unsupported media type',
+    422: 'Unable to process request'
+}
+
+
+# HELPERS SETUP
+# -----------------------------------------------------------------------------
+# Formatting a question row the same way Question.format() does
+def format_question(row):
+    return {
+        'id': row['id'],
+        'question': row['question'],
+        'answer': row['answer'],
+        'category': row['category'],
+        'difficulty': row['difficulty']
+    }
+
+
+# Answering with 304 Not Modified when the client already holds the ETag
+def conditional_json(request, content, etag, cache_control):
+    headers = {'ETag': '"{}"'.format(etag), 'Cache-Control': cache_control}
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content, headers=headers)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400)
+
+
+# Keeping in-process indexes in sync with writes made by this app
+def notify_local(action, question):
+    quiz_pool.handle_change(action, question)
+    search_backends[InvertedIndexBackend.name].handle_change(action, question)
+
+
+# FULL ASGI APP SETUP
+# -----------------------------------------------------------------------------
+# Building an async counterpart of create_app() with the same endpoints and
+# JSON contracts, running queries through the databases package (asyncpg on
+# Postgres, aiosqlite on SQLite); the schema is expected to be migrated
+# already, e.g. by create_app() or 'alembic upgrade head'
+def create_asgi_app(test_config=None):
+    test_config = test_config or {}
+    database = Database(test_config.get('database_path', database_path))
+    search_backend_name = test_config.get('search_backend')
+
+    # Rebuilding the category cache and in-memory indexes against this app's
+    # database
+    category_cache.invalidate()
+    quiz_pool.reset()
+    search_backends[InvertedIndexBackend.name].setup()
+    quiz_sessions.configure(make_session_store(
+        test_config.get('quiz_sessions')))
+
+    async def load_categories():
+        cached = category_cache.cached()
+        if cached is not None:
+            return cached
+
+        rows = await database.fetch_all(
+            select([categories.c.id, categories.c.type]).order_by(
+                categories.c.type))
+        return category_cache.load(
+            [(row['id'], row['type']) for row in rows])
+
+    # 'GET' ENDPOINT SETUP
+    # -------------------------------------------------------------------------
+    # Defining endpoint to handle GET requests for available categories
+    async def get_categories(request):
+        category_map, etag = await load_categories()
+
+        if len(category_map) == 0:
+            raise HTTPException(404)
+
+        return conditional_json(
+            request, {'success': True, 'categories': category_map}, etag,
+            'public, max-age={}'.format(CATEGORY_CACHE_TTL))
+
+    # Defining endpoint to handle GET requests for questions and categories
+    async def get_questions(request):
+        selection = select(QUESTION_COLUMNS).order_by(questions.c.id)
+
+        # Using keyset pagination when a cursor or limit is requested and
+        # falling back to classic page numbers otherwise
+        cursor_mode = 'after_id' in request.query_params or \
+            'limit' in request.query_params
+        next_cursor = None
+        try:
+            if cursor_mode:
+                after_id = decode_cursor(
+                    request.query_params.get('after_id', '0'))
+                limit = int(request.query_params.get(
+                    'limit', QUESTIONS_PER_PAGE))
+                if limit < 1 or limit > MAX_QUESTIONS_PER_PAGE:
+                    raise ValueError(limit)
+
+                rows = await database.fetch_all(selection.where(
+                    questions.c.id > after_id).limit(limit + 1))
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_cursor(rows[-1]['id'])
+            else:
+                page = int(request.query_params.get('page', 1))
+                rows = await database.fetch_all(selection.offset(
+                    (page - 1) * QUESTIONS_PER_PAGE).limit(
+                    QUESTIONS_PER_PAGE)) if page >= 1 else []
+        except ValueError:
+            raise HTTPException(400)
+
+        if len(rows) == 0:
+            raise HTTPException(404)
+
+        category_map, _ = await load_categories()
+        total_questions = await database.fetch_val(
+            select([func.count(questions.c.id)]))
+
+        response = {
+            'success': True,
+            'questions': [format_question(row) for row in rows],
+            'total_questions': total_questions,
+            'categories': category_map,
+            'current_category': None
+        }
+        if cursor_mode:
+            response['next_cursor'] = next_cursor
+
+        # Fingerprinting the page so clients can revalidate cheaply
+        etag = hashlib.md5(json.dumps(
+            response, sort_keys=True).encode('utf-8')).hexdigest()
+        return conditional_json(request, response, etag, 'no-cache')
+
+    # Creating endpoint to return only questions of a specific category
+    async def get_category_questions(request):
+        category_id = request.path_params['category_id']
+        rows = await database.fetch_all(select(QUESTION_COLUMNS).where(
+            questions.c.category == category_id))
+
+        if len(rows) == 0:
+            raise HTTPException(404)
+
+        return JSONResponse({
+            'success': True,
+            'questions': [format_question(row) for row in rows],
+            'total_questions': len(rows),
+            'current_category': category_id
+        })
+
+    # 'DELETE' ENDPOINT SETUP
+    # -------------------------------------------------------------------------
+    # Defining endpoint for deleting a question based on question_id
+    async def delete_question(request):
+        question_id = request.path_params['question_id']
+        try:
+            parsed_id = parse_id(question_id)
+        except ValueError:
+            raise HTTPException(422)
+
+        row = await database.fetch_one(select(QUESTION_COLUMNS).where(
+            questions.c.id == parsed_id))
+        if row is None:
+            raise HTTPException(404)
+
+        await database.execute(questions.delete().where(
+            questions.c.id == row['id']))
+        notify_local('delete', format_question(row))
+
+        return JSONResponse({
+            'success': True,
+            'deleted': question_id
+        })
+
+    # 'POST' ENDPOINT SETUP
+    # -------------------------------------------------------------------------
+    # Creating endpoint to add new questions
+    async def create_question(request):
+        body = await read_json(request)
+
+        question = body.get('question')
+        answer = body.get('answer')
+        difficulty = body.get('difficulty')
+        category = body.get('category')
+
+        if not (question and answer and difficulty and category):
+            raise HTTPException(422)
+
+        values = {'question': question, 'answer': answer,
+                  'difficulty': difficulty, 'category': category}
+        try:
+            question_id = await database.execute(
+                questions.insert().values(**values))
+        except Exception:
+            raise HTTPException(422)
+        notify_local('insert', dict(values, id=question_id))
+
+        return JSONResponse({
+            'success': True,
+            'created': question_id
+        })
+
+    # Creating endpoint for searching for a question based on a search term
+    async def search_questions(request):
+        body = await read_json(request)
+
+        search_term = body.get('searchTerm')
+        page = body.get('page', 1)
+        category = body.get('category')
+        difficulty = body.get('difficulty')
+
+        if not search_term:
+            raise HTTPException(404)
+        if not isinstance(search_term, str):
+            raise HTTPException(422)
+        if not isinstance(page, int) or page < 1:
+            raise HTTPException(422)
+        if not all(value is None or isinstance(value, int)
+                   for value in (category, difficulty)):
+            raise HTTPException(422)
+
+        name = search_backend_name or (
+            PostgresSearchBackend.name
+            if database.url.dialect in ('postgres', 'postgresql')
+            else InvertedIndexBackend.name)
+
+        if name == PostgresSearchBackend.name:
+            # Running the same ranked tsvector query as the Flask app
+            document = PostgresSearchBackend.document()
+            ts_query = func.to_tsquery(
+                literal_column("'{}'".format(TEXT_SEARCH_CONFIG)),
+                PostgresSearchBackend.ts_query(search_term))
+            selection = select(QUESTION_COLUMNS).where(
+                document.op('@@')(ts_query))
+            if category is not None:
+                selection = selection.where(questions.c.category == category)
+            if difficulty is not None:
+                selection = selection.where(
+                    questions.c.difficulty == difficulty)
+
+            total = await database.fetch_val(select(
+                [func.count()]).select_from(selection.alias()))
+            rows = await database.fetch_all(selection.order_by(
+                func.ts_rank(document, ts_query).desc(),
+                questions.c.id).offset(
+                (page - 1) * QUESTIONS_PER_PAGE).limit(QUESTIONS_PER_PAGE))
+        else:
+            # Ranking with the in-memory index, then loading the page
+            index = search_backends[InvertedIndexBackend.name]
+            if index.needs_load():
+                index.load([
+                    (row['id'], row['question'], row['answer'],
+                     row['category'], row['difficulty'])
+                    for row in await database.fetch_all(
+                        select(QUESTION_COLUMNS))])
+
+            page_ids, total = index.search_ids(
+                search_term, category=category, difficulty=difficulty,
+                page=page, per_page=QUESTIONS_PER_PAGE)
+            found = {row['id']: row for row in await database.fetch_all(
+                select(QUESTION_COLUMNS).where(
+                    questions.c.id.in_(page_ids)))} if page_ids else {}
+            rows = [found[question_id] for question_id in page_ids
+                    if question_id in found]
+
+        return JSONResponse({
+            'success': True,
+            'questions': [format_question(row) for row in rows],
+            'total_questions': total,
+            'current_category': category
+        })
+
+    # Loading the quiz question pool without blocking the event loop
+    async def load_quiz_pool():
+        if quiz_pool.needs_load():
+            quiz_pool.load([
+                (row['id'], row['category'])
+                for row in await database.fetch_all(
+                    select([questions.c.id, questions.c.category])
+                    .order_by(questions.c.id))])
+
+    # Creating endpoint to actually play a quiz
+    async def play_quiz(request):
+        try:
+            body = await read_json(request)
+
+            if not ('quiz_category' in body and
+                    'previous_questions' in body):
+                raise HTTPException(422)
+
+            category = body.get('quiz_category')
+            previous_questions = set(body.get('previous_questions'))
+            category_id = None if category['type'] == 'click' \
+                else category['id']
+
+            await load_quiz_pool()
+
+            # Picking a random unseen question and loading only that row
+            new_question = None
+            while True:
+                question_id = quiz_pool.choose_id(category_id,
+                                                  previous_questions)
+                if question_id is None:
+                    break
+
+                row = await database.fetch_one(select(QUESTION_COLUMNS).where(
+                    questions.c.id == question_id))
+                if row is not None:
+                    new_question = format_question(row)
+                    break
+
+                quiz_pool.remove(question_id)
+                previous_questions.add(question_id)
+
+            return JSONResponse({
+                'success': True,
+                'question': new_question
+            })
+        except Exception:
+            raise HTTPException(422)
+
+    # Creating endpoint to start a quiz session over shuffled question IDs
+    async def create_quiz_session(request):
+        body = await read_json(request)
+
+        try:
+            category = body['quiz_category']
+            category_id = None if category['type'] == 'click' \
+                else int(category['id'])
+        except (TypeError, KeyError, ValueError):
+            raise HTTPException(422)
+
+        await load_quiz_pool()
+        question_ids = quiz_pool.ids(category_id)
+        session_id = quiz_sessions.start(category_id, question_ids)
+
+        return JSONResponse({
+            'success': True,
+            'session_id': session_id,
+            'total_questions': len(question_ids),
+            'expires_in': quiz_sessions.store.ttl
+        })
+
+    # Creating endpoint to get the next question of a quiz session
+    async def next_quiz_question(request):
+        session_id = request.path_params['session_id']
+
+        # Popping IDs until one still exists
+        new_question = None
+        while True:
+            found, question_id = quiz_sessions.next_id(session_id)
+            if not found:
+                raise HTTPException(404)
+            if question_id is None:
+                break
+
+            row = await database.fetch_one(select(QUESTION_COLUMNS).where(
+                questions.c.id == question_id))
+            if row is not None:
+                new_question = format_question(row)
+                break
+
+        return JSONResponse({
+            'success': True,
+            'question': new_question
+        })
+
+    # ERROR SCENARIO HANDLING
+    # -------------------------------------------------------------------------
+    async def handle_error(request, exc):
+        return JSONResponse({
+            'success': False,
+            'error': exc.status_code,
+            'message': ERROR_MESSAGES.get(exc.status_code, exc.detail)
+        }, status_code=exc.status_code)
+
+    app = Starlette(
+        routes=[
+            Route('/categories', get_categories, methods=['GET']),
+            Route('/questions', get_questions, methods=['GET']),
+            Route('/categories/{category_id:int}/questions',
+                  get_category_questions, methods=['GET']),
+            Route('/questions/{question_id}', delete_question,
+                  methods=['DELETE']),
+            Route('/questions', create_question, methods=['POST']),
+            Route('/questions/search', search_questions, methods=['POST']),
+            Route('/quiz', play_quiz, methods=['POST']),
+            Route('/quiz/sessions', create_quiz_session, methods=['POST']),
+            Route('/quiz/sessions/{session_id}/next', next_quiz_question,
+                  methods=['GET']),
+        ],
+        middleware=[
+            # Mirroring the CORS setup of the Flask app
+            Middleware(CORSMiddleware, allow_origins=['*'],
+                       allow_headers=['Content-Type', 'Authorization'],
+                       allow_methods=['GET', 'POST', 'PUT', 'DELETE',
+                                      'OPTIONS']),
+        ],
+        exception_handlers={HTTPException: handle_error},
+        on_startup=[database.connect],
+        on_shutdown=[database.disconnect])
+    app.state.database = database
+
+    return app
+
+
+# Building the ASGI entry point ('uvicorn flaskr.asgi:app') on first access,
+# so importing this module has no side effects
+def __getattr__(name):
+    if name == 'app':
+        globals()['app'] = create_asgi_app()
+        return globals()['app']
+    raise AttributeError(name)
@@ -0,0 +1,227 @@
+import csv
+import io
+import json
+
+from models import db, notify_question_change, Question
+from .duplicates import DuplicateIndex, signature
+
+# Rows written per transaction when importing
+BULK_CHUNK_SIZE = 1000
+# Rows fetched per round trip from the server side cursor when exporting
+EXPORT_BATCH_SIZE = 1000
+# Cap on the number of row errors reported back for a single import
+MAX_REPORTED_ERRORS = 100
+
+QUESTION_FIELDS = ('question', 'answer', 'difficulty', 'category')
+
+
+# ROW PARSING / VALIDATION
+# -----------------------------------------------------------------------------
+INVALID_UTF8 = 'Invalid UTF-8'
+
+
+# Reading rows lazily from an iterable of raw request lines, so the request
+# body is never held in memory as a whole
+def parse_ndjson(lines):
+    for line_number, line in enumerate(lines, start=1):
+        try:
+            line = line.decode('utf-8').strip()
+        except UnicodeDecodeError:
+            yield line_number, None, INVALID_UTF8
+            continue
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def parse_csv(lines):
+    # Handing the reader a blank line (which it skips) for every line that
+    # is not valid UTF-8, and reporting those lines in order
+    invalid = []
+
+    def decode(lines):
+        for line_number, line in enumerate(lines, start=1):
+            try:
+                yield line.decode('utf-8')
+            except UnicodeDecodeError:
+                invalid.append(line_number)
+                yield '\n'
+
+    reader = csv.DictReader(decode(lines))
+    for row in reader:
+        while invalid:
+            yield invalid.pop(0), None, INVALID_UTF8
+        # Line numbers count the header, matching what editors show
+        yield reader.line_num, row, None
+    for line_number in invalid:
+        yield line_number, None, INVALID_UTF8
+
+
+# Checking one row and converting it to insertable column values; partial
+# rows (updates) only need to hold valid values for the fields they set
+def validate_row(row, categories, partial=False):
+    values = {}
+    for field in QUESTION_FIELDS:
+        if partial and field not in row:
+            continue
+        value = row.get(field)
+        if value is None or value == '':
+            raise ValueError('Missing {}'.format(field))
+        values[field] = value
+
+    for field in ('question', 'answer'):
+        if field in values:
+            values[field] = str(values[field]).strip()
+    try:
+        for field in ('difficulty', 'category'):
+            if field in values:
+                values[field] = int(values[field])
+    except (TypeError, ValueError):
+        raise ValueError('difficulty and category must be integers')
+
+    if 'category' in values and values['category'] not in categories:
+        raise ValueError('Unknown category {}'.format(values['category']))
+
+    return values
+
+
+# BATCH WRITES
+# -----------------------------------------------------------------------------
+# Raised when a chunk cannot be written, after the chunks before it were
+# committed; carries what was imported so far and the lines of the chunk
+class ImportFailed(Exception):
+
+    def __init__(self, created, errors, first_line, last_line):
+        super().__init__('Unable to import lines {} to {}'.format(
+            first_line, last_line))
+        self.created = created
+        self.errors = errors
+        self.first_line = first_line
+        self.last_line = last_line
+
+
+# Writing a chunk of rows with COPY on Postgres and executemany otherwise
+def insert_chunk(rows):
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[field] for field in QUESTION_FIELDS])
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                'COPY questions ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                    ', '.join(QUESTION_FIELDS)), buffer)
+        finally:
+            cursor.close()
+    else:
+        connection.execute(Question.__table__.insert(), rows)
+
+    db.session.commit()
+
+
+# Reporting a row that is a near-duplicate of a stored question or of an
+# earlier row of the same import, and indexing it otherwise
+def check_duplicate(values, line_number, duplicates, uploaded):
+    row_signature = signature(values['question'], values['answer'])
+    found = duplicates.match(row_signature, limit=1)
+    if found:
+        return 'Near-duplicate of question {}'.format(found[0]['id'])
+    found = uploaded.match(row_signature, limit=1)
+    if found:
+        return 'Near-duplicate of line {}'.format(found[0]['id'])
+    uploaded.add_signature(line_number, row_signature)
+    return None
+
+
+# Importing rows chunk by chunk, committing once per chunk; rows found near
+# duplicate by the duplicates index (if given) are skipped. Returns the number
+# of rows created and the errors of the rows that were skipped, or raises
+# ImportFailed when a chunk cannot be written
+def import_questions(rows, categories, chunk_size=BULK_CHUNK_SIZE,
+                     duplicates=None):
+    created = 0
+    errors = []
+    chunk = []
+    chunk_lines = []
+
+    # Indexing this import's rows by line number as they are accepted
+    if duplicates is not None:
+        uploaded = DuplicateIndex(duplicates.threshold,
+                                  refresh_interval=float('inf'))
+        uploaded.load([])
+
+    def write_chunk():
+        try:
+            insert_chunk(chunk)
+        except Exception as e:
+            db.session.rollback()
+            raise ImportFailed(created, errors, chunk_lines[0],
+                               chunk_lines[-1]) from e
+        return len(chunk)
+
+    try:
+        for line_number, row, error in rows:
+            if error is None:
+                try:
+                    values = validate_row(row, categories)
+                except ValueError as e:
+                    error = str(e)
+                else:
+                    if duplicates is not None:
+                        error = check_duplicate(values, line_number,
+                                                duplicates, uploaded)
+                    if error is None:
+                        chunk.append(values)
+                        chunk_lines.append(line_number)
+
+            if error is not None:
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_number, 'message': error})
+                continue
+
+            if len(chunk) >= chunk_size:
+                created += write_chunk()
+                chunk, chunk_lines = [], []
+
+        if chunk:
+            created += write_chunk()
+    finally:
+        # Letting caches and in-memory indexes rebuild after a bulk change
+        if created:
+            notify_question_change('reload', None)
+
+    return created, errors
+
+
+# Streaming questions as NDJSON from a server side cursor, so memory use does
+# not grow with the size of the table
+def export_questions(category=None):
+    query = db.session.query(
+        Question.id, Question.question, Question.answer, Question.category,
+        Question.difficulty).order_by(Question.id)
+    if category is not None:
+        query = query.filter(Question.category == category)
+
+    rows = query.execution_options(stream_results=True).yield_per(
+        EXPORT_BATCH_SIZE)
+    for question_id, question, answer, category, difficulty in rows:
+        yield json.dumps({
+            'id': question_id,
+            'question': question,
+            'answer': answer,
+            'category': category,
+            'difficulty': difficulty
+        }) + '\n'
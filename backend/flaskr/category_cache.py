@@ -0,0 +1,76 @@
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import event
+
+from models import Category
+
+# Seconds the category map is served from memory before being reloaded; this
+# is also the max-age browsers and CDNs may reuse GET /categories for
+CATEGORY_CACHE_TTL = 300
+
+
+# CATEGORY CACHE
+# -----------------------------------------------------------------------------
+# Keeping the {id: type} category map in memory, since categories almost
+# never change but are needed by several routes on every request
+class CategoryCache:
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories = None
+        self._etag = None
+        self._loaded_at = 0
+
+    # Dropping the cached map so the next request reloads it
+    def invalidate(self):
+        with self._lock:
+            self._categories = None
+            self._etag = None
+
+    # Fingerprinting (id, type) rows ordered by type, queried unless the
+    # caller already has them
+    def load(self, rows=None):
+        if rows is None:
+            rows = [(category.id, category.type) for category in
+                    Category.query.order_by(Category.type).all()]
+
+        categories = {category_id: category_type
+                      for category_id, category_type in rows}
+        etag = hashlib.sha1(json.dumps(
+            sorted(categories.items())).encode('utf-8')).hexdigest()
+
+        with self._lock:
+            self._categories = categories
+            self._etag = etag
+            self._loaded_at = time.monotonic()
+
+        return categories, etag
+
+    # Returning the cached category map and ETag, or None if missing or
+    # expired
+    def cached(self):
+        with self._lock:
+            fresh = time.monotonic() - self._loaded_at <= self.ttl
+            if self._categories is not None and fresh:
+                return self._categories, self._etag
+        return None
+
+    # Returning the category map along with its strong ETag value
+    def get(self):
+        return self.cached() or self.load()
+
+
+# Process wide cache, shared by every route that needs the category map
+category_cache = CategoryCache()
+
+
+# Invalidating the cache whenever categories are written in-process
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def invalidate_category_cache(mapper, connection, target):
+    category_cache.invalidate()
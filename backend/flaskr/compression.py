@@ -0,0 +1,117 @@
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is an optional dependency
+    brotli = None
+
+# Bodies smaller than this (bytes) are sent as they are, since compressing
+# them saves little and costs CPU on both ends
+COMPRESSION_THRESHOLD = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson',
+                          'text/csv', 'text/plain')
+
+
+# COMPRESSION
+# -----------------------------------------------------------------------------
+# Compressing responses with the best encoding the client accepts (brotli
+# when installed, then gzip); streamed responses are compressed chunk by
+# chunk, so they stay streamed
+class Compression:
+
+    def __init__(self, threshold=COMPRESSION_THRESHOLD, gzip_level=GZIP_LEVEL,
+                 brotli_quality=BROTLI_QUALITY):
+        self.threshold = threshold
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def encodings(self):
+        return (['br'] if brotli is not None else []) + ['gzip']
+
+    # Picking an encoding from the Accept-Encoding header, honouring q=0
+    def negotiate(self):
+        return request.accept_encodings.best_match(self.encodings())
+
+    def compress_response(self, response):
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES or \
+                'Content-Encoding' in response.headers:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(
+                response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.threshold:
+                return response
+            response.set_data(self.compress(data, encoding))
+
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag names one exact byte sequence, which the compressed
+        # body no longer is
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    # Compressing an iterable of chunks, flushing after each chunk so the
+    # client keeps receiving data as it is produced
+    def compress_stream(self, chunks, encoding):
+        try:
+            if encoding == 'br':
+                compressor = brotli.Compressor(quality=self.brotli_quality)
+                for chunk in chunks:
+                    yield compressor.process(to_bytes(chunk)) + \
+                        compressor.flush()
+                yield compressor.finish()
+            else:
+                compressor = zlib.compressobj(
+                    self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                for chunk in chunks:
+                    yield compressor.compress(to_bytes(chunk)) + \
+                        compressor.flush(zlib.Z_SYNC_FLUSH)
+                yield compressor.flush()
+        finally:
+            # Letting the wrapped stream release its context / cursor even if
+            # the client goes away early
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+def to_bytes(chunk):
+    return chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+# Building compression from create_app's 'compression' setting: None for the
+# defaults, False to turn it off, or a dict of Compression options (e.g.
+# {'threshold': 512})
+def make_compression(setting=None):
+    if setting is False:
+        return None
+    if setting is None or setting is True:
+        return Compression()
+    return Compression(**setting)
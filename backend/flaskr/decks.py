@@ -0,0 +1,407 @@
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+
+from models import db, on_question_change, Question
+
+# Strategy name for POST /quiz serving questions from the decks
+DECK_STRATEGY = 'deck'
+# Shuffled orders written per deck file
+DECKS_PER_CATEGORY = 32
+# Seconds between rebuilds of decks whose questions changed in-process (in
+# the meantime deleted questions are skipped)
+REBUILD_INTERVAL = 10
+# Seconds before the decks are checked against the database for changes
+# made by other processes
+REFRESH_INTERVAL = 300
+
+# Key and file name of the deck holding every question regardless of category
+ALL_CATEGORIES = None
+ALL_CATEGORIES_FILE = 'all.deck'
+CATEGORY_FILE = 'category_{}.deck'
+
+# File layout (little endian): a header, one fixed size record per question,
+# the shuffled orders as arrays of record positions, then the UTF-8 text of
+# every question and answer
+DECK_MAGIC = b'TQDK'
+DECK_VERSION = 1
+# magic, version, category (0 for all), questions, orders, then the
+# (question count, max id, id sum) fingerprint of the source rows
+HEADER = struct.Struct('<4sHxxiIIIIq')
+# id, category, difficulty, question offset / length, answer offset / length
+RECORD = struct.Struct('<iiiIIII')
+POSITION = struct.Struct('<I')
+
+
+# DECK FILES
+# -----------------------------------------------------------------------------
+# Ordering questions so every stretch of a deck mixes difficulties in the
+# same proportions as the whole category: each difficulty is shuffled, then
+# its questions are spread evenly (with jitter) along the deck
+def balanced_order(difficulties, rng=random):
+    by_difficulty = {}
+    for position, difficulty in enumerate(difficulties):
+        by_difficulty.setdefault(difficulty, []).append(position)
+
+    slots = []
+    for positions in by_difficulty.values():
+        rng.shuffle(positions)
+        count = len(positions)
+        slots.extend(((index + rng.random()) / count, position)
+                     for index, position in enumerate(positions))
+    slots.sort()
+    return [position for _, position in slots]
+
+
+# Writing questions (format() dicts) and their shuffled orders to path,
+# through a temporary file so readers never see a half written deck
+def write_deck(path, category, questions, fingerprint,
+               deck_count=DECKS_PER_CATEGORY, rng=random):
+    deck_count = deck_count if questions else 0
+    strings = bytearray()
+    records = bytearray()
+    for question in questions:
+        text = (question['question'] or '').encode('utf-8')
+        answer = (question['answer'] or '').encode('utf-8')
+        records += RECORD.pack(
+            question['id'], question['category'] or 0,
+            question['difficulty'] or 0, len(strings), len(text),
+            len(strings) + len(text), len(answer))
+        strings += text + answer
+
+    difficulties = [question['difficulty'] for question in questions]
+    orders = bytearray()
+    for _ in range(deck_count):
+        for position in balanced_order(difficulties, rng):
+            orders += POSITION.pack(position)
+
+    count, max_id, id_sum = fingerprint
+    header = HEADER.pack(DECK_MAGIC, DECK_VERSION, category or 0,
+                         len(questions), deck_count, count, max_id, id_sum)
+
+    directory = os.path.dirname(path) or '.'
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory,
+                                                  suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as deck_file:
+            deck_file.write(header + records + orders + strings)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+# Read-only, memory mapped view of a deck file; questions are decoded only
+# when served
+class Deck:
+
+    def __init__(self, path):
+        with open(path, 'rb') as deck_file:
+            self._map = mmap.mmap(deck_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        magic, version, category, count, deck_count, *fingerprint = \
+            HEADER.unpack_from(self._map)
+        if magic != DECK_MAGIC or version != DECK_VERSION:
+            self._map.close()
+            raise ValueError('Not a quiz deck: {}'.format(path))
+
+        self.path = path
+        self.category = category or ALL_CATEGORIES
+        self.count = count
+        self.deck_count = deck_count
+        self.fingerprint = tuple(fingerprint)
+        self._orders_offset = HEADER.size + count * RECORD.size
+        self._strings_offset = self._orders_offset + \
+            deck_count * count * POSITION.size
+        self._orders = memoryview(self._map)[
+            self._orders_offset:self._strings_offset].cast('I')
+
+        # Remembering which order starts with which question, so a quiz can
+        # be followed from its first question
+        self._first = {}
+        for deck_index in range(deck_count):
+            self._first.setdefault(self.id(self.order(deck_index)[0]),
+                                   deck_index)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._orders.release()
+        self._map.close()
+
+    def order(self, deck_index):
+        return self._orders[deck_index * self.count:
+                            (deck_index + 1) * self.count]
+
+    # Picking the order a quiz starting with first_id follows
+    def deck_for(self, first_id):
+        deck_index = self._first.get(first_id)
+        return deck_index if deck_index is not None \
+            else first_id % self.deck_count
+
+    def id(self, position):
+        return struct.unpack_from(
+            '<i', self._map, HEADER.size + position * RECORD.size)[0]
+
+    def question(self, position):
+        question_id, category, difficulty, question_offset, question_length, \
+            answer_offset, answer_length = RECORD.unpack_from(
+                self._map, HEADER.size + position * RECORD.size)
+        start = self._strings_offset
+        return {
+            'id': question_id,
+            'question': self._map[start + question_offset:start +
+                                  question_offset + question_length].decode(
+                'utf-8'),
+            'answer': self._map[start + answer_offset:start + answer_offset +
+                                answer_length].decode('utf-8'),
+            'category': category,
+            'difficulty': difficulty
+        }
+
+    def questions(self):
+        return [self.question(position) for position in range(self.count)]
+
+
+# BUILDING DECKS
+# -----------------------------------------------------------------------------
+def deck_path(directory, category):
+    name = ALL_CATEGORIES_FILE if category is ALL_CATEGORIES \
+        else CATEGORY_FILE.format(category)
+    return os.path.join(directory, name)
+
+
+def read_fingerprint(path):
+    try:
+        with open(path, 'rb') as deck_file:
+            header = deck_file.read(HEADER.size)
+        magic, version, _, _, _, *fingerprint = HEADER.unpack(header)
+    except (OSError, struct.error):
+        return None
+    if magic != DECK_MAGIC or version != DECK_VERSION:
+        return None
+    return tuple(fingerprint)
+
+
+# Summarising each category's questions as (count, max id, id sum) with one
+# GROUP BY over the (category, id) index; any insert or delete changes it.
+# Uncategorised questions have no deck
+def category_fingerprints():
+    return {int(category): (count, max_id, int(id_sum)) for
+            category, count, max_id, id_sum in db.session.query(
+                Question.category, func.count(Question.id),
+                func.max(Question.id), func.sum(Question.id)).filter(
+                Question.category.isnot(None)).group_by(
+                Question.category)}
+
+
+# Rebuilding the decks of categories whose questions changed (by comparing
+# fingerprints, or because they are listed in categories), then the deck of
+# every question from the category decks; returns the rebuilt categories,
+# ALL_CATEGORIES included
+def build_decks(directory, deck_count=DECKS_PER_CATEGORY, categories=(),
+                full=False, rng=random):
+    os.makedirs(directory, exist_ok=True)
+    fingerprints = category_fingerprints()
+
+    rebuilt = []
+    for category, fingerprint in sorted(fingerprints.items()):
+        path = deck_path(directory, category)
+        if not full and category not in categories and \
+                read_fingerprint(path) == fingerprint:
+            continue
+
+        questions = [{'id': row[0], 'question': row[1], 'answer': row[2],
+                      'category': row[3], 'difficulty': row[4]}
+                     for row in db.session.query(
+                         Question.id, Question.question, Question.answer,
+                         Question.category, Question.difficulty).filter(
+                         Question.category == category).order_by(Question.id)]
+        write_deck(path, category, questions, fingerprint, deck_count, rng)
+        rebuilt.append(category)
+
+    # Removing decks of categories left without questions
+    for name in os.listdir(directory):
+        prefix, suffix = CATEGORY_FILE.split('{}')
+        if name.startswith(prefix) and name.endswith(suffix):
+            category = name[len(prefix):-len(suffix)]
+            if category.isdigit() and int(category) not in fingerprints:
+                os.unlink(os.path.join(directory, name))
+                rebuilt.append(int(category))
+
+    # Merging the category decks into the deck of every question, without
+    # reading unchanged categories from the database again
+    all_path = deck_path(directory, ALL_CATEGORIES)
+    all_fingerprint = (sum(count for count, _, _ in fingerprints.values()),
+                       max([max_id for _, max_id, _ in
+                            fingerprints.values()] or [0]),
+                       sum(id_sum for _, _, id_sum in fingerprints.values()))
+    if rebuilt or full or read_fingerprint(all_path) != all_fingerprint:
+        questions = []
+        for category in sorted(fingerprints):
+            deck = Deck(deck_path(directory, category))
+            try:
+                questions.extend(deck.questions())
+            finally:
+                deck.close()
+        write_deck(all_path, ALL_CATEGORIES, questions, all_fingerprint,
+                   deck_count, rng)
+        rebuilt.append(ALL_CATEGORIES)
+
+    return rebuilt
+
+
+# QUIZ DECKS
+# -----------------------------------------------------------------------------
+# Serving quiz turns straight from the memory mapped decks, with no database
+# round trip: a quiz follows the order starting with its first question, so
+# each turn normally takes the next entry of that order
+class QuizDecks:
+
+    def __init__(self, directory=None, deck_count=DECKS_PER_CATEGORY,
+                 rebuild_interval=REBUILD_INTERVAL,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.directory = directory
+        self.deck_count = deck_count
+        self.rebuild_interval = rebuild_interval
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._decks = {}
+        self._deleted = set()
+        self._changed = set()
+        self._ready = False
+        self._checked_at = None
+        self._rebuilt_at = 0
+
+    def configure(self, directory=None, deck_count=DECKS_PER_CATEGORY):
+        with self._lock:
+            self._close()
+            self.directory = directory
+            self.deck_count = deck_count
+            self._deleted = set()
+            self._changed = set()
+            self._ready = False
+            self._checked_at = None
+
+    def _close(self):
+        for deck in self._decks.values():
+            deck.close()
+        self._decks = {}
+
+    # Checking the decks against the database when first used, every
+    # refresh interval and after local changes (at most once per rebuild
+    # interval), rebuilding only categories that changed
+    def _due(self):
+        now = time.monotonic()
+        return not self._ready or self._checked_at is None or \
+            now - self._checked_at > self.refresh_interval or \
+            bool(self._changed and now - self._rebuilt_at >
+                 self.rebuild_interval)
+
+    # Rebuilding in one thread at a time, outside the lock turns are served
+    # under: build_decks writes new files next to the open ones and moves
+    # them into place, so other turns keep reading the old memory maps (and
+    # only wait when there are no decks yet) until they are swapped
+    def _ensure_built(self):
+        with self._lock:
+            if not self._due():
+                return
+            ready = self._ready
+        if not self._build_lock.acquire(blocking=not ready):
+            return
+
+        try:
+            with self._lock:
+                if not self._due():
+                    return
+                changed, self._changed = self._changed, set()
+                deleted = set(self._deleted)
+                checked_at = self._checked_at
+                # Marking the check as done, so other turns do not start one
+                # too; a reload while building clears it again
+                self._checked_at = time.monotonic()
+
+            try:
+                build_decks(self.directory, self.deck_count,
+                            categories=changed)
+            except Exception:
+                with self._lock:
+                    self._changed |= changed
+                    self._checked_at = checked_at
+                raise
+
+            # Swapping in the new files by reopening every deck, since
+            # another process may have replaced files this one did not
+            # rebuild; deletes made while building stay skipped
+            with self._lock:
+                self._rebuilt_at = time.monotonic()
+                self._deleted -= deleted
+                self._ready = True
+                self._close()
+        finally:
+            self._build_lock.release()
+
+    def _deck(self, key):
+        deck = self._decks.get(key)
+        if deck is None:
+            path = deck_path(self.directory, key)
+            if not os.path.exists(path):
+                return None
+            deck = self._decks[key] = Deck(path)
+        return deck
+
+    # Returning the next unseen question (as a format() dict) for a quiz in
+    # category, or None once every question has been used
+    def choose(self, category=ALL_CATEGORIES, previous_questions=()):
+        if self.directory is None:
+            raise RuntimeError('Quiz decks are not configured')
+
+        key = ALL_CATEGORIES if category is None else int(category)
+        self._ensure_built()
+        with self._lock:
+            deck = self._deck(key)
+            if deck is None or not len(deck):
+                return None
+
+            seen = set(previous_questions)
+            if previous_questions:
+                order = deck.order(deck.deck_for(previous_questions[0]))
+                start = len(previous_questions) % len(deck)
+            else:
+                order = deck.order(random.randrange(deck.deck_count))
+                start = 0
+
+            for step in range(len(deck)):
+                position = order[(start + step) % len(deck)]
+                question_id = deck.id(position)
+                if question_id not in seen and \
+                        question_id not in self._deleted:
+                    return deck.question(position)
+            return None
+
+    # Skipping deleted questions right away and rebuilding changed
+    # categories on a later turn
+    def handle_change(self, action, question):
+        with self._lock:
+            if action == 'reload':
+                self._checked_at = None
+                return
+            if action == 'delete':
+                self._deleted.add(question['id'])
+            if question['category'] is not None:
+                self._changed.add(int(question['category']))
+
+
+# Process wide decks, configured by create_app() and kept up to date by
+# Question.insert() / Question.delete()
+quiz_decks = QuizDecks()
+on_question_change(quiz_decks.handle_change)
@@ -0,0 +1,247 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    numpy = None
+
+from models import db, on_question_change, Question
+
+# Options of the dedupe query parameter: 'reject' refuses near-duplicates,
+# 'warn' creates the question and lists its near-duplicates
+REJECT = 'reject'
+WARN = 'warn'
+DEDUPE_MODES = (REJECT, WARN)
+# Length of the character shingles compared between questions
+SHINGLE_SIZE = 4
+# MinHash signatures hold BANDS x ROWS values; questions sharing every value
+# of any band become candidates, which with 16 x 4 finds ~99% of pairs at 0.7
+# similarity and few pairs under 0.3
+BANDS = 16
+ROWS = 4
+# Estimated Jaccard similarity from which a question is a near-duplicate
+DUPLICATE_THRESHOLD = 0.7
+# Most near-duplicates reported for one question
+MAX_DUPLICATES = 10
+# Seconds before the index reloads itself to pick up changes from other
+# processes (local inserts / deletes are applied immediately)
+REFRESH_INTERVAL = 300
+
+# Hash functions (a * x + b) mod p, from a fixed seed so signatures agree
+# between processes and runs; a 31 bit prime keeps every product within a
+# machine word, which Python multiplies much faster
+MERSENNE_PRIME = (1 << 31) - 1
+_rng = random.Random(2020)
+HASH_FUNCTIONS = [(_rng.randrange(1, MERSENNE_PRIME),
+                   _rng.randrange(MERSENNE_PRIME))
+                  for _ in range(BANDS * ROWS)]
+if numpy is not None:
+    HASH_A = numpy.array([a for a, _ in HASH_FUNCTIONS],
+                         dtype=numpy.uint64)[:, None]
+    HASH_B = numpy.array([b for _, b in HASH_FUNCTIONS],
+                         dtype=numpy.uint64)[:, None]
+
+
+# SIGNATURES
+# -----------------------------------------------------------------------------
+# Lowercasing and dropping punctuation and extra spaces, so rewordings that
+# only differ in those still match
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', str(text or '').lower()).split())
+
+
+# Hashing the character shingles of a question and its answer together
+def shingles(question, answer):
+    text = '{} | {}'.format(normalize(question), normalize(answer))
+    count = max(1, len(text) - SHINGLE_SIZE + 1)
+    return {int.from_bytes(hashlib.blake2b(
+        text[start:start + SHINGLE_SIZE].encode('utf-8'),
+        digest_size=4).digest(), 'little') % MERSENNE_PRIME
+        for start in range(count)}
+
+
+# Keeping the smallest value of each hash function over the shingles; the
+# share of equal values between two signatures estimates the Jaccard
+# similarity of their shingle sets (computed with numpy when installed, which
+# is several times faster, with the same results)
+def signature(question, answer):
+    hashes = shingles(question, answer)
+    if numpy is not None:
+        values = numpy.fromiter(hashes, numpy.uint64, len(hashes))
+        return array('L', ((HASH_A * values + HASH_B) % MERSENNE_PRIME).min(
+            axis=1).tolist())
+    return array('L', [min([(a * value + b) % MERSENNE_PRIME
+                            for value in hashes])
+                       for a, b in HASH_FUNCTIONS])
+
+
+def similarity(first, second):
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+def band_keys(values):
+    return [hash(tuple(values[band * ROWS:(band + 1) * ROWS]))
+            for band in range(BANDS)]
+
+
+# DUPLICATE INDEX
+# -----------------------------------------------------------------------------
+# Locality sensitive hashing over MinHash signatures: each band of a
+# signature is a bucket key, so a lookup only compares a question with the
+# few questions sharing one of its buckets instead of the whole table
+class DuplicateIndex:
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._signatures = None
+        self._buckets = None
+        self._loaded_at = 0
+
+    # Dropping the index so it gets rebuilt on next use
+    def reset(self):
+        with self._lock:
+            self._signatures = None
+            self._buckets = None
+
+    # Building the index from (id, question, answer) rows, queried unless
+    # the caller already has them
+    def load(self, rows=None):
+        if rows is None:
+            rows = db.session.query(
+                Question.id, Question.question, Question.answer).order_by(
+                Question.id)
+
+        signatures = {}
+        buckets = [{} for _ in range(BANDS)]
+        for question_id, question, answer in rows:
+            self._add(signatures, buckets, question_id,
+                      signature(question, answer))
+
+        with self._lock:
+            self._signatures = signatures
+            self._buckets = buckets
+            self._loaded_at = time.monotonic()
+
+    def needs_load(self):
+        expired = time.monotonic() - self._loaded_at > self.refresh_interval
+        return self._signatures is None or expired
+
+    def _ensure_loaded(self):
+        if self.needs_load():
+            self.load()
+
+    @staticmethod
+    def _add(signatures, buckets, question_id, values):
+        signatures[question_id] = values
+        for band, key in enumerate(band_keys(values)):
+            buckets[band].setdefault(key, set()).add(question_id)
+
+    def add(self, question_id, question, answer):
+        self.add_signature(question_id, signature(question, answer))
+
+    def add_signature(self, question_id, values):
+        with self._lock:
+            if self._signatures is None:
+                return
+            self._add(self._signatures, self._buckets, question_id, values)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._signatures is None:
+                return
+
+            values = self._signatures.pop(question_id, None)
+            if values is None:
+                return
+            for band, key in enumerate(band_keys(values)):
+                bucket = self._buckets[band].get(key)
+                bucket.discard(question_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    # Keeping the index in sync with questions created or deleted in-process
+    def handle_change(self, action, question):
+        if action == 'insert':
+            self.add(question['id'], question['question'], question['answer'])
+        elif action == 'delete':
+            self.remove(question['id'])
+        elif action == 'reload':
+            self.reset()
+
+    # Returning the near-duplicates of a question as {'id', 'similarity'}
+    # dicts, most similar first
+    def find(self, question, answer, limit=MAX_DUPLICATES):
+        return self.match(signature(question, answer), limit)
+
+    def match(self, values, limit=MAX_DUPLICATES):
+        self._ensure_loaded()
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(band_keys(values)):
+                candidates.update(self._buckets[band].get(key, ()))
+            scored = [(similarity(values, self._signatures[candidate]),
+                       candidate) for candidate in candidates]
+
+        duplicates = sorted(
+            ((score, candidate) for score, candidate in scored
+             if score >= self.threshold), key=lambda item: (-item[0], item[1]))
+        return [{'id': candidate, 'similarity': round(score, 2)}
+                for score, candidate in duplicates[:limit]]
+
+    # Grouping every question with its near-duplicates, comparing only
+    # questions that share a bucket and joining matches with union-find;
+    # returns the clusters (sorted lists of IDs), largest first
+    def clusters(self, threshold=None):
+        self._ensure_loaded()
+        threshold = self.threshold if threshold is None else threshold
+
+        with self._lock:
+            signatures = self._signatures
+            buckets = [list(band.values()) for band in self._buckets]
+
+        parents = {}
+
+        def find_root(question_id):
+            root = question_id
+            while parents.get(root, root) != root:
+                root = parents[root]
+            # Pointing the whole path at the root, so later finds are short
+            while question_id != root:
+                parents[question_id], question_id = root, parents[question_id]
+            return root
+
+        for band in buckets:
+            for bucket in band:
+                if len(bucket) < 2:
+                    continue
+                members = sorted(bucket)
+                for position, first in enumerate(members):
+                    for second in members[position + 1:]:
+                        first_root, second_root = find_root(first), \
+                            find_root(second)
+                        if first_root != second_root and similarity(
+                                signatures[first],
+                                signatures[second]) >= threshold:
+                            parents[max(first_root, second_root)] = \
+                                min(first_root, second_root)
+
+        clusters = {}
+        for question_id in set(parents) | set(parents.values()):
+            clusters.setdefault(find_root(question_id), []).append(
+                question_id)
+        return sorted((sorted(cluster) for cluster in clusters.values()
+                       if len(cluster) > 1),
+                      key=lambda cluster: (-len(cluster), cluster[0]))
+
+
+# Process wide index, kept up to date by Question.insert() / Question.delete()
+duplicate_index = DuplicateIndex()
+on_question_change(duplicate_index.handle_change)
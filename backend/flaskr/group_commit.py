@@ -0,0 +1,259 @@
+import atexit
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+
+from models import db, notify_question_change
+from .mutations import insert_questions
+
+logger = logging.getLogger(__name__)
+
+# Write modes for POST /questions: 'group_commit' waits for the shared
+# transaction and returns the new ID, 'async' answers 202 right away
+GROUP_COMMIT = 'group_commit'
+ASYNC = 'async'
+WRITE_MODES = (GROUP_COMMIT, ASYNC)
+# Seconds the writer waits for more inserts after the first one of a group
+GROUP_COMMIT_WINDOW = 0.005
+# Most inserts written in one transaction
+MAX_GROUP_SIZE = 500
+# Most inserts waiting to be written; further requests get a 503
+MAX_PENDING = 10000
+# Seconds a request waits for a queue slot, then for its group to commit
+# (after which it gets a 202 with a status URL instead)
+SUBMIT_TIMEOUT = 0.1
+WAIT_TIMEOUT = 5
+# Seconds the outcome of an insert stays available from its status URL
+STATUS_TTL = 600
+
+
+class WriterBusy(Exception):
+    pass
+
+
+# One queued insert; done is set once it is written or has failed
+class PendingInsert:
+
+    def __init__(self, row):
+        self.ticket = secrets.token_urlsafe(12)
+        self.row = row
+        self.id = None
+        self.error = None
+        self.done = threading.Event()
+        self.created_at = time.monotonic()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def status(self):
+        if not self.done.is_set():
+            return 'pending'
+        return 'failed' if self.error is not None else 'created'
+
+
+# GROUP COMMIT WRITER
+# -----------------------------------------------------------------------------
+# Collecting inserts from concurrent requests and writing each group in one
+# transaction, so a burst of POST /questions pays for one commit (and one
+# fsync) instead of one per request; the writer thread starts on first use,
+# so forked workers each start their own
+class GroupCommitWriter:
+
+    def __init__(self):
+        self.mode = None
+        self.app = None
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._reset()
+
+    def _reset(self):
+        self._queue = None
+        self._thread = None
+
+    def configure(self, app=None, mode=None, window=GROUP_COMMIT_WINDOW,
+                  max_group_size=MAX_GROUP_SIZE, max_pending=MAX_PENDING,
+                  submit_timeout=SUBMIT_TIMEOUT, wait_timeout=WAIT_TIMEOUT,
+                  status_ttl=STATUS_TTL):
+        if mode is not None and mode not in WRITE_MODES:
+            raise ValueError('Unknown write mode: {}'.format(mode))
+
+        # Flushing inserts queued for a previously configured app
+        self.shutdown()
+        self.app = app
+        self.mode = mode
+        self.window = window
+        self.max_group_size = max_group_size
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+        self.wait_timeout = wait_timeout
+        self.status_ttl = status_ttl
+
+    # Giving a forked process its own lock, queue and thread
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._reset()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=self.max_pending)
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,),
+                    name='group-commit-writer', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    # Queueing a row of question values; raises WriterBusy when the queue
+    # stays full
+    def submit(self, row):
+        pending_queue = self._start()
+        pending = PendingInsert(row)
+        try:
+            pending_queue.put(pending, timeout=self.submit_timeout)
+        except queue.Full:
+            raise WriterBusy()
+
+        with self._lock:
+            self._purge()
+            self._statuses[pending.ticket] = pending
+        return pending
+
+    def status(self, ticket):
+        with self._lock:
+            return self._statuses.get(ticket)
+
+    # Dropping outcomes nobody asked for within the status TTL
+    def _purge(self):
+        expired_before = time.monotonic() - self.status_ttl
+        expired = [ticket for ticket, pending in self._statuses.items()
+                   if pending.done.is_set() and
+                   pending.created_at < expired_before]
+        for ticket in expired:
+            del self._statuses[ticket]
+
+    # Writing every queued insert and stopping the writer thread
+    def shutdown(self, timeout=None):
+        with self._lock:
+            thread, pending_queue = self._thread, self._queue
+            self._reset()
+        if thread is not None:
+            pending_queue.put(None)
+            thread.join(timeout)
+
+    # WRITER THREAD
+    # -------------------------------------------------------------------------
+    def _run(self, pending_queue):
+        try:
+            self._drain(pending_queue)
+        finally:
+            # Letting the next submit start a new writer if this one died,
+            # and failing whatever it left queued rather than leaving it
+            # pending forever
+            with self._lock:
+                if self._queue is pending_queue:
+                    self._reset()
+            while True:
+                try:
+                    pending = pending_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is not None:
+                    self._fail([pending])
+
+    def _drain(self, pending_queue):
+        stopping = False
+        while not stopping:
+            first = pending_queue.get()
+            if first is None:
+                break
+
+            # Gathering whatever else arrives within the window
+            group = [first]
+            deadline = time.monotonic() + self.window
+            while len(group) < self.max_group_size:
+                try:
+                    pending = pending_queue.get(
+                        timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                group.append(pending)
+            self._write_group(group)
+
+        # Flushing anything still queued when asked to stop
+        group = []
+        while True:
+            try:
+                pending = pending_queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not None:
+                group.append(pending)
+        for start in range(0, len(group), self.max_group_size):
+            self._write_group(group[start:start + self.max_group_size])
+
+    # Writing a group, failing any of its inserts left unanswered by an
+    # unexpected error so the writer thread keeps running
+    def _write_group(self, group):
+        try:
+            self._write(group)
+        except Exception:
+            logger.exception('Unable to write question group')
+            self._fail([pending for pending in group
+                        if not pending.done.is_set()])
+
+    @staticmethod
+    def _fail(group):
+        for pending in group:
+            pending.error = 'Unable to create question'
+            pending.done.set()
+
+    def _write(self, group):
+        with self.app.app_context():
+            try:
+                ids = insert_questions([pending.row for pending in group])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Retrying one insert per transaction, so a bad row only
+                # fails its own request
+                if len(group) > 1:
+                    for pending in group:
+                        self._write([pending])
+                    return
+                self._fail(group)
+                return
+
+            # Notifying listeners (caches, quiz pools) before answering, so
+            # callers never read their own write from a stale cache. Each
+            # row is sent as its own insert, which listeners apply
+            # incrementally, rather than a 'reload' that would make every
+            # index rebuild from the whole table after each group; the
+            # questions are committed either way, so a failing listener is
+            # logged rather than failing the inserts
+            for pending, question_id in zip(group, ids):
+                pending.id = question_id
+            try:
+                for pending in group:
+                    try:
+                        notify_question_change(
+                            'insert', dict(pending.row, id=pending.id))
+                    except Exception:
+                        logger.exception(
+                            'Unable to notify question listeners')
+            finally:
+                for pending in group:
+                    pending.done.set()
+
+
+# Process wide writer, configured by create_app() and flushed at exit
+question_writer = GroupCommitWriter()
+atexit.register(question_writer.shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=question_writer.after_fork)
@@ -0,0 +1,245 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db, replica_bind
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+# Upper bounds of the per-request SQL statement count histogram buckets
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+# Statements slower than this (milliseconds) are logged
+SLOW_QUERY_MS = 100
+# Running the same statement this many times in one request is reported as
+# an N+1 query pattern
+N_PLUS_ONE_THRESHOLD = 10
+
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# METRICS
+# -----------------------------------------------------------------------------
+# Minimal Prometheus counters and histograms, keyed by label values
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} counter'.format(self.name)]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append('{}{} {}'.format(
+                    self.name, format_labels(self.labels, label_values),
+                    value))
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, label_values, value):
+        with self._lock:
+            counts, total = self._values.get(
+                label_values, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            for label_values, (counts, total) in sorted(
+                    self._values.items()):
+                # Prometheus buckets are cumulative
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(
+                        self.name, format_labels(
+                            self.labels, label_values, [('le', bound)]),
+                        cumulative))
+                labels = format_labels(self.labels, label_values)
+                lines.append('{}_sum{} {}'.format(self.name, labels, total))
+                lines.append('{}_count{} {}'.format(
+                    self.name, labels, cumulative))
+        return lines
+
+
+# INSTRUMENTATION
+# -----------------------------------------------------------------------------
+# Timing every request and the SQL it runs, through Flask request hooks and
+# SQLAlchemy cursor events; nothing is hooked up unless init_app() is called,
+# so a disabled app pays no cost at all
+class Instrumentation:
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS,
+                 n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+        self.request_duration = Histogram(
+            'trivia_request_duration_seconds', 'Request latency',
+            ('method', 'route', 'status'))
+        self.request_statements = Histogram(
+            'trivia_request_sql_statements', 'SQL statements per request',
+            ('route',), STATEMENT_BUCKETS)
+        self.sql_duration = Counter(
+            'trivia_sql_duration_seconds_total',
+            'Time spent running SQL statements', ('route',))
+        self.slow_queries = Counter(
+            'trivia_slow_queries_total',
+            'SQL statements slower than the slow query threshold',
+            ('route',))
+        self.n_plus_one = Counter(
+            'trivia_n_plus_one_total',
+            'Requests repeating one SQL statement past the N+1 threshold',
+            ('route',))
+        self.metrics = [self.request_duration, self.request_statements,
+                        self.sql_duration, self.slow_queries,
+                        self.n_plus_one]
+
+    def init_app(self, app):
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+        # Waiting for the first request to create the engines, so building
+        # the app never connects
+        app.before_first_request(lambda: self.listen(app))
+
+    # Listening on the primary engine and the read replica, if any
+    def listen(self, app):
+        engines = [db.get_engine(app)]
+        if replica_bind in (app.config.get('SQLALCHEMY_BINDS') or {}):
+            engines.append(db.get_engine(app, bind=replica_bind))
+        for engine in engines:
+            if not event.contains(engine, 'before_cursor_execute',
+                                  self.before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute',
+                             self.before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute',
+                             self.after_cursor_execute)
+
+    # REQUEST HOOKS
+    # -------------------------------------------------------------------------
+    def start_request(self):
+        g.instrumentation = {
+            'started': time.perf_counter(),
+            'statements': {},
+            'statement_count': 0,
+            'db_time': 0.0
+        }
+
+    def finish_request(self, response):
+        state = g.pop('instrumentation', None)
+        if state is None:
+            return response
+
+        elapsed = time.perf_counter() - state['started']
+        route = self.route()
+        self.request_duration.observe(
+            (request.method, route, response.status_code), elapsed)
+        self.request_statements.observe((route,), state['statement_count'])
+        if state['db_time']:
+            self.sql_duration.inc((route,), state['db_time'])
+
+        # Reporting statements repeated often enough to suggest a query per
+        # row where one query for all rows would do
+        repeated = {statement: count for statement, count in
+                    state['statements'].items()
+                    if count >= self.n_plus_one_threshold}
+        if repeated:
+            self.n_plus_one.inc((route,))
+            for statement, count in repeated.items():
+                logger.warning('Possible N+1 queries on %s %s: %d x %s',
+                               request.method, route, count, statement)
+
+        response.headers['Server-Timing'] = \
+            'app;dur={:.2f}, db;dur={:.2f};desc="{} queries"'.format(
+                elapsed * 1000, state['db_time'] * 1000,
+                state['statement_count'])
+        return response
+
+    # SQLALCHEMY EVENTS
+    # -------------------------------------------------------------------------
+    def before_cursor_execute(self, connection, cursor, statement, parameters,
+                              context, executemany):
+        connection.info.setdefault('query_started', []).append(
+            time.perf_counter())
+
+    def after_cursor_execute(self, connection, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - \
+            connection.info['query_started'].pop()
+        in_request = has_request_context()
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            route = self.route() if in_request else None
+            self.slow_queries.inc((route or 'none',))
+            logger.warning('Slow query (%.1f ms) on %s: %s',
+                           elapsed * 1000, route, statement)
+
+        state = g.get('instrumentation') if in_request else None
+        if state is not None:
+            state['statement_count'] += 1
+            state['db_time'] += elapsed
+            state['statements'][statement] = \
+                state['statements'].get(statement, 0) + 1
+
+    # Labelling requests with the matched URL rule rather than the raw path,
+    # so IDs do not create a series per question
+    def route(self):
+        return request.url_rule.rule if request.url_rule is not None \
+            else 'unmatched'
+
+    # Rendering every metric in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Building instrumentation from create_app's 'instrumentation' setting: None
+# or True for the defaults, False to turn it off, or a dict of Instrumentation
+# options (e.g. {'slow_query_ms': 50})
+def make_instrumentation(setting=None):
+    if setting is False:
+        return None
+    if setting is None or setting is True:
+        return Instrumentation()
+    return Instrumentation(**setting)
@@ -0,0 +1,410 @@
+import atexit
+import itertools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.dialects import postgresql
+
+from models import db, Score
+
+logger = logging.getLogger(__name__)
+
+# Category key of quizzes played over every category
+ALL_CATEGORIES = 0
+# Longest player name and highest score accepted
+MAX_PLAYER_LENGTH = 50
+MAX_SCORE = 1000000
+# Players listed by GET /leaderboard by default and at most, and on each
+# side of the player given as 'around'
+DEFAULT_TOP = 10
+MAX_TOP = 100
+AROUND = 5
+# Entries per block of a ranked list; blocks are split at twice this size
+BLOCK_SIZE = 512
+# Seconds between batched writes of new best scores to the scores table,
+# and rows written per statement
+FLUSH_INTERVAL = 1
+FLUSH_BATCH_SIZE = 1000
+# Seconds before the leaderboards are merged with the scores table, to pick
+# up scores submitted to other processes
+REFRESH_INTERVAL = 60
+
+
+# RANKED LIST
+# -----------------------------------------------------------------------------
+# Sorted list kept as a list of sorted blocks, with the last entry of each
+# block in a separate list: finding an entry takes two bisections, and an
+# insert or delete only shifts one block rather than the whole list, so
+# updates stay cheap with hundreds of thousands of entries. A Fenwick tree
+# over the block lengths turns a position into a block (and back) in
+# O(log n), so ranks and slices never walk the blocks before them
+class RankedList:
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks = []
+        self._maxes = []
+        self._tree = [0]
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def add(self, entry):
+        if not self._blocks:
+            self._blocks.append([entry])
+            self._maxes.append(entry)
+            self._rebuild()
+        else:
+            index = bisect_left(self._maxes, entry)
+            if index == len(self._maxes):
+                index -= 1
+            block = self._blocks[index]
+            insort(block, entry)
+            self._maxes[index] = block[-1]
+
+            # Splitting blocks that grew too long to shift cheaply
+            if len(block) > 2 * self.block_size:
+                self._blocks[index:index + 1] = [block[:self.block_size],
+                                                 block[self.block_size:]]
+                self._maxes[index:index + 1] = [block[self.block_size - 1],
+                                                block[-1]]
+                self._rebuild()
+            else:
+                self._update(index, 1)
+        self._length += 1
+
+    def remove(self, entry):
+        index = bisect_left(self._maxes, entry)
+        block = self._blocks[index]
+        del block[bisect_left(block, entry)]
+        if block:
+            self._maxes[index] = block[-1]
+            self._update(index, -1)
+        else:
+            del self._blocks[index]
+            del self._maxes[index]
+            self._rebuild()
+        self._length -= 1
+
+    # Returning the 0-based position of an entry in the list
+    def index(self, entry):
+        index = bisect_left(self._maxes, entry)
+        return self._prefix(index) + bisect_left(self._blocks[index], entry)
+
+    # Returning the entries from position start up to (not including) stop
+    def slice(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, self._length)
+        if start >= stop:
+            return []
+
+        index, offset = self._locate(start)
+        entries = []
+        while len(entries) < stop - start:
+            entries.extend(self._blocks[index][
+                offset:offset + stop - start - len(entries)])
+            index, offset = index + 1, 0
+        return entries
+
+    # BLOCK LENGTHS
+    # -------------------------------------------------------------------------
+    # Rebuilding the Fenwick tree in O(blocks), only needed when blocks are
+    # split or dropped
+    def _rebuild(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for node, block in enumerate(self._blocks, 1):
+            tree[node] += len(block)
+            parent = node + (node & -node)
+            if parent < len(tree):
+                tree[parent] += tree[node]
+        self._tree = tree
+
+    def _update(self, index, delta):
+        tree, size, node = self._tree, len(self._tree), index + 1
+        while node < size:
+            tree[node] += delta
+            node += node & -node
+
+    # Returning the number of entries in the blocks before block index
+    def _prefix(self, index):
+        tree, total = self._tree, 0
+        while index:
+            total += tree[index]
+            index &= index - 1
+        return total
+
+    # Returning the block holding position, and the position in that block
+    def _locate(self, position):
+        tree, size, index = self._tree, len(self._tree), 0
+        step = 1 << (size - 1).bit_length()
+        while step:
+            node = index + step
+            if node < size and tree[node] <= position:
+                index = node
+                position -= tree[node]
+            step >>= 1
+        return index, position
+
+
+# One category's best score per player, ranked by score and then by who got
+# there first; entries are (-score, sequence, player) tuples
+class Leaderboard:
+
+    def __init__(self):
+        self._entries = {}
+        self._ranked = RankedList()
+
+    def __len__(self):
+        return len(self._ranked)
+
+    # Recording a score, which only counts if it beats the player's best;
+    # returns whether it did
+    def submit(self, player, score, sequence):
+        entry = self._entries.get(player)
+        if entry is not None:
+            if -entry[0] >= score:
+                return False
+            self._ranked.remove(entry)
+
+        entry = self._entries[player] = (-score, sequence, player)
+        self._ranked.add(entry)
+        return True
+
+    def score(self, player):
+        entry = self._entries.get(player)
+        return -entry[0] if entry is not None else None
+
+    # Returning the 1-based rank of a player, or None if they have no score
+    def rank(self, player):
+        entry = self._entries.get(player)
+        return self._ranked.index(entry) + 1 if entry is not None else None
+
+    # Listing the players ranked from start + 1 up to stop
+    def standings(self, start, stop):
+        start = max(start, 0)
+        return [{'rank': start + offset + 1, 'player': player,
+                 'score': -negative_score}
+                for offset, (negative_score, _, player) in enumerate(
+                    self._ranked.slice(start, stop))]
+
+
+# STORAGE
+# -----------------------------------------------------------------------------
+# Writing ((category, player), score) items to the scores table without ever
+# lowering a stored score (another process may hold a better one): one
+# INSERT ... ON CONFLICT on Postgres, an UPDATE and an INSERT batch elsewhere
+def save_scores(items):
+    now = datetime.utcnow()
+    rows = [{'category': category, 'player': player, 'score': score,
+             'updated_at': now} for (category, player), score in items]
+    scores = Score.__table__
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        statement = postgresql.insert(scores)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['category', 'player'],
+            set_={'score': statement.excluded.score,
+                  'updated_at': statement.excluded.updated_at},
+            where=scores.c.score < statement.excluded.score), rows)
+    else:
+        existing = set()
+        for category in {row['category'] for row in rows}:
+            players = [row['player'] for row in rows
+                       if row['category'] == category]
+            existing.update(
+                (category, player) for player, in db.session.query(
+                    Score.player).filter(Score.category == category,
+                                         Score.player.in_(players)))
+
+        updates = [{'key_' + name: value for name, value in row.items()}
+                   for row in rows
+                   if (row['category'], row['player']) in existing]
+        inserts = [row for row in rows
+                   if (row['category'], row['player']) not in existing]
+        if updates:
+            connection.execute(scores.update().where(and_(
+                scores.c.category == bindparam('key_category'),
+                scores.c.player == bindparam('key_player'),
+                scores.c.score < bindparam('key_score'))).values(
+                score=bindparam('key_score'),
+                updated_at=bindparam('key_updated_at')), updates)
+        if inserts:
+            connection.execute(scores.insert(), inserts)
+
+    db.session.commit()
+
+
+# LEADERBOARDS
+# -----------------------------------------------------------------------------
+# Ranking players per category in memory, so submitting a score and reading
+# ranks never waits on the database: new best scores are written to the
+# scores table in batches by a background thread (started on first use, so
+# forked workers each start their own), and the leaderboards are rebuilt
+# from the table on first use and merged with it every refresh interval
+class Leaderboards:
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._boards = None
+        self._pending = {}
+        self._loaded_at = 0
+        self._thread = None
+        self._stop = None
+        self.flush_interval = FLUSH_INTERVAL
+        self.flush_batch_size = FLUSH_BATCH_SIZE
+        self.refresh_interval = REFRESH_INTERVAL
+
+    def configure(self, app=None, flush_interval=FLUSH_INTERVAL,
+                  flush_batch_size=FLUSH_BATCH_SIZE,
+                  refresh_interval=REFRESH_INTERVAL):
+        # Writing scores pending for a previously configured app
+        self.shutdown()
+        self.app = app
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.refresh_interval = refresh_interval
+        self.reset()
+
+    # Dropping the leaderboards so they get rebuilt on next use
+    def reset(self):
+        with self._lock:
+            self._boards = None
+
+    # Giving a forked process its own lock and flush thread; scores pending
+    # in the parent are written by the parent
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._stop = None
+
+    # Merging (category, player, score) rows into the leaderboards, oldest
+    # first so earlier scores win ties; queried unless the caller has them
+    def load(self, rows=None):
+        if rows is None:
+            rows = db.session.query(Score.category, Score.player,
+                                    Score.score).order_by(Score.updated_at)
+        rows = list(rows)
+
+        with self._lock:
+            if self._boards is None:
+                self._boards = {}
+            for category, player, score in rows:
+                self._board(category).submit(player, score,
+                                             next(self._sequence))
+            self._loaded_at = time.monotonic()
+
+    def needs_load(self):
+        expired = time.monotonic() - self._loaded_at > self.refresh_interval
+        return self._boards is None or expired
+
+    def _ensure_loaded(self):
+        if self.needs_load():
+            self.load()
+
+    def _board(self, category):
+        board = self._boards.get(category)
+        if board is None:
+            board = self._boards[category] = Leaderboard()
+        return board
+
+    # Recording a player's score; returns their best score, their rank and
+    # whether this score improved on their best
+    def submit(self, category, player, score):
+        self._ensure_loaded()
+        with self._lock:
+            board = self._board(category)
+            improved = board.submit(player, score, next(self._sequence))
+            if improved:
+                self._pending[(category, player)] = score
+            best, rank = board.score(player), board.rank(player)
+
+        if improved:
+            self._start()
+        return best, rank, improved
+
+    # Returning the category's player count, its top players and, when a
+    # player is given, the players ranked around them (None if the player
+    # has no score in the category)
+    def standings(self, category, top=DEFAULT_TOP, player=None,
+                  around=AROUND):
+        self._ensure_loaded()
+        with self._lock:
+            board = self._boards.get(category) or Leaderboard()
+            leaders = board.standings(0, top)
+            nearby = None
+            if player is not None:
+                rank = board.rank(player)
+                if rank is not None:
+                    nearby = board.standings(rank - 1 - around, rank + around)
+            return len(board), leaders, nearby
+
+    # FLUSHING
+    # -------------------------------------------------------------------------
+    def _start(self):
+        with self._lock:
+            if self._thread is None and self.app is not None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stop,),
+                    name='leaderboard-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self, stop):
+        while not stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Unable to save scores')
+
+    # Writing every pending best score in batches; scores that could not be
+    # written are kept for the next flush. Returns the number written
+    def flush(self):
+        if self.app is None:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = sorted(pending.items())
+        written = 0
+        with self.app.app_context():
+            try:
+                for start in range(0, len(items), self.flush_batch_size):
+                    save_scores(items[start:start + self.flush_batch_size])
+                    written += len(items[start:start + self.flush_batch_size])
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    for key, score in items[written:]:
+                        if self._pending.get(key, -1) < score:
+                            self._pending[key] = score
+                raise
+        return written
+
+    # Stopping the flush thread and writing whatever is still pending
+    def shutdown(self):
+        with self._lock:
+            thread, stop = self._thread, self._stop
+            self._thread = self._stop = None
+        if thread is not None:
+            stop.set()
+            thread.join()
+        self.flush()
+
+
+# Process wide leaderboards, configured by create_app() and flushed at exit
+leaderboards = Leaderboards()
+atexit.register(leaderboards.shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=leaderboards.after_fork)
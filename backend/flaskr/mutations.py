@@ -0,0 +1,202 @@
+from sqlalchemy import bindparam, select
+
+from models import db, notify_question_change, Question
+from .bulk import QUESTION_FIELDS, validate_row
+
+# Cap on the number of creates, updates and deletes in a single request
+MAX_BATCH_ITEMS = 10000
+# Batches changing more questions than this notify listeners with a single
+# 'reload' rather than one notification per question
+NOTIFY_ITEMS_LIMIT = 20
+
+questions = Question.__table__
+QUESTION_COLUMNS = [questions.c.id, questions.c.question, questions.c.answer,
+                    questions.c.category, questions.c.difficulty]
+
+
+def format_row(row):
+    return {
+        'id': row[0],
+        'question': row[1],
+        'answer': row[2],
+        'category': row[3],
+        'difficulty': row[4]
+    }
+
+
+# VALIDATION
+# -----------------------------------------------------------------------------
+# Reading one question ID from an int or a string of digits; anything else
+# (bools, floats, null, objects) is rejected rather than coerced
+def parse_id(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    raise ValueError('Invalid question ID: {!r}'.format(value))
+
+
+# Reading question IDs from a list of ints or a comma separated string
+def parse_ids(values):
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not isinstance(values, list):
+        raise ValueError('Expected a list of question IDs')
+    return [parse_id(value) for value in values]
+
+
+# Checking one update and returning (id, column values to set)
+def validate_update(item, categories):
+    if not isinstance(item, dict) or not isinstance(item.get('id'), int) or \
+            isinstance(item['id'], bool):
+        raise ValueError('Missing id')
+
+    values = validate_row(item, categories, partial=True)
+    if not values:
+        raise ValueError('Nothing to update')
+    return item['id'], values
+
+
+# SET BASED WRITES
+# -----------------------------------------------------------------------------
+# Deleting questions with a single DELETE ... WHERE id IN statement and
+# returning the rows that were deleted (RETURNING on Postgres, a SELECT in
+# the same transaction elsewhere); the caller commits
+def delete_questions(ids):
+    if not ids:
+        return []
+
+    connection = db.session.connection()
+    statement = questions.delete().where(questions.c.id.in_(ids))
+
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(statement.returning(*QUESTION_COLUMNS))
+        return [format_row(row) for row in rows]
+
+    rows = connection.execute(select(QUESTION_COLUMNS).where(
+        questions.c.id.in_(ids))).fetchall()
+    connection.execute(statement)
+    return [format_row(row) for row in rows]
+
+
+# Applying updates with one executemany per set of changed columns
+def update_questions(updates):
+    if not updates:
+        return {}
+
+    connection = db.session.connection()
+    previous = {row[0]: format_row(row) for row in connection.execute(
+        select(QUESTION_COLUMNS).where(
+            questions.c.id.in_([question_id for question_id, _ in updates])))}
+
+    groups = {}
+    for question_id, values in updates:
+        if question_id in previous:
+            groups.setdefault(tuple(sorted(values)), []).append(
+                dict(values, question_id=question_id))
+
+    for columns, rows in groups.items():
+        connection.execute(questions.update().where(
+            questions.c.id == bindparam('question_id')).values(
+            {column: bindparam(column) for column in columns}), rows)
+
+    return previous
+
+
+# Inserting questions, returning their IDs in order; Postgres gets one
+# multi-row INSERT ... RETURNING, other databases one INSERT per row
+def insert_questions(rows):
+    if not rows:
+        return []
+
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        return [row[0] for row in connection.execute(
+            questions.insert().values(rows).returning(questions.c.id))]
+
+    return [connection.execute(questions.insert(), row).inserted_primary_key[0]
+            for row in rows]
+
+
+# Notifying listeners once the transaction is committed, with a single
+# 'reload' for large batches
+def notify_changes(changes):
+    if len(changes) > NOTIFY_ITEMS_LIMIT:
+        notify_question_change('reload', None)
+        return
+
+    for action, question in changes:
+        notify_question_change(action, question)
+
+
+# BATCH MUTATIONS
+# -----------------------------------------------------------------------------
+# Running a batch of creates, updates and deletes in one transaction; invalid
+# items are reported and skipped, while a database error rolls the whole
+# batch back and is raised to the caller
+def apply_batch(creates, updates, deletes, categories):
+    results = {'create': [], 'update': [], 'delete': []}
+    changes = []
+
+    # Validating every item before touching the database
+    valid_creates = []
+    for index, item in enumerate(creates):
+        try:
+            valid_creates.append((index, validate_row(
+                item if isinstance(item, dict) else {}, categories)))
+        except ValueError as e:
+            results['create'].append(
+                {'index': index, 'success': False, 'error': str(e)})
+
+    valid_updates = []
+    for index, item in enumerate(updates):
+        try:
+            valid_updates.append((index,) + validate_update(item, categories))
+        except ValueError as e:
+            results['update'].append({'index': index, 'success': False,
+                                      'error': str(e)})
+
+    try:
+        # Deleting first, so a batch can replace questions it deletes
+        deleted = {question['id']: question
+                   for question in delete_questions(deletes)}
+        for index, question_id in enumerate(deletes):
+            result = {'index': index, 'id': question_id,
+                      'success': question_id in deleted}
+            if question_id in deleted:
+                changes.append(('delete', deleted.pop(question_id)))
+            else:
+                result['error'] = 'Not found'
+            results['delete'].append(result)
+
+        previous = update_questions([(question_id, values) for
+                                     _, question_id, values in valid_updates])
+        for index, question_id, values in valid_updates:
+            result = {'index': index, 'id': question_id,
+                      'success': question_id in previous}
+            if question_id in previous:
+                # Updates reach listeners as the old question going away
+                # and the new one arriving
+                changes.append(('delete', previous[question_id]))
+                previous[question_id] = dict(previous[question_id], **values)
+                changes.append(('insert', previous[question_id]))
+            else:
+                result['error'] = 'Not found'
+            results['update'].append(result)
+
+        created_ids = insert_questions([row for _, row in valid_creates])
+        for (index, row), question_id in zip(valid_creates, created_ids):
+            results['create'].append({'index': index, 'id': question_id,
+                                      'success': True})
+            changes.append(('insert', dict(row, id=question_id)))
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    notify_changes(changes)
+
+    for items in results.values():
+        items.sort(key=lambda result: result['index'])
+    return results
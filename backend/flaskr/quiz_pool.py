@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+from array import array
+
+from models import db, on_question_change, Question
+
+# Share of a pool that may be excluded before rejection sampling gives way to
+# an explicit set difference
+REJECTION_THRESHOLD = 0.5
+# Number of random draws attempted before falling back to a set difference
+MAX_REJECTION_TRIES = 16
+# Seconds before the pool reloads itself to pick up changes from other
+# processes (local inserts / deletes are applied immediately)
+REFRESH_INTERVAL = 300
+
+# Key used for the pool holding every question regardless of category
+ALL_CATEGORIES = None
+
+
+# Returning the pools a question belongs to: every question is in the
+# overall pool, and questions with a category (the column is nullable) in
+# their category's pool too
+def pool_keys(category):
+    if category is None:
+        return (ALL_CATEGORIES,)
+    return (ALL_CATEGORIES, int(category))
+
+
+# QUIZ QUESTION POOL
+# -----------------------------------------------------------------------------
+# Keeping a per-process index of question IDs by category so a quiz turn can
+# pick a random unseen question without scanning the questions table
+class QuizPool:
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._ids = None
+        self._positions = None
+        self._loaded_at = 0
+
+    # Dropping the index so it gets rebuilt on next use
+    def reset(self):
+        with self._lock:
+            self._ids = None
+            self._positions = None
+
+    # Building compact arrays of IDs per category from (id, category) rows,
+    # queried with a single column query unless the caller already has them
+    def load(self, rows=None):
+        ids = {ALL_CATEGORIES: array('l')}
+        positions = {ALL_CATEGORIES: {}}
+
+        if rows is None:
+            rows = db.session.query(Question.id, Question.category).order_by(
+                Question.id)
+        for question_id, category in rows:
+            for key in pool_keys(category):
+                bucket = ids.setdefault(key, array('l'))
+                positions.setdefault(key, {})[question_id] = len(bucket)
+                bucket.append(question_id)
+
+        with self._lock:
+            self._ids = ids
+            self._positions = positions
+            self._loaded_at = time.monotonic()
+
+    # Telling whether the pool is missing or due for a reload
+    def needs_load(self):
+        expired = time.monotonic() - self._loaded_at > self.refresh_interval
+        return self._ids is None or expired
+
+    def _ensure_loaded(self):
+        if self.needs_load():
+            self.load()
+
+    # Adding a question ID to both its category and the overall pool
+    def add(self, question_id, category):
+        with self._lock:
+            if self._ids is None:
+                return
+
+            for key in pool_keys(category):
+                bucket = self._ids.setdefault(key, array('l'))
+                positions = self._positions.setdefault(key, {})
+                if question_id not in positions:
+                    positions[question_id] = len(bucket)
+                    bucket.append(question_id)
+
+    # Removing a question ID in O(1) by swapping the last ID into its slot
+    def remove(self, question_id, category=None):
+        with self._lock:
+            if self._ids is None:
+                return
+
+            keys = [ALL_CATEGORIES] + ([int(category)]
+                                       if category is not None else
+                                       [key for key in self._ids
+                                        if key is not ALL_CATEGORIES])
+            for key in keys:
+                positions = self._positions.get(key, {})
+                position = positions.pop(question_id, None)
+                if position is None:
+                    continue
+
+                bucket = self._ids[key]
+                last_id = bucket.pop()
+                if last_id != question_id:
+                    bucket[position] = last_id
+                    positions[last_id] = position
+
+    # Keeping the pool in sync with questions created or deleted in-process
+    def handle_change(self, action, question):
+        if action == 'insert':
+            self.add(question['id'], question['category'])
+        elif action == 'delete':
+            self.remove(question['id'], question['category'])
+        elif action == 'reload':
+            self.reset()
+
+    # Returning a copy of every question ID in the category
+    def ids(self, category=ALL_CATEGORIES):
+        self._ensure_loaded()
+
+        key = ALL_CATEGORIES if category is None else int(category)
+        with self._lock:
+            return list((self._ids or {}).get(key, ()))
+
+    # Choosing a random question ID from the category that is not one of the
+    # previous questions, or None once every question has been used
+    def choose_id(self, category=ALL_CATEGORIES, previous_questions=()):
+        self._ensure_loaded()
+
+        key = ALL_CATEGORIES if category is None else int(category)
+        excluded = set(previous_questions)
+
+        with self._lock:
+            ids = (self._ids or {}).get(key)
+            if not ids:
+                return None
+
+            # Sampling with rejection while most of the pool is still
+            # available
+            if len(excluded) < len(ids) * REJECTION_THRESHOLD:
+                for _ in range(MAX_REJECTION_TRIES):
+                    question_id = ids[random.randrange(len(ids))]
+                    if question_id not in excluded:
+                        return question_id
+
+            # Falling back to a set difference once most IDs have been used
+            remaining = [question_id for question_id in ids
+                         if question_id not in excluded]
+
+        return random.choice(remaining) if remaining else None
+
+    # Choosing a random question and loading just that row by primary key
+    def choose(self, category=ALL_CATEGORIES, previous_questions=()):
+        previous_questions = set(previous_questions)
+
+        while True:
+            question_id = self.choose_id(category, previous_questions)
+            if question_id is None:
+                return None
+
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+
+            # Dropping IDs deleted by another process since the last load
+            self.remove(question_id)
+            previous_questions.add(question_id)
+
+
+# Process wide pool, kept up to date by Question.insert() / Question.delete()
+quiz_pool = QuizPool()
+on_question_change(quiz_pool.handle_change)
@@ -0,0 +1,393 @@
+import random
+import threading
+import time
+from array import array
+
+from sqlalchemy import case, func
+
+from models import db, on_question_change, Answer, Question
+from .quiz_pool import ALL_CATEGORIES, MAX_REJECTION_TRIES, \
+    REJECTION_THRESHOLD, pool_keys, quiz_pool
+
+# Questions played at each difficulty before the ramp moves up a level
+RAMP_QUESTIONS_PER_LEVEL = 3
+DIFFICULTY_LEVELS = (1, 2, 3, 4, 5)
+# Level the ramp plays questions without a difficulty at
+UNRATED_LEVEL = 3
+# Lowest weight a question can get, so well known questions still come up
+MIN_WEIGHT = 0.05
+# Seconds before the selector reloads itself to pick up changes from other
+# processes (local changes and answers are applied immediately)
+REFRESH_INTERVAL = 300
+
+UNIFORM = 'uniform'
+DIFFICULTY_RAMP = 'difficulty_ramp'
+WEIGHTED = 'weighted'
+STRATEGIES = (UNIFORM, DIFFICULTY_RAMP, WEIGHTED)
+
+
+# Placing a question on the ramp, with unrated (NULL) difficulties in the
+# middle so sorting levels never compares None with a number
+def ramp_level(difficulty):
+    return UNRATED_LEVEL if difficulty is None else difficulty
+
+
+# Weighting questions by their smoothed miss rate: unanswered questions
+# start at 0.5, questions players often miss approach 1 and questions
+# everybody gets right approach MIN_WEIGHT
+def answer_weight(answered, correct):
+    return max(MIN_WEIGHT, (answered - correct + 1) / (answered + 2))
+
+
+# SAMPLING STRUCTURES
+# -----------------------------------------------------------------------------
+# Fenwick (binary indexed) tree over cumulative weights: drawing a weighted
+# position and changing one weight both take O(log n)
+class FenwickTree:
+
+    def __init__(self, weights=()):
+        self.weights = array('d', weights)
+        self.tree = array('d', [0.0]) * (len(self.weights) + 1)
+
+        # Building in O(n) by pushing each node into its parent
+        for index, weight in enumerate(self.weights, start=1):
+            self.tree[index] += weight
+            parent = index + (index & -index)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[index]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def prefix(self, count):
+        total = 0.0
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def total(self):
+        return self.prefix(len(self.weights))
+
+    def update(self, position, weight):
+        delta = weight - self.weights[position]
+        self.weights[position] = weight
+        index = position + 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def append(self, weight):
+        # The new node covers the positions (index - lowbit, index]
+        index = len(self.tree)
+        self.weights.append(weight)
+        self.tree.append(weight + self.prefix(index - 1) -
+                         self.prefix(index - (index & -index)))
+        return index - 1
+
+    # Returning the position whose cumulative weight range holds value
+    def find(self, value):
+        position = 0
+        step = 1 << (len(self.tree).bit_length() - 1)
+        while step:
+            index = position + step
+            if index < len(self.tree) and self.tree[index] <= value:
+                position = index
+                value -= self.tree[index]
+            step >>= 1
+        return min(position, len(self.weights) - 1)
+
+
+# Weighted pool of question IDs; removed questions keep a zero weight slot
+# until the next reload
+class WeightedPool:
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.tree = FenwickTree()
+
+    def load(self, weighted_ids):
+        self.ids = [question_id for question_id, _ in weighted_ids]
+        self.positions = {question_id: position for position, question_id
+                          in enumerate(self.ids)}
+        self.tree = FenwickTree(weight for _, weight in weighted_ids)
+
+    def add(self, question_id, weight):
+        if question_id in self.positions:
+            self.set_weight(question_id, weight)
+            return
+        self.positions[question_id] = self.tree.append(weight)
+        self.ids.append(question_id)
+
+    def remove(self, question_id):
+        position = self.positions.pop(question_id, None)
+        if position is not None:
+            self.tree.update(position, 0.0)
+
+    def set_weight(self, question_id, weight):
+        position = self.positions.get(question_id)
+        if position is not None:
+            self.tree.update(position, weight)
+
+    def sample(self, excluded):
+        excluded = [question_id for question_id in excluded
+                    if question_id in self.positions]
+        if len(excluded) >= len(self.positions):
+            return None
+
+        # Sampling with rejection while most of the pool is still available
+        if len(excluded) < len(self.positions) * REJECTION_THRESHOLD:
+            excluded_set = set(excluded)
+            for _ in range(MAX_REJECTION_TRIES):
+                question_id = self.ids[self.tree.find(
+                    random.random() * self.tree.total())]
+                if question_id in self.positions and \
+                        question_id not in excluded_set:
+                    return question_id
+
+        # Otherwise zeroing the excluded weights for one draw, which costs
+        # O(k log n) for k excluded questions rather than O(n)
+        saved = [(self.positions[question_id],
+                  self.tree.weights[self.positions[question_id]])
+                 for question_id in excluded]
+        for position, _ in saved:
+            self.tree.update(position, 0.0)
+        try:
+            # Drawing again when float rounding in the cumulative weights
+            # lands on a zero weight slot (an excluded or removed question)
+            total = self.tree.total()
+            for _ in range(MAX_REJECTION_TRIES):
+                position = self.tree.find(random.random() * total)
+                if self.tree.weights[position] > 0:
+                    return self.ids[position]
+        finally:
+            for position, weight in saved:
+                self.tree.update(position, weight)
+
+        # Falling back to the remaining weights one by one, so a quiz never
+        # ends early while questions are left
+        excluded_set = set(excluded)
+        remaining = [(question_id, self.tree.weights[position])
+                     for question_id, position in self.positions.items()
+                     if question_id not in excluded_set and
+                     self.tree.weights[position] > 0]
+        if not remaining:
+            return None
+        ids, weights = zip(*remaining)
+        return random.choices(ids, weights)[0]
+
+
+# Unweighted pool of question IDs with O(1) swap-remove
+class UniformPool:
+
+    def __init__(self):
+        self.ids = array('l')
+        self.positions = {}
+
+    def add(self, question_id):
+        if question_id not in self.positions:
+            self.positions[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def remove(self, question_id):
+        position = self.positions.pop(question_id, None)
+        if position is None:
+            return
+        last_id = self.ids.pop()
+        if last_id != question_id:
+            self.ids[position] = last_id
+            self.positions[last_id] = position
+
+    def sample(self, excluded):
+        if not self.ids:
+            return None
+        if len(excluded) < len(self.ids) * REJECTION_THRESHOLD:
+            for _ in range(MAX_REJECTION_TRIES):
+                question_id = self.ids[random.randrange(len(self.ids))]
+                if question_id not in excluded:
+                    return question_id
+
+        remaining = [question_id for question_id in self.ids
+                     if question_id not in excluded]
+        return random.choice(remaining) if remaining else None
+
+
+# QUIZ SELECTOR
+# -----------------------------------------------------------------------------
+# Choosing the next quiz question with one of several strategies:
+# - uniform: any unseen question, equally likely (the quiz question pool)
+# - difficulty_ramp: starting with easy questions and moving up a level
+#   every few questions, falling back to the nearest level with questions
+# - weighted: favouring questions players often miss, from the answers
+#   recorded through POST /quiz/answer
+class QuizSelector:
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._loaded_at = 0
+        self._difficulties = {}
+        self._stats = {}
+        self._levels = {}
+        self._weighted = {}
+
+    def reset(self):
+        with self._lock:
+            self._loaded = False
+
+    def needs_load(self):
+        expired = time.monotonic() - self._loaded_at > self.refresh_interval
+        return not self._loaded or expired
+
+    # Building every pool from (id, category, difficulty) rows and
+    # (question_id, answered, correct) answer aggregates, queried unless the
+    # caller already has them
+    def load(self, rows=None, answer_stats=None):
+        if rows is None:
+            rows = db.session.query(Question.id, Question.category,
+                                    Question.difficulty)
+        if answer_stats is None:
+            answer_stats = db.session.query(
+                Answer.question_id, func.count(Answer.id),
+                func.sum(case([(Answer.correct, 1)], else_=0))).group_by(
+                Answer.question_id)
+
+        stats = {question_id: (answered, int(correct or 0))
+                 for question_id, answered, correct in answer_stats}
+        difficulties = {}
+        levels = {}
+        weighted = {}
+        for question_id, category, difficulty in rows:
+            keys = pool_keys(category)
+            difficulty = ramp_level(difficulty)
+            difficulties[question_id] = (keys[-1], difficulty)
+            weight = answer_weight(*stats.get(question_id, (0, 0)))
+            for key in keys:
+                levels.setdefault(key, {}).setdefault(
+                    difficulty, UniformPool()).add(question_id)
+                weighted.setdefault(key, []).append((question_id, weight))
+
+        pools = {}
+        for key, weighted_ids in weighted.items():
+            pools[key] = WeightedPool()
+            pools[key].load(weighted_ids)
+
+        with self._lock:
+            self._difficulties = difficulties
+            self._stats = stats
+            self._levels = levels
+            self._weighted = pools
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self.needs_load():
+            self.load()
+
+    def weight(self, question_id):
+        return answer_weight(*self._stats.get(question_id, (0, 0)))
+
+    # Keeping the pools in sync with questions created or deleted in-process
+    def handle_change(self, action, question):
+        if action == 'reload':
+            self.reset()
+            return
+
+        with self._lock:
+            if not self._loaded:
+                return
+
+            question_id = question['id']
+            keys = pool_keys(question['category'])
+            difficulty = ramp_level(question['difficulty'])
+            for key in keys:
+                if action == 'insert':
+                    self._difficulties[question_id] = (keys[-1], difficulty)
+                    self._levels.setdefault(key, {}).setdefault(
+                        difficulty, UniformPool()).add(question_id)
+                    self._weighted.setdefault(key, WeightedPool()).add(
+                        question_id, self.weight(question_id))
+                elif action == 'delete':
+                    self._difficulties.pop(question_id, None)
+                    self._stats.pop(question_id, None)
+                    if difficulty in self._levels.get(key, {}):
+                        self._levels[key][difficulty].remove(question_id)
+                    if key in self._weighted:
+                        self._weighted[key].remove(question_id)
+
+    # Counting an answer once it is stored and re-weighting its question in
+    # O(log n); returns the question's (answered, correct) totals
+    def record_answer(self, question_id, correct):
+        # A fresh load already counts the stored answer
+        if self.needs_load():
+            self.load()
+            return self._stats.get(question_id, (0, 0))
+
+        with self._lock:
+            answered, correct_count = self._stats.get(question_id, (0, 0))
+            self._stats[question_id] = (answered + 1,
+                                        correct_count + bool(correct))
+
+            question = self._difficulties.get(question_id)
+            if question is not None:
+                weight = self.weight(question_id)
+                for key in pool_keys(question[0]):
+                    if key in self._weighted:
+                        self._weighted[key].set_weight(question_id, weight)
+
+            return self._stats[question_id]
+
+    # Choosing a question ID not among the previous questions with the given
+    # strategy, or None once every question has been used
+    def choose_id(self, strategy=UNIFORM, category=ALL_CATEGORIES,
+                  previous_questions=()):
+        if strategy not in STRATEGIES:
+            raise ValueError('Unknown strategy: {}'.format(strategy))
+        if strategy == UNIFORM:
+            return quiz_pool.choose_id(category, previous_questions)
+
+        self._ensure_loaded()
+        key = ALL_CATEGORIES if category is None else int(category)
+        excluded = set(previous_questions)
+
+        with self._lock:
+            if strategy == WEIGHTED:
+                pool = self._weighted.get(key)
+                return pool.sample(excluded) if pool is not None else None
+
+            # Trying the ramp's target level first, then the nearest levels
+            levels = self._levels.get(key, {})
+            target = min(len(DIFFICULTY_LEVELS), 1 + len(excluded) //
+                         RAMP_QUESTIONS_PER_LEVEL)
+            for difficulty in sorted(levels, key=lambda level: (
+                    abs(level - target), level)):
+                question_id = levels[difficulty].sample(excluded)
+                if question_id is not None:
+                    return question_id
+            return None
+
+    # Choosing a question and loading just that row by primary key
+    def choose(self, strategy=UNIFORM, category=ALL_CATEGORIES,
+               previous_questions=()):
+        previous_questions = set(previous_questions)
+
+        while True:
+            question_id = self.choose_id(strategy, category,
+                                         previous_questions)
+            if question_id is None:
+                return None
+
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+
+            # Dropping IDs deleted by another process since the last load
+            previous_questions.add(question_id)
+
+
+# Process wide selector, kept up to date by Question.insert() /
+# Question.delete() and by recorded answers
+quiz_selector = QuizSelector()
+on_question_change(quiz_selector.handle_change)
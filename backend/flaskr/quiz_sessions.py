@@ -0,0 +1,140 @@
+import json
+import random
+import secrets
+import threading
+import time
+from collections import deque
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is an optional dependency
+    redis = None
+
+# Seconds a quiz session survives without being played; every turn extends it
+QUIZ_SESSION_TTL = 3600
+# Prefix for every key written to Redis
+REDIS_KEY_PREFIX = 'trivia:quiz:'
+
+
+# SESSION STORES
+# -----------------------------------------------------------------------------
+# Stores keep each session's remaining, pre-shuffled question IDs and hand
+# them out one at a time; pop() returns (found, question_id), where found is
+# False for unknown or expired sessions and question_id is None once the
+# session has run out of questions
+class MemorySessionStore:
+
+    def __init__(self, ttl=QUIZ_SESSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def create(self, session_id, category, question_ids):
+        with self._lock:
+            self._purge()
+            self._sessions[session_id] = {
+                'category': category,
+                'total': len(question_ids),
+                'ids': deque(question_ids),
+                'expires_at': time.monotonic() + self.ttl
+            }
+
+    def pop(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session['expires_at'] < time.monotonic():
+                self._sessions.pop(session_id, None)
+                return False, None
+
+            session['expires_at'] = time.monotonic() + self.ttl
+            return True, session['ids'].popleft() if session['ids'] else None
+
+    # Dropping expired sessions, so abandoned quizzes do not pile up
+    def _purge(self):
+        now = time.monotonic()
+        expired = [session_id for session_id, session in
+                   self._sessions.items() if session['expires_at'] < now]
+        for session_id in expired:
+            del self._sessions[session_id]
+
+
+# Storing sessions in Redis (or anything speaking its protocol) so that any
+# worker can serve the next turn; IDs live in a list popped with LPOP and the
+# session metadata in a separate key, which tells finished sessions apart
+# from expired ones
+class RedisSessionStore:
+
+    def __init__(self, client, prefix=REDIS_KEY_PREFIX, ttl=QUIZ_SESSION_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if redis is None:
+            raise RuntimeError('The redis package is required for a Redis '
+                               'quiz session store')
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _keys(self, session_id):
+        key = self.prefix + session_id
+        return key, key + ':ids'
+
+    def create(self, session_id, category, question_ids):
+        meta_key, ids_key = self._keys(session_id)
+        self.client.set(meta_key, json.dumps(
+            {'category': category, 'total': len(question_ids)}), ex=self.ttl)
+        if question_ids:
+            self.client.rpush(ids_key, *question_ids)
+            self.client.expire(ids_key, self.ttl)
+
+    def pop(self, session_id):
+        meta_key, ids_key = self._keys(session_id)
+        if self.client.get(meta_key) is None:
+            return False, None
+
+        question_id = self.client.lpop(ids_key)
+        self.client.expire(meta_key, self.ttl)
+        self.client.expire(ids_key, self.ttl)
+        return True, int(question_id) if question_id is not None else None
+
+
+# QUIZ SESSIONS
+# -----------------------------------------------------------------------------
+# Shuffling a category's question IDs once when a quiz starts, so each turn
+# is a single pop from the session instead of excluding every previously
+# played question
+class QuizSessions:
+
+    def __init__(self, store=None):
+        self.store = store
+
+    def configure(self, store):
+        self.store = store
+
+    # Creating a session over the given question IDs and returning its ID
+    def start(self, category, question_ids):
+        question_ids = list(question_ids)
+        random.shuffle(question_ids)
+
+        session_id = secrets.token_urlsafe(16)
+        self.store.create(session_id, category, question_ids)
+        return session_id
+
+    # Returning (found, question_id) for the session's next question
+    def next_id(self, session_id):
+        return self.store.pop(session_id)
+
+
+# Building a store from create_app's 'quiz_sessions' setting: None or
+# 'memory' for the in-process store, a redis:// URL or a store instance
+def make_session_store(setting=None):
+    if setting is None or setting == 'memory':
+        return MemorySessionStore()
+    if isinstance(setting, str) and setting.startswith('redis://'):
+        return RedisSessionStore.from_url(setting)
+    return setting
+
+
+# Process wide session manager, configured by create_app()
+quiz_sessions = QuizSessions()
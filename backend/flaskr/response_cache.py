@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from models import on_question_change
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is an optional dependency
+    redis = None
+
+# Bound on the number of entries kept by the in-process LRU backend
+LRU_MAX_ENTRIES = 1024
+# Seconds a cached entry may be served for; generations invalidate entries
+# written in this process right away, the TTL bounds how stale an entry can
+# get when another process (without a shared backend) changes questions
+RESPONSE_CACHE_TTL = 30
+# Prefix for every key written to Redis
+REDIS_KEY_PREFIX = 'trivia:cache:'
+
+
+# CACHE BACKENDS
+# -----------------------------------------------------------------------------
+# Backends store JSON-able values with a TTL and keep generation counters,
+# which must never be evicted (a counter going back to an old value would
+# bring stale entries back to life)
+class LRUCacheBackend:
+
+    def __init__(self, max_entries=LRU_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            # Evicting the least recently used entries beyond the size bound
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._generations[namespace] = \
+                self._generations.get(namespace, 0) + 1
+
+    def stats(self):
+        return {
+            'backend': 'lru',
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+# Storing entries in Redis (or anything speaking its protocol) so that every
+# worker shares both the cached values and the generation counters
+class RedisCacheBackend:
+
+    def __init__(self, client, prefix=REDIS_KEY_PREFIX,
+                 ttl=RESPONSE_CACHE_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if redis is None:
+            raise RuntimeError('The redis package is required for a Redis '
+                               'response cache')
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def generation(self, namespace):
+        value = self.client.get(self.prefix + 'generation:' + namespace)
+        return int(value) if value is not None else 0
+
+    def bump(self, namespace):
+        self.client.incr(self.prefix + 'generation:' + namespace)
+
+    def stats(self):
+        return {
+            'backend': 'redis',
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+# RESPONSE CACHE
+# -----------------------------------------------------------------------------
+# Caching read route payloads under keys built from the route, its
+# parameters and the generations of the namespaces the payload depends on;
+# bumping a namespace's generation makes all of its entries unreachable
+class ResponseCache:
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def configure(self, backend):
+        self.backend = backend
+
+    def key(self, route, params, namespaces):
+        generations = ','.join('{}={}'.format(
+            namespace, self.backend.generation(namespace))
+            for namespace in ['all'] + namespaces)
+        return '{}:{}:{}'.format(route, json.dumps(params, sort_keys=True),
+                                 generations)
+
+    # Returning the cached value, or building and caching it on a miss
+    def get_or_build(self, route, params, namespaces, build):
+        if self.backend is None:
+            return build()
+
+        key = self.key(route, params, namespaces)
+        value = self.backend.get(key)
+        if value is None:
+            value = build()
+            self.backend.set(key, value)
+        return value
+
+    # Bumping the generations of everything a question change can affect:
+    # its category listing, searches, the question count and the page list
+    # (a single namespace for every page, so a change costs a fixed number
+    # of bumps however many pages follow the question)
+    def handle_change(self, action, question):
+        if self.backend is None:
+            return
+
+        # Invalidating every entry after bulk changes
+        if action == 'reload':
+            self.backend.bump('all')
+            return
+
+        self.backend.bump('questions:count')
+        self.backend.bump('questions:pages')
+        self.backend.bump('search')
+        if question.get('category') is not None:
+            category = int(question['category'])
+            self.backend.bump('category:{}'.format(category))
+            self.backend.bump('search:category:{}'.format(category))
+
+
+# Building a backend from create_app's 'response_cache' setting: None for the
+# default LRU, False to disable caching, 'lru', a redis:// URL or a backend
+def make_cache_backend(setting=None):
+    if setting is False:
+        return None
+    if setting is None or setting == 'lru':
+        return LRUCacheBackend()
+    if isinstance(setting, str) and setting.startswith('redis://'):
+        return RedisCacheBackend.from_url(setting)
+    return setting
+
+
+# Process wide cache, invalidated by Question.insert() / Question.delete()
+response_cache = ResponseCache()
+on_question_change(response_cache.handle_change)
@@ -0,0 +1,323 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import func, literal_column
+from sqlalchemy.engine.url import make_url
+
+from models import db, on_question_change, Question
+from .serialization import QUESTION_FIELDS, STREAM_BATCH_SIZE, format_rows, \
+    iter_rows, row_formatter, select_questions
+
+# Text search configuration for Postgres; 'simple' keeps short words such as
+# 'a' or 'the' searchable, matching what the old ILIKE search allowed
+TEXT_SEARCH_CONFIG = 'simple'
+# Relative weight of a match in the question text compared to the answer
+QUESTION_WEIGHT = 2
+ANSWER_WEIGHT = 1
+# Seconds before the in-memory index reloads itself to pick up changes from
+# other processes (local inserts / deletes are applied immediately)
+REFRESH_INTERVAL = 300
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+# Splitting text into lower cased word tokens
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+# Applying optional category / difficulty filters to a question query
+def filter_questions(query, category=None, difficulty=None):
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+    return query
+
+
+# SEARCH BACKENDS
+# -----------------------------------------------------------------------------
+# Every backend takes a search term, optional filters and a page, and returns
+# the ranked questions for that page (as dicts holding the requested fields)
+# along with the total number of matches
+class SearchBackend:
+
+    name = None
+
+    # Preparing whatever the backend needs (indexes, in-memory state)
+    def setup(self):
+        pass
+
+    def search(self, term, category=None, difficulty=None, page=1,
+               per_page=10, fields=QUESTION_FIELDS):
+        raise NotImplementedError
+
+    # Yielding every match in rank order, a batch of rows at a time
+    def iter_search(self, term, category=None, difficulty=None,
+                    fields=QUESTION_FIELDS, batch_size=STREAM_BATCH_SIZE):
+        raise NotImplementedError
+
+
+# Searching with a Postgres tsvector over question and answer text, backed by
+# the ix_questions_search GIN expression index created by the migrations
+class PostgresSearchBackend(SearchBackend):
+
+    name = 'postgres'
+
+    # Building the indexed document expression; this must stay identical to
+    # the expression in the GIN index for Postgres to use it
+    @staticmethod
+    def document():
+        config = literal_column("'{}'".format(TEXT_SEARCH_CONFIG))
+        return func.to_tsvector(
+            config,
+            func.coalesce(Question.question, literal_column("''")).op('||')(
+                literal_column("' '")).op('||')(
+                func.coalesce(Question.answer, literal_column("''"))))
+
+    # Turning a search term into a prefix tsquery, e.g. 'van go' becomes
+    # 'van:* & go:*'
+    @staticmethod
+    def ts_query(term):
+        return ' & '.join('{}:*'.format(token) for token in tokenize(term))
+
+    # Building the filtered query of matches along with its rank ordering
+    def select_matches(self, ts_query, category, difficulty, fields):
+        document = self.document()
+        query = func.to_tsquery(
+            literal_column("'{}'".format(TEXT_SEARCH_CONFIG)), ts_query)
+
+        selection = filter_questions(
+            select_questions(fields).filter(document.op('@@')(query)),
+            category, difficulty)
+        return selection, (func.ts_rank(document, query).desc(), Question.id)
+
+    def search(self, term, category=None, difficulty=None, page=1,
+               per_page=10, fields=QUESTION_FIELDS):
+        ts_query = self.ts_query(term)
+        if not ts_query:
+            return [], 0
+
+        selection, ranking = self.select_matches(ts_query, category,
+                                                 difficulty, fields)
+        total = selection.count()
+
+        rows = selection.order_by(*ranking).offset(
+            (page - 1) * per_page).limit(per_page).all()
+
+        return format_rows(rows, fields), total
+
+    def iter_search(self, term, category=None, difficulty=None,
+                    fields=QUESTION_FIELDS, batch_size=STREAM_BATCH_SIZE):
+        ts_query = self.ts_query(term)
+        if not ts_query:
+            return iter(())
+
+        selection, ranking = self.select_matches(ts_query, category,
+                                                 difficulty, fields)
+        return iter_rows(selection.order_by(*ranking), fields, batch_size)
+
+
+# Searching with a pure Python inverted index that is built from the
+# questions table, updated as questions are inserted or deleted in-process
+# and reloaded every refresh interval
+class InvertedIndexBackend(SearchBackend):
+
+    name = 'memory'
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._postings = None
+        self._tokens = None
+        self._documents = None
+        self._loaded_at = 0
+
+    def setup(self):
+        with self._lock:
+            self._postings = None
+            self._tokens = None
+            self._documents = None
+
+    # Telling whether the index is missing or due for a reload
+    def needs_load(self):
+        expired = time.monotonic() - self._loaded_at > self.refresh_interval
+        return self._postings is None or expired
+
+    # Indexing (id, question, answer, category, difficulty) rows, loaded with
+    # a single column query unless the caller already has them
+    def load(self, rows=None):
+        postings = {}
+        documents = {}
+
+        if rows is None:
+            rows = db.session.query(Question.id, Question.question,
+                                    Question.answer, Question.category,
+                                    Question.difficulty)
+        for question_id, question, answer, category, difficulty in rows:
+            self._index(postings, documents, question_id, question, answer,
+                        category, difficulty)
+
+        with self._lock:
+            self._postings = postings
+            self._tokens = sorted(postings)
+            self._documents = documents
+            self._loaded_at = time.monotonic()
+
+    # Recording token weights for one question
+    @staticmethod
+    def _index(postings, documents, question_id, question, answer,
+               category, difficulty):
+        weights = {}
+        for token in tokenize(question):
+            weights[token] = weights.get(token, 0) + QUESTION_WEIGHT
+        for token in tokenize(answer):
+            weights[token] = weights.get(token, 0) + ANSWER_WEIGHT
+
+        for token, weight in weights.items():
+            postings.setdefault(token, {})[question_id] = weight
+
+        documents[question_id] = (
+            int(category) if category is not None else None,
+            difficulty, tuple(weights))
+
+    def add(self, question):
+        with self._lock:
+            if self._postings is None:
+                return
+
+            new_tokens = []
+            self._index(self._postings, self._documents, question['id'],
+                        question['question'], question['answer'],
+                        question['category'], question['difficulty'])
+            for token in self._documents[question['id']][2]:
+                if len(self._postings[token]) == 1:
+                    new_tokens.append(token)
+            for token in new_tokens:
+                insort(self._tokens, token)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._postings is None:
+                return
+
+            document = self._documents.pop(question_id, None)
+            if document is None:
+                return
+
+            for token in document[2]:
+                posting = self._postings[token]
+                posting.pop(question_id, None)
+                if not posting:
+                    del self._postings[token]
+                    del self._tokens[bisect_left(self._tokens, token)]
+
+    # Keeping the index in sync with questions created or deleted in-process
+    def handle_change(self, action, question):
+        if action == 'insert':
+            self.add(question)
+        elif action == 'delete':
+            self.remove(question['id'])
+        elif action == 'reload':
+            self.setup()
+
+    # Scoring every question holding a token that starts with the prefix
+    def _match_prefix(self, prefix):
+        scores = {}
+        position = bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and \
+                self._tokens[position].startswith(prefix):
+            for question_id, weight in \
+                    self._postings[self._tokens[position]].items():
+                scores[question_id] = scores.get(question_id, 0) + weight
+            position += 1
+        return scores
+
+    # Ranking matches and returning the IDs on the requested page along with
+    # the total number of matches
+    def search_ids(self, term, category=None, difficulty=None, page=1,
+                   per_page=10):
+        ranked = self.rank(term, category, difficulty)
+        return ranked[(page - 1) * per_page:page * per_page], len(ranked)
+
+    # Returning the IDs of every match, best first
+    def rank(self, term, category=None, difficulty=None):
+        if self.needs_load():
+            self.load()
+
+        prefixes = tokenize(term)
+        if not prefixes:
+            return []
+
+        with self._lock:
+            # Requiring every search word to match, summing their weights
+            scores = self._match_prefix(prefixes[0])
+            for prefix in prefixes[1:]:
+                matches = self._match_prefix(prefix)
+                scores = {question_id: score + matches[question_id]
+                          for question_id, score in scores.items()
+                          if question_id in matches}
+
+            # Applying category / difficulty filters from the index itself
+            if category is not None or difficulty is not None:
+                scores = {
+                    question_id: score
+                    for question_id, score in scores.items()
+                    if (category is None or
+                        self._documents[question_id][0] == int(category)) and
+                    (difficulty is None or
+                     self._documents[question_id][1] == difficulty)}
+
+        # Ranking by score, then by ID for a stable order
+        return sorted(scores, key=lambda question_id: (-scores[question_id],
+                                                       question_id))
+
+    def search(self, term, category=None, difficulty=None, page=1,
+               per_page=10, fields=QUESTION_FIELDS):
+        page_ids, total = self.search_ids(term, category, difficulty, page,
+                                          per_page)
+
+        # Loading only the questions on the requested page
+        rows = {row[0]: row for row in select_questions(fields).filter(
+            Question.id.in_(page_ids))} if page_ids else {}
+
+        return format_rows([rows[question_id] for question_id in page_ids
+                            if question_id in rows], fields), total
+
+    # Ranking every match up front (IDs only), then loading rows one batch
+    # of IDs at a time
+    def iter_search(self, term, category=None, difficulty=None,
+                    fields=QUESTION_FIELDS, batch_size=STREAM_BATCH_SIZE):
+        ranked = self.rank(term, category, difficulty)
+        formatter = row_formatter(fields)
+
+        for start in range(0, len(ranked), batch_size):
+            batch_ids = ranked[start:start + batch_size]
+            rows = {row[0]: row for row in select_questions(fields).filter(
+                Question.id.in_(batch_ids))}
+            for question_id in batch_ids:
+                if question_id in rows:
+                    yield formatter(rows[question_id])
+
+
+search_backends = {
+    PostgresSearchBackend.name: PostgresSearchBackend(),
+    InvertedIndexBackend.name: InvertedIndexBackend(),
+}
+on_question_change(search_backends[InvertedIndexBackend.name].handle_change)
+
+
+# Resolving a backend by name, defaulting to Postgres full text search on
+# Postgres and to the in-memory index everywhere else; the dialect is read
+# from the database URI, so resolving it never creates the engine
+def get_search_backend(name=None):
+    if name is None:
+        dialect = make_url(
+            current_app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        name = PostgresSearchBackend.name \
+            if dialect in ('postgres', 'postgresql') \
+            else InvertedIndexBackend.name
+    return search_backends[name]
@@ -0,0 +1,158 @@
+import json
+
+from flask import Response, stream_with_context
+
+from models import db, Question
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional dependency
+    orjson = None
+
+# Question fields clients may project with ?fields=, in output order
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+# Formats clients may ask large result sets to be streamed in with ?stream=
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson'
+}
+# Rows fetched per round trip from the server side cursor when streaming
+STREAM_BATCH_SIZE = 1000
+# Rows encoded into each chunk sent to the client
+STREAM_CHUNK_ROWS = 100
+
+
+# FIELD PROJECTION
+# -----------------------------------------------------------------------------
+# Reading a comma separated ?fields= value, defaulting to every field
+def parse_fields(value=None):
+    if not value:
+        return QUESTION_FIELDS
+
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested.difference(QUESTION_FIELDS)
+    if unknown or not requested:
+        raise ValueError('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+    return tuple(field for field in QUESTION_FIELDS if field in requested)
+
+
+# Building a column query that returns plain tuples instead of ORM instances
+# (no identity map, no attribute instrumentation); the ID always comes first,
+# since pagination and cursors rely on it
+def select_questions(fields=QUESTION_FIELDS):
+    columns = ('id',) + tuple(field for field in fields if field != 'id')
+    return db.session.query(*[getattr(Question, column)
+                              for column in columns])
+
+
+# Returning a function turning a row of select_questions(fields) into a dict
+# holding only fields
+def row_formatter(fields=QUESTION_FIELDS):
+    columns = ('id',) + tuple(field for field in fields if field != 'id')
+    positions = [(field, columns.index(field)) for field in fields]
+    return lambda row: {field: row[position] for field, position in positions}
+
+
+def format_rows(rows, fields=QUESTION_FIELDS):
+    return list(map(row_formatter(fields), rows))
+
+
+# Reading the ?stream= format, None when the client wants a regular response
+def parse_stream(value=None):
+    if not value:
+        return None
+    if value not in STREAM_FORMATS:
+        raise ValueError('Unknown stream format: {}'.format(value))
+    return value
+
+
+# Iterating over a question column query from a server side cursor, in
+# batches, so only one batch of rows is in memory at a time
+def iter_rows(selection, fields=QUESTION_FIELDS,
+              batch_size=STREAM_BATCH_SIZE):
+    formatter = row_formatter(fields)
+    for row in selection.execution_options(stream_results=True).yield_per(
+            batch_size):
+        yield formatter(row)
+
+
+# JSON ENCODING
+# -----------------------------------------------------------------------------
+# Encoders turn a payload into UTF-8 JSON bytes; orjson is several times
+# faster than the standard library, which remains the fallback
+def orjson_dumps(payload):
+    # Allowing the integer keys of the category map
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+
+def stdlib_dumps(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+json_encoders = {
+    'orjson': orjson_dumps,
+    'json': stdlib_dumps,
+}
+
+
+# Building an encoder from create_app's 'json_encoder' setting: None for
+# orjson when installed (stdlib json otherwise), 'orjson', 'json', or any
+# callable returning bytes
+def make_json_encoder(setting=None):
+    if setting is None:
+        setting = 'orjson' if orjson is not None else 'json'
+    if setting == 'orjson' and orjson is None:
+        raise RuntimeError('The orjson package is required for the orjson '
+                           'encoder')
+    if callable(setting):
+        return setting
+    return json_encoders[setting]
+
+
+class JSONSerializer:
+
+    def __init__(self, dumps=stdlib_dumps):
+        self.dumps = dumps
+
+    def configure(self, dumps):
+        self.dumps = dumps
+
+    # Building a JSON response without going through jsonify
+    def response(self, payload, status=200):
+        return Response(self.dumps(payload), status=status,
+                        mimetype='application/json')
+
+    # Streaming questions as they are read, either as one JSON object whose
+    # 'questions' array is written incrementally (with total_questions at
+    # the end, once known) or as one question per NDJSON line
+    def stream(self, questions, stream_format, payload):
+        def generate():
+            if stream_format == 'json':
+                yield self.dumps(payload)[:-1] + b',"questions":['
+
+            total = 0
+            chunk = []
+            for question in questions:
+                if stream_format == 'json':
+                    chunk.append((b',' if total else b'') +
+                                 self.dumps(question))
+                else:
+                    chunk.append(self.dumps(question) + b'\n')
+                total += 1
+
+                if len(chunk) >= STREAM_CHUNK_ROWS:
+                    yield b''.join(chunk)
+                    chunk = []
+
+            if chunk:
+                yield b''.join(chunk)
+            if stream_format == 'json':
+                yield '],"total_questions":{}}}'.format(total).encode(
+                    'utf-8')
+
+        return Response(stream_with_context(generate()),
+                        mimetype=STREAM_FORMATS[stream_format])
+
+
+# Process wide serializer, configured by create_app()
+serializer = JSONSerializer()
@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from flask import abort, redirect, request
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from models import db, notify_question_change, Answer, Category, Question, \
+    Score
+from .category_cache import category_cache
+from .leaderboard import leaderboards
+
+# Tables copied into a snapshot; answers and scores are kept so the weighted
+# quiz strategy and the leaderboard work on read nodes too
+SNAPSHOT_TABLES = (Category.__table__, Question.__table__, Answer.__table__,
+                   Score.__table__)
+# Rows copied per INSERT while exporting
+EXPORT_BATCH_SIZE = 5000
+# Seconds between checks of the snapshot file for a replacement
+CHECK_INTERVAL = 1
+# Bytes of the snapshot SQLite reads through a memory map
+MMAP_SIZE = 256 * 1024 * 1024
+# Connections kept open to the snapshot per process
+POOL_SIZE = 8
+# Routes still served for POST requests, since they only read (quiz sessions
+# live in their own store); batches are let through since each of their
+# sub-requests goes through this check on its own
+READ_ONLY_ENDPOINTS = ('search_questions', 'play_quiz', 'create_quiz_session',
+                       'batch_requests')
+# Environment variable naming the snapshot to serve, for workers started
+# with create_app() and no settings
+SNAPSHOT_VARIABLE = 'TRIVIA_SNAPSHOT'
+
+
+# EXPORTING
+# -----------------------------------------------------------------------------
+# Copying the snapshot tables (with their indexes) from the app's database
+# into an SQLite file at path, written through a temporary file so a node
+# serving the old snapshot never sees a half written one; returns the number
+# of rows copied per table
+def export_snapshot(path, batch_size=EXPORT_BATCH_SIZE):
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory,
+                                                  suffix='.tmp')
+    os.close(descriptor)
+
+    target = create_engine('sqlite:///' + temporary_path)
+    counts = {}
+    try:
+        db.metadata.create_all(target, tables=SNAPSHOT_TABLES)
+        with target.begin() as connection:
+            for table in SNAPSHOT_TABLES:
+                rows = db.session.execute(table.select().order_by(
+                    *table.primary_key.columns))
+                counts[table.name] = 0
+                while True:
+                    batch = rows.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    connection.execute(table.insert(),
+                                       [dict(row) for row in batch])
+                    counts[table.name] += len(batch)
+
+        # Gathering planner statistics and packing the file tightly, since
+        # it is never written again
+        with target.connect() as connection:
+            connection.execute('ANALYZE')
+            connection.execute('VACUUM')
+        target.dispose()
+        os.replace(temporary_path, path)
+    except BaseException:
+        target.dispose()
+        os.unlink(temporary_path)
+        raise
+    finally:
+        db.session.rollback()
+
+    return counts
+
+
+# SERVING
+# -----------------------------------------------------------------------------
+# Serving read routes from a snapshot file instead of the database: the file
+# is opened read-only and immutable (so SQLite takes no locks) and read
+# through a memory map, write routes get a 405 (or a 307 to the primary when
+# one is given), and a file replaced by a newer export is picked up without
+# a restart
+class Snapshot:
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL,
+                 mmap_size=MMAP_SIZE, pool_size=POOL_SIZE, primary_url=None):
+        self.path = os.path.abspath(path)
+        self.check_interval = check_interval
+        self.mmap_size = mmap_size
+        self.pool_size = pool_size
+        self.primary_url = primary_url.rstrip('/') if primary_url else None
+        self.app = None
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self.swaps = 0
+
+    @property
+    def database_path(self):
+        return 'sqlite:///' + self.path
+
+    def connect(self):
+        connection = sqlite3.connect(
+            'file:{}?mode=ro&immutable=1'.format(self.path), uri=True,
+            check_same_thread=False)
+        connection.execute('PRAGMA mmap_size = {:d}'.format(self.mmap_size))
+        return connection
+
+    # Pointing the app (already set up by setup_db) at the snapshot; must run
+    # before the engine is first used
+    def init_app(self, app):
+        if not os.path.exists(self.path):
+            raise ValueError('Snapshot not found: {}'.format(self.path))
+
+        self.app = app
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'creator': self.connect,
+            'poolclass': QueuePool,
+            'pool_size': self.pool_size
+        }
+        app.config.pop('SQLALCHEMY_BINDS', None)
+        self._version = self.version()
+        app.before_request(self.before_request)
+
+    def version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def before_request(self):
+        self.check()
+
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or \
+                request.endpoint in READ_ONLY_ENDPOINTS or \
+                request.endpoint is None:
+            return
+
+        # Sending writes to the primary, which keeps method and body
+        if self.primary_url is not None:
+            return redirect(self.primary_url + request.full_path.rstrip('?'),
+                            code=307)
+        abort(405)
+
+    # Swapping to a replaced snapshot file, at most once per check interval
+    def check(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        version = self.version()
+        if version is None or version == self._version:
+            return
+
+        with self._lock:
+            if version == self._version:
+                return
+            self._version = version
+            self.swap()
+
+    # Closing pooled connections, so new ones open the new file (requests
+    # under way finish on the old one), then rebuilding every in-memory view
+    # of the questions and the leaderboards
+    def swap(self):
+        db.get_engine(self.app).dispose()
+        category_cache.invalidate()
+        leaderboards.reset()
+        notify_question_change('reload', None)
+        self.swaps += 1
+
+    def status(self):
+        version = self._version
+        return {
+            'path': self.path,
+            'modified': version[1] / 1e9 if version else None,
+            'swaps': self.swaps,
+            'primary_url': self.primary_url
+        }
+
+
+# Building a snapshot from create_app's 'snapshot' setting: None to use the
+# TRIVIA_SNAPSHOT environment variable (if set), a file path, or a dict of
+# Snapshot options (e.g. {'path': 'trivia.snapshot',
+# 'primary_url': 'http://primary:5000'})
+def make_snapshot(setting=None):
+    if setting is None:
+        setting = os.environ.get(SNAPSHOT_VARIABLE) or None
+    if not setting:
+        return None
+    if isinstance(setting, str):
+        return Snapshot(setting)
+    return Snapshot(**setting)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from sqlalchemy import func
+
+from models import db, on_question_change, Question
+
+# Seconds before the aggregate is rebuilt to pick up changes from other
+# processes (local inserts / deletes are applied immediately)
+REFRESH_INTERVAL = 300
+# Key counting questions without a category or difficulty (NULL columns)
+UNSET = 'none'
+
+
+# QUESTION STATS
+# -----------------------------------------------------------------------------
+# Keeping question counts per (category, difficulty) in memory, built with a
+# single GROUP BY query and then adjusted as questions are created or
+# deleted, so stats requests never scan the questions table
+class QuestionStats:
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._counts = None
+        self._loaded_at = 0
+
+    # Dropping the aggregate so it gets rebuilt on next use
+    def reset(self):
+        with self._lock:
+            self._counts = None
+
+    # Counting questions per (category, difficulty), which the
+    # ix_questions_category_difficulty index answers without reading rows
+    def load(self, rows=None):
+        if rows is None:
+            rows = db.session.query(
+                Question.category, Question.difficulty,
+                func.count(Question.id)).group_by(
+                Question.category, Question.difficulty)
+
+        counts = {(category, difficulty): count
+                  for category, difficulty, count in rows}
+
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+
+    def needs_load(self):
+        expired = time.monotonic() - self._loaded_at > self.refresh_interval
+        return self._counts is None or expired
+
+    def _adjust(self, question, delta):
+        with self._lock:
+            if self._counts is None:
+                return
+
+            key = (question['category'], question['difficulty'])
+            count = self._counts.get(key, 0) + delta
+            if count > 0:
+                self._counts[key] = count
+            else:
+                self._counts.pop(key, None)
+
+    # Keeping the counts in sync with questions created or deleted in-process
+    def handle_change(self, action, question):
+        if action == 'insert':
+            self._adjust(question, 1)
+        elif action == 'delete':
+            self._adjust(question, -1)
+        elif action == 'reload':
+            self.reset()
+
+    # Returning the total along with counts per category and per difficulty,
+    # with questions lacking either counted under UNSET
+    def get(self):
+        if self.needs_load():
+            self.load()
+
+        by_category = {}
+        by_difficulty = {}
+        with self._lock:
+            for (category, difficulty), count in self._counts.items():
+                category = UNSET if category is None else category
+                difficulty = UNSET if difficulty is None else difficulty
+                by_category[category] = by_category.get(category, 0) + count
+                by_difficulty[difficulty] = \
+                    by_difficulty.get(difficulty, 0) + count
+
+        return {
+            'total': sum(by_category.values()),
+            'by_category': by_category,
+            'by_difficulty': by_difficulty
+        }
+
+
+# Process wide aggregate, kept up to date by Question.insert() /
+# Question.delete()
+question_stats = QuestionStats()
+on_question_change(question_stats.handle_change)
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import json
+from werkzeug.test import EnvironBuilder
+
+# Most sub-requests accepted in one POST /batch
+MAX_SUBREQUESTS = 20
+# Seconds a batch may take; sub-requests unfinished by then get a 504
+TIME_BUDGET = 5
+# Threads running sub-requests, shared by every batch in the process
+MAX_WORKERS = 8
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Methods whose sub-requests only read, and may run alongside each other
+SAFE_METHODS = ('GET', 'HEAD')
+BATCH_PATH = '/batch'
+
+
+# Checking a list of {'method', 'path', 'body'} sub-requests and returning
+# them as (method, path, body) tuples; raises ValueError for a malformed list
+def parse_subrequests(items, max_subrequests=MAX_SUBREQUESTS):
+    if not isinstance(items, list) or not items or \
+            len(items) > max_subrequests:
+        raise ValueError('Expected 1 to {} requests'.format(max_subrequests))
+
+    subrequests = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Expected a request object')
+
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        body = item.get('body')
+        if method not in METHODS:
+            raise ValueError('Unsupported method: {}'.format(method))
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError('Expected an absolute path')
+        # Batches may not nest, which would let one request fan out without
+        # bound and could exhaust the worker threads
+        if path.split('?', 1)[0].rstrip('/') == BATCH_PATH:
+            raise ValueError('Batches cannot be nested')
+        if body is not None and not isinstance(body, (dict, list)):
+            raise ValueError('Expected a JSON object or array body')
+
+        subrequests.append((method, path, body))
+    return subrequests
+
+
+def error_result(status, message):
+    return {'status': status, 'body': {
+        'success': False,
+        'error': status,
+        'message': message
+    }}
+
+
+# SUB-REQUEST RUNNER
+# -----------------------------------------------------------------------------
+# Running the sub-requests of a batch through the app's full request handling
+# (hooks, admission control and error handlers included), each on a worker
+# thread with its own app context and database session; consecutive reads
+# run in parallel, while writes run one at a time in the order given, so a
+# read listed after a write sees it
+class SubrequestRunner:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.configure()
+
+    def configure(self, max_subrequests=MAX_SUBREQUESTS,
+                  time_budget=TIME_BUDGET, max_workers=MAX_WORKERS):
+        self.max_subrequests = max_subrequests
+        self.time_budget = time_budget
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self.max_workers = max_workers
+
+    # Giving a forked process its own lock and threads
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='batch')
+            return self._executor
+
+    def parse(self, items):
+        return parse_subrequests(items, self.max_subrequests)
+
+    # Returning one {'status', 'body'} result per sub-request, in order
+    def run(self, app, subrequests, environ_base=None):
+        deadline = time.monotonic() + self.time_budget
+        results = [None] * len(subrequests)
+        pool = self._pool()
+
+        start = 0
+        while start < len(subrequests):
+            # Grouping a run of reads, or taking a single write
+            end = start + 1
+            if subrequests[start][0] in SAFE_METHODS:
+                while end < len(subrequests) and \
+                        subrequests[end][0] in SAFE_METHODS:
+                    end += 1
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            futures = {pool.submit(self.dispatch, app, subrequests[index],
+                                   environ_base): index
+                       for index in range(start, end)}
+            done, not_done = wait(futures, timeout=remaining)
+            for future in done:
+                results[futures[future]] = future.result()
+            # Giving up on sub-requests still running (they finish in the
+            # background) and on everything after them
+            if not_done:
+                for future in not_done:
+                    future.cancel()
+                break
+            start = end
+
+        return [result if result is not None else
+                error_result(504, 'Batch time budget exceeded')
+                for result in results]
+
+    # Handling one sub-request as the app would a regular request
+    def dispatch(self, app, subrequest, environ_base=None):
+        method, path, body = subrequest
+        builder = EnvironBuilder(path=path, method=method, json=body,
+                                 environ_base=environ_base)
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+
+        try:
+            with app.app_context(), app.request_context(environ):
+                response = app.full_dispatch_request()
+                data = response.get_data()
+        except Exception:
+            app.logger.exception('Error in batched %s %s', method, path)
+            return error_result(500, 'Internal server error')
+
+        if response.is_json and data:
+            content = json.loads(data)
+        else:
+            content = data.decode('utf-8') if data else None
+        return {'status': response.status_code, 'body': content}
+
+
+# Process wide runner, configured by create_app()
+subrequest_runner = SubrequestRunner()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=subrequest_runner.after_fork)
@@ -0,0 +1,63 @@
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import db  # noqa: E402
+
+# Alembic Config object, giving access to the values within alembic.ini when
+# run from the command line, or built by models.upgrade_db() when run by the
+# app
+config = context.config
+
+# Setting up loggers when an ini file is in use
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Model metadata, used by 'alembic revision --autogenerate'
+target_metadata = db.metadata
+
+
+def run_migrations_offline():
+    # Emitting SQL to the script output instead of running it
+    context.configure(url=config.get_main_option('sqlalchemy.url'),
+                      target_metadata=target_metadata,
+                      literal_binds=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # Reusing the connection handed over by models.upgrade_db() if there is
+    # one, and connecting with the ini file settings otherwise
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        run_migrations(connection)
+        return
+
+    engine = engine_from_config(config.get_section(config.config_ini_section),
+                                prefix='sqlalchemy.',
+                                poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        run_migrations(connection)
+
+
+def run_migrations(connection):
+    # Batch mode lets column changes work on SQLite by rebuilding the table
+    context.configure(connection=connection,
+                      target_metadata=target_metadata,
+                      render_as_batch=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
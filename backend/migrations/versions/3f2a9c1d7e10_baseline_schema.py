@@ -0,0 +1,44 @@
+"""baseline schema
+
+Revision ID: 3f2a9c1d7e10
+Revises:
+Create Date: 2026-10-17 09:12:44.218350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases restored from trivia.psql already have both tables, so only
+    # create the ones that are missing
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'categories' not in existing_tables:
+        op.create_table(
+            'categories',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('type', sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint('id'))
+
+    if 'questions' not in existing_tables:
+        op.create_table(
+            'questions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('question', sa.String(), nullable=True),
+            sa.Column('answer', sa.String(), nullable=True),
+            sa.Column('category', sa.String(), nullable=True),
+            sa.Column('difficulty', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('questions')
+    op.drop_table('categories')
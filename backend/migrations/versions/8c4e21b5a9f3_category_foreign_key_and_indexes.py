@@ -0,0 +1,62 @@
+"""category foreign key and indexes
+
+Revision ID: 8c4e21b5a9f3
+Revises: 3f2a9c1d7e10
+Create Date: 2026-10-17 09:31:02.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e21b5a9f3'
+down_revision = '3f2a9c1d7e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+
+    # Turning questions.category into an integer foreign key to categories,
+    # so category filters compare integers without an implicit cast
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.alter_column(
+            'category', type_=sa.Integer(), existing_type=sa.String(),
+            postgresql_using='category::integer')
+        batch_op.create_foreign_key(
+            'fk_questions_category_categories', 'categories',
+            ['category'], ['id'])
+
+    # Covering category listings / quiz pools and category + difficulty
+    # filters
+    op.create_index('ix_questions_category_id', 'questions',
+                    ['category', 'id'])
+    op.create_index('ix_questions_category_difficulty', 'questions',
+                    ['category', 'difficulty'])
+
+    # Covering the categories listing, which is ordered by type
+    op.create_index('ix_categories_type', 'categories', ['type'])
+
+    # Covering full text search (see flaskr/search.py)
+    if is_postgres:
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_questions_search ON questions "
+            "USING GIN (to_tsvector('simple', "
+            "(coalesce(question, '') || ' ') || coalesce(answer, '')))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_questions_search")
+
+    op.drop_index('ix_categories_type', table_name='categories')
+    op.drop_index('ix_questions_category_difficulty', table_name='questions')
+    op.drop_index('ix_questions_category_id', table_name='questions')
+
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_constraint('fk_questions_category_categories',
+                                 type_='foreignkey')
+        batch_op.alter_column(
+            'category', type_=sa.String(), existing_type=sa.Integer())
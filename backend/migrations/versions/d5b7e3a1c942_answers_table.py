@@ -0,0 +1,41 @@
+"""answers table
+
+Revision ID: d5b7e3a1c942
+Revises: 8c4e21b5a9f3
+Create Date: 2026-10-17 14:12:47.318520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b7e3a1c942'
+down_revision = '8c4e21b5a9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Recording every answer submitted through POST /quiz/answer, which the
+    # weighted quiz strategy aggregates per question
+    op.create_table(
+        'answers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('question_id', sa.Integer(), nullable=False),
+        sa.Column('correct', sa.Boolean(), nullable=False),
+        sa.Column('answered_at', sa.DateTime(), nullable=False,
+                  server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['question_id'], ['questions.id'],
+                                name='fk_answers_question_questions',
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'))
+
+    # Covering the per-question aggregate
+    op.create_index('ix_answers_question_id_correct', 'answers',
+                    ['question_id', 'correct'])
+
+
+def downgrade():
+    op.drop_index('ix_answers_question_id_correct', table_name='answers')
+    op.drop_table('answers')
@@ -0,0 +1,34 @@
+"""scores table
+
+Revision ID: e8f2a6c4b1d3
+Revises: d5b7e3a1c942
+Create Date: 2026-10-17 16:40:09.581274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f2a6c4b1d3'
+down_revision = 'd5b7e3a1c942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keeping each player's best score per category, flushed in batches by
+    # the in-memory leaderboard and read back whole when it is rebuilt
+    op.create_table(
+        'scores',
+        sa.Column('category', sa.Integer(), autoincrement=False,
+                  nullable=False),
+        sa.Column('player', sa.String(length=50), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False,
+                  server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('category', 'player'))
+
+
+def downgrade():
+    op.drop_table('scores')
@@ -1,25 +1,279 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import threading
+import time
+import weakref
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, \
+    ForeignKey, Index, create_engine, func
+from sqlalchemy import orm
+from sqlalchemy.pool import QueuePool
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 
 database_name = "trivia"
-database_path = "postgres://{}/{}".format('localhost:5432', database_name)
+database_path = os.environ.get(
+    'DATABASE_URL',
+    "postgres://{}/{}".format('localhost:5432', database_name))
+migrations_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+'''
+read_flag(value)
+    reads an on / off environment variable
+'''
+
+
+def read_flag(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+'''
+engine_settings
+    engine / pool / startup settings read by setup_db, as (name, environment
+    variable, conversion); values passed to setup_db in config take
+    precedence over the environment
+'''
+engine_settings = [
+    ('pool_size', 'DB_POOL_SIZE', int),
+    ('max_overflow', 'DB_MAX_OVERFLOW', int),
+    ('pool_timeout', 'DB_POOL_TIMEOUT', int),
+    ('pool_recycle', 'DB_POOL_RECYCLE', int),
+    ('pool_pre_ping', 'DB_POOL_PRE_PING', read_flag),
+    ('statement_timeout', 'DB_STATEMENT_TIMEOUT', int),
+    ('replica_path', 'DATABASE_REPLICA_URL', str),
+    ('migrate_on_start', 'DB_MIGRATE_ON_START', read_flag),
+]
+
+replica_bind = 'replica'
+
+'''
+InstrumentedQueuePool
+    QueuePool that also keeps track of how long checkouts wait for a
+    connection and how often they fail (e.g. pool timeouts)
+'''
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        QueuePool.__init__(self, *args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkout_state = threading.local()
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        # QueuePool._do_get() retries by calling itself, so only the
+        # outermost call of a checkout is timed
+        if getattr(self._checkout_state, 'active', False):
+            return QueuePool._do_get(self)
+
+        self._checkout_state.active = True
+        start = time.perf_counter()
+        failed = True
+        try:
+            connection = QueuePool._do_get(self)
+            failed = False
+            return connection
+        finally:
+            self._checkout_state.active = False
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.failed_checkouts += failed
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
 
-db = SQLAlchemy()
 
 '''
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+RoutingSession
+    session that sends reads made while handling GET requests to the read
+    replica, when one is configured
 '''
 
 
-def setup_db(app, database_path=database_path):
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        binds = self.app.config.get('SQLALCHEMY_BINDS') or {}
+        if replica_bind in binds and not self._flushing and \
+                has_request_context() and request.method in ('GET', 'HEAD'):
+            return db.get_engine(self.app, bind=replica_bind)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    # Engines are only created on first use; keeping track of them so a
+    # forked worker can replace their pools
+    def create_engine(self, sa_url, engine_opts):
+        engine = SQLAlchemy.create_engine(self, sa_url, engine_opts)
+        engines.add(engine)
+        return engine
+
+
+db = RoutingSQLAlchemy()
+engines = weakref.WeakSet()
+
+'''
+reset_after_fork()
+    gives a forked process (e.g. a gunicorn worker started with --preload)
+    its own connection pools and session; the parent's connections are left
+    alone rather than closed, since closing them from the child would end
+    them for the parent too
+'''
+
+
+def reset_after_fork():
+    db.session.registry.clear()
+    for engine in list(engines):
+        engine.pool = engine.pool.recreate()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+'''
+question_listeners
+    callables notified with (action, question) after a question is
+    committed ('insert') or deleted ('delete'), where question is the
+    Question.format() dict, or with ('reload', None) after a bulk change
+    that in-memory state should be rebuilt from
+'''
+question_listeners = []
+
+
+def on_question_change(listener):
+    question_listeners.append(listener)
+    return listener
+
+
+def notify_question_change(action, question):
+    for listener in question_listeners:
+        listener(action, question)
+
+'''
+setup_db(app, database_path, config)
+    binds a flask application and a SQLAlchemy service and configures the
+    engine and connection pool from config and the environment; nothing
+    connects until the database is first used, unless migrate_on_start asks
+    for the schema to be brought up to date right away (otherwise run
+    'flask init-db')
+'''
+
+
+def setup_db(app, database_path=database_path, config=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        database_path, config)
+
+    # Routing GET requests to a read replica if one is configured
+    replica_path = read_setting('replica_path', config)
+    if replica_path:
+        app.config["SQLALCHEMY_BINDS"] = {replica_bind: replica_path}
+
     db.app = app
     db.init_app(app)
-    db.create_all()
+    if read_setting('migrate_on_start', config):
+        upgrade_db()
+
+
+'''
+read_setting(name, config)
+    returns an engine setting from config, the environment, or None
+'''
+
+
+def read_setting(name, config=None):
+    for setting, variable, convert in engine_settings:
+        if setting == name:
+            if config and config.get(name) is not None:
+                return config[name]
+            if os.environ.get(variable):
+                return convert(os.environ[variable])
+            return None
+    raise KeyError(name)
+
+
+'''
+engine_options(database_path, config)
+    builds create_engine() options from the pool settings; SQLite keeps its
+    default pool, which takes no sizing options
+'''
+
+
+def engine_options(database_path, config=None):
+    if database_path.startswith('sqlite'):
+        return {}
+
+    options = {'poolclass': InstrumentedQueuePool}
+    for name in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle',
+                 'pool_pre_ping'):
+        value = read_setting(name, config)
+        if value is not None:
+            options[name] = value
+
+    # Cancelling statements running longer than the timeout (milliseconds)
+    statement_timeout = read_setting('statement_timeout', config)
+    if statement_timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(statement_timeout)}
+
+    return options
+
+
+'''
+pool_status(engine)
+    reports connection pool usage and checkout wait statistics
+'''
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow()
+        })
+
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update({
+            'checkouts': pool.checkouts,
+            'failed_checkouts': pool.failed_checkouts,
+            'wait_time': round(pool.wait_time, 6),
+            'max_wait_time': round(pool.max_wait_time, 6)
+        })
+
+    return status
+
+
+'''
+upgrade_db(revision)
+    runs the Alembic migrations in migrations/ up to revision on the
+    database bound by setup_db
+'''
+
+
+def upgrade_db(revision='head'):
+    # Importing Alembic only when migrating, which keeps it out of app startup
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option('script_location', migrations_path)
+    with db.engine.begin() as connection:
+        config.attributes['connection'] = connection
+        command.upgrade(config, revision)
 
 
 '''
@@ -30,11 +284,15 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -46,13 +304,16 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_question_change('insert', self.format())
 
     def update(self):
         db.session.commit()
 
     def delete(self):
+        question = self.format()
         db.session.delete(self)
         db.session.commit()
+        notify_question_change('delete', question)
 
     def format(self):
         return {
@@ -74,7 +335,7 @@ class Category(db.Model):
     __tablename__ = 'categories'
 
     id = Column(Integer, primary_key=True)
-    type = Column(String)
+    type = Column(String, index=True)
 
     def __init__(self, type):
         self.type = type
@@ -84,3 +345,66 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+Answer
+    one answer submitted for a question through POST /quiz/answer
+'''
+
+
+class Answer(db.Model):
+    __tablename__ = 'answers'
+    __table_args__ = (
+        Index('ix_answers_question_id_correct', 'question_id', 'correct'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, ForeignKey(
+        'questions.id', name='fk_answers_question_questions',
+        ondelete='CASCADE'), nullable=False)
+    correct = Column(Boolean, nullable=False)
+    answered_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __init__(self, question_id, correct):
+        self.question_id = question_id
+        self.correct = correct
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'question_id': self.question_id,
+            'correct': self.correct
+        }
+
+
+'''
+Score
+    a player's best score in a category, as kept by the leaderboard; category
+    0 holds quizzes over every category
+'''
+
+
+class Score(db.Model):
+    __tablename__ = 'scores'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    player = Column(String(50), primary_key=True)
+    score = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __init__(self, category, player, score):
+        self.category = category
+        self.player = player
+        self.score = score
+
+    def format(self):
+        return {
+            'category': self.category,
+            'player': self.player,
+            'score': self.score
+        }
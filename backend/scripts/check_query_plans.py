@@ -0,0 +1,143 @@
+'''
+Query plan checker
+
+Calls every route registered in create_app, runs EXPLAIN on each SELECT the
+route issues and reports statements that fall back to a sequential (full
+table) scan. On Postgres, sequential scans are disabled while explaining, so
+any remaining sequential scan means no index can serve the query.
+
+Run from the backend directory against a migrated database:
+    python scripts/check_query_plans.py --database-path postgres://localhost:5432/trivia
+'''
+import argparse
+import os
+import sys
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app  # noqa: E402
+from models import database_path, db  # noqa: E402
+
+# Example request per endpoint, in the order they are run; '{created}' is
+# replaced by the ID of the question added by create_question so the check
+# leaves the database as it found it
+SAMPLE_REQUESTS = [
+    ('get_categories', 'GET', '/categories', None),
+    ('get_categories', 'GET', '/categories?with_counts=1', None),
+    ('get_stats', 'GET', '/stats', None),
+    ('get_questions', 'GET', '/questions?page=2', None),
+    ('get_questions', 'GET', '/questions?limit=10&after_id=10', None),
+    ('get_category_questions', 'GET', '/categories/1/questions', None),
+    ('search_questions', 'POST', '/questions/search',
+     {'searchTerm': 'which', 'category': 3}),
+    ('play_quiz', 'POST', '/quiz',
+     {'previous_questions': [], 'quiz_category': {'type': 'Science',
+                                                  'id': 1}}),
+    ('play_quiz', 'POST', '/quiz',
+     {'previous_questions': [], 'quiz_category': {'type': 'Science',
+                                                  'id': 1},
+      'strategy': 'weighted'}),
+    ('create_question', 'POST', '/questions',
+     {'question': 'Query plan check?', 'answer': 'Yes', 'difficulty': 1,
+      'category': 1}),
+    ('delete_question', 'DELETE', '/questions/{created}', None),
+    ('delete_questions_by_ids', 'DELETE', '/questions?ids=1000000,1000001',
+     None),
+]
+
+
+# Running EXPLAIN for a statement and returning the lines describing full
+# table scans
+def find_sequential_scans(connection, dialect, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        if dialect == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            plan = [row[0] for row in cursor.fetchall()]
+            return [line.strip() for line in plan if 'Seq Scan' in line]
+
+        if dialect == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plan = [row[-1] for row in cursor.fetchall()]
+            return [line for line in plan if line.startswith('SCAN') and
+                    'INDEX' not in line]
+
+        raise ValueError('Unsupported database: {}'.format(dialect))
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--database-path', default=database_path)
+    args = parser.parse_args()
+
+    # Turning the response cache off, so cached routes still run (and get
+    # explained) their queries on every request
+    app = create_app({'database_path': args.database_path,
+                      'migrate_on_start': True, 'response_cache': False})
+    client = app.test_client()
+
+    # Capturing every SELECT issued while a route runs
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect.name
+    event.listen(engine, 'before_cursor_execute', capture)
+
+    # Running every sample twice, explaining only the second pass so one-off
+    # warm ups (quiz pool, in-memory search index) are not reported
+    failures = 0
+    created = None
+    checked = set()
+    for explain in (False, True):
+        for endpoint, method, url, body in SAMPLE_REQUESTS:
+            url = url.format(created=created)
+            del statements[:]
+            res = client.open(url, method=method, json=body)
+            checked.add(endpoint)
+            if endpoint == 'create_question' and res.status_code == 200:
+                created = res.get_json()['created']
+
+            if not explain:
+                continue
+
+            print('{} {} -> {} ({} SELECT statements)'.format(
+                method, url, res.status_code, len(statements)))
+
+            connection = engine.raw_connection()
+            try:
+                for statement, parameters in statements:
+                    scans = find_sequential_scans(connection, dialect,
+                                                  statement, parameters)
+                    for scan in scans:
+                        failures += 1
+                        print('  SEQUENTIAL SCAN: {}'.format(scan))
+                        print('    in: {}'.format(' '.join(statement.split())))
+            finally:
+                connection.close()
+
+    event.remove(engine, 'before_cursor_execute', capture)
+
+    # Listing routes nobody wrote a sample request for yet
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint != 'static' and rule.endpoint not in checked:
+            print('NOT CHECKED: {} {}'.format(
+                ','.join(sorted(rule.methods - {'HEAD', 'OPTIONS'})),
+                rule.rule))
+
+    print('{} sequential scan(s) found'.format(failures))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()